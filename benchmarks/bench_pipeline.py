@@ -0,0 +1,111 @@
+from dataclasses import replace
+
+import pytest
+from conftest import BENCH_SCALE
+
+from src.build import build_dataset
+from src.diversity import DEFAULT_WINDOW
+from src.features import CATEGORICAL_FIELDS, WAVES, FeatureConfig, build_features, featurize
+from src.ingest import ingest
+from src.post import build_prerender, next_prerendered, selection_state, take_prerendered
+from src.prerender import Prerender
+from src.privacy import apply_privacy_filter
+from src.render import render_frame
+from src.state import UsedBitmap
+from src.synthetic import write_synthetic
+from src.templates import clear_sentence_cache, context_from_row, render_profile
+
+RENDER_SAMPLE = 2000
+
+
+def test_ingest(benchmark, synthetic_release, tmp_path):
+    df, _ = benchmark(ingest, synthetic_release[0], tmp_path / "labels.bin")
+    assert len(df)
+
+
+def test_build_features(benchmark, ingested):
+    df, labels = ingested
+    result = benchmark(build_features, df, labels, FeatureConfig(min_cell=10))
+    assert len(result) == len(df)
+
+
+def test_apply_privacy_filter(benchmark, ingested):
+    df, labels = ingested
+    mapped = featurize(df, labels)
+
+    def setup():
+        return (mapped.copy(), CATEGORICAL_FIELDS, 10), {}
+
+    benchmark.pedantic(apply_privacy_filter, setup=setup, rounds=5)
+
+
+@pytest.fixture(scope="module")
+def prerendered(features, tmp_path_factory):
+    path = tmp_path_factory.mktemp("posts") / "nzes.posts"
+    build_prerender(features, path, seed=1337, dataset_sha256="bench")
+    return Prerender(path)
+
+
+def posting_state(prerender, used_fraction):
+    # As after posting that share of the queue in order: the used entries are a
+    # prefix, a few entries skipped for diversity are still open just behind the
+    # cursor, and the recent window blocks the entries right after it.
+    rows, signatures = prerender.scan(0, len(prerender))
+    taken = int(len(rows) * used_fraction)
+    holes = set(range(max(0, taken - 32), taken, 8))
+    used = UsedBitmap()
+    for position in range(taken):
+        if position not in holes:
+            used.add(rows[position])
+    recent = signatures[taken : taken + DEFAULT_WINDOW].tolist()
+    return {"used": used, "cursor": min(holes, default=taken), "recent": recent, "diversity_window": DEFAULT_WINDOW}
+
+
+@pytest.mark.parametrize("used_fraction", [0.0, 0.5, 0.9])
+def test_next_prerendered(benchmark, prerendered, used_fraction):
+    state = posting_state(prerendered, used_fraction)
+
+    def setup():
+        return (prerendered, selection_state(state)), {}
+
+    benchmark.pedantic(next_prerendered, setup=setup, rounds=50)
+
+
+@pytest.mark.parametrize("used_fraction", [0.0, 0.5, 0.9])
+def test_take_prerendered(benchmark, prerendered, used_fraction):
+    state = posting_state(prerendered, used_fraction)
+    assert len(benchmark(take_prerendered, prerendered, state, 20)) == 20
+
+
+def test_render_profile(benchmark, features):
+    rows = features.head(RENDER_SAMPLE).to_dict("records")
+
+    def render_rows():
+        clear_sentence_cache()
+        return [render_profile(context_from_row(row)) for row in rows]
+
+    assert len(benchmark(render_rows)) == len(rows)
+
+
+def test_render_frame(benchmark, features):
+    rendered = benchmark(render_frame, features, 1)
+    assert len(rendered) == len(features)
+
+
+@pytest.fixture(scope="module")
+def wave_releases(tmp_path_factory):
+    return {
+        wave: write_synthetic(tmp_path_factory.mktemp(f"nzes{wave}"), BENCH_SCALE, seed=wave, parquet=False)[0]
+        for wave in (2017, 2020, 2023)
+    }
+
+
+@pytest.mark.parametrize("waves", [1, 3])
+def test_build_waves(benchmark, wave_releases, tmp_path, monkeypatch, waves):
+    # With a core per wave, three waves should take little longer than one.
+    # The synthetic releases all use the 2023 names.
+    for wave in wave_releases:
+        monkeypatch.setitem(WAVES, wave, replace(WAVES[2023], wave=wave))
+    raws = dict(list(wave_releases.items())[-waves:])
+    args = (raws, tmp_path / "nzes.parquet", tmp_path / "labels.bin", FeatureConfig(min_cell=10))
+    benchmark.pedantic(build_dataset, args=args, kwargs={"force": True}, rounds=3)
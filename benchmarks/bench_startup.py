@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+from src.build import build_dataset
+from src.features import FeatureConfig
+
+# Each round starts a fresh interpreter, so these measure import cost as well
+# as the work itself; see tests/test_startup.py for the hard budget.
+
+
+def run_cli(*args):
+    subprocess.run([sys.executable, "-m", "src.cli", *args], cwd=ROOT, check=True, capture_output=True)
+
+
+def test_cli_startup(benchmark):
+    benchmark.pedantic(run_cli, args=("--help",), rounds=10)
+
+
+def test_dry_run_startup(benchmark, synthetic_release, tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    build_dataset(synthetic_release[0], dataset, tmp_path / "labels.bin", FeatureConfig(min_cell=10))
+    args = ("dry-run", "--dataset", str(dataset), "--state", str(tmp_path / "state.json"))
+    benchmark.pedantic(run_cli, args=args, rounds=10)
@@ -0,0 +1,58 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.synthetic import write_synthetic  # noqa: E402
+
+# Multiple of the real sample size; NZES_BENCH_SCALE=100 for a heavier run.
+BENCH_SCALE = float(os.getenv("NZES_BENCH_SCALE", "10"))
+BASELINE_DIR = ROOT / "benchmarks" / "baselines"
+# Committed reference run that a bare --benchmark-compare checks against; local
+# runs saved in BASELINE_DIR are compared by number instead.
+REFERENCE_RUN = ROOT / "benchmarks" / "reference.json"
+# A comparison run fails when a stage's mean gets this much slower than the baseline.
+REGRESSION_THRESHOLD = "mean:25%"
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    option = config.option
+    if not hasattr(option, "benchmark_storage"):
+        return
+    if option.benchmark_storage == "file://./.benchmarks":
+        option.benchmark_storage = f"file://{BASELINE_DIR}"
+    if option.benchmark_compare is True:
+        option.benchmark_compare = str(REFERENCE_RUN)
+    if option.benchmark_compare and not option.benchmark_compare_fail:
+        from pytest_benchmark.utils import parse_compare_fail
+
+        option.benchmark_compare_fail = [parse_compare_fail(REGRESSION_THRESHOLD)]
+
+
+@pytest.fixture(scope="session")
+def synthetic_release(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("synthetic")
+    dta_path, parquet_path = write_synthetic(directory, BENCH_SCALE)
+    return dta_path, parquet_path
+
+
+@pytest.fixture(scope="session")
+def ingested(synthetic_release, tmp_path_factory):
+    from src.ingest import ingest
+
+    labels_path = tmp_path_factory.mktemp("labels") / "labels.bin"
+    return ingest(synthetic_release[0], labels_path)
+
+
+@pytest.fixture(scope="session")
+def features(ingested):
+    from src.features import FeatureConfig, build_features
+
+    df, labels = ingested
+    return build_features(df, labels, FeatureConfig(min_cell=10))
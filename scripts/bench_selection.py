@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from src.diversity import DEFAULT_WINDOW
+from src.features import PROFILE_FIELDS
+from src.post import build_prerender, next_prerendered, selection_state, take_prerendered
+from src.prerender import Prerender
+from src.state import UsedBitmap
+
+
+def make_frame(rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {"respondent_id": [str(i) for i in range(1, rows + 1)]}
+    for field in PROFILE_FIELDS:
+        values = rng.choice(["a", "b", "c"], size=rows).astype(object)
+        values[rng.random(rows) < 0.5] = None
+        data[field] = values
+    return pd.DataFrame(data)
+
+
+def posting_state(prerender: Prerender, used_fraction: float) -> dict:
+    # As after posting that share of the queue in order: the used entries are a
+    # prefix, a few entries skipped for diversity are still open just behind the
+    # cursor, and the recent window blocks the entries right after it.
+    rows, signatures = prerender.scan(0, len(prerender))
+    taken = int(len(rows) * used_fraction)
+    holes = set(range(max(0, taken - 32), taken, 8))
+    used = UsedBitmap()
+    for position in range(taken):
+        if position not in holes:
+            used.add(rows[position])
+    recent = signatures[taken : taken + DEFAULT_WINDOW].tolist()
+    return {"used": used, "cursor": min(holes, default=taken), "recent": recent, "diversity_window": DEFAULT_WINDOW}
+
+
+def time_call(call, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1337)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "nzes.posts"
+        build_prerender(make_frame(args.rows, args.seed), path, args.seed, dataset_sha256="bench")
+        prerender = Prerender(path)
+
+        print(f"used_fraction\tqueue\tnext_ms\ttake_{args.batch}_ms")
+        for fraction in (0.0, 0.25, 0.5, 0.75, 0.9, 0.99):
+            state = posting_state(prerender, fraction)
+            # next_prerendered moves the cursor, so each trial starts from a copy.
+            pick = time_call(lambda: next_prerendered(prerender, selection_state(state)), args.repeats)
+            batch = time_call(lambda: take_prerendered(prerender, state, args.batch), args.repeats)
+            print(f"{fraction:.2f}\t{len(prerender)}\t{pick * 1000:.3f}\t{batch * 1000:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,20 @@ import argparse
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--raw")
+    parser.add_argument("--wave", action="append")
     parser.add_argument("--processed")
     parser.add_argument("--labels")
     parser.add_argument("--min-cell", type=int, default=10)
+    parser.add_argument("--joint-fields")
+    parser.add_argument("--joint-min-cell", type=int)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--wave-processes", type=int)
+    parser.add_argument("--chunk-rows", type=int)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--all-labels", action="store_true")
+    parser.add_argument("--state")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--sampling")
     args = parser.parse_args()
     cmd_build_dataset(args)
 
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from src.synthetic import BASE_ROWS, EXTRA_COLUMNS, write_synthetic
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write NZES-shaped synthetic releases")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1.0], help=f"Multiples of {BASE_ROWS} rows (1 to 1000)")
+    parser.add_argument("--out", default="data/synthetic", help="Output directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extra-columns", type=int, default=EXTRA_COLUMNS, help="Unused filler variables")
+    parser.add_argument("--no-parquet", action="store_true", help="Only write the .dta")
+    args = parser.parse_args()
+
+    for scale in args.scale:
+        dta_path, parquet_path = write_synthetic(
+            Path(args.out), scale, args.seed, args.extra_columns, parquet=not args.no_parquet
+        )
+        print(f"Wrote {dta_path}" + (f" and {parquet_path}" if parquet_path else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,162 @@
 from __future__ import annotations
 
+import os
+import random
 import time
-from typing import Optional
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-from atproto import Client
+from src.metrics import span
+
+if TYPE_CHECKING:
+    from atproto import Client
+    from atproto_client.client.session import Session, SessionEvent
+
+# atproto takes about a second to import, so it is loaded on first use rather
+# than whenever the posting code is imported (a dry run never needs it).
+
+# Treat a stored session as expired this long before its refresh token actually
+# expires, so a run never starts with a token that dies mid-batch.
+SESSION_MARGIN_SECONDS = 15 * 60
+EXPIRED_TOKEN_ERRORS = ("ExpiredToken", "InvalidToken")
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 60.0
+
+
+def is_expired_session(error: Exception) -> bool:
+    from atproto.exceptions import BadRequestError, UnauthorizedError
+
+    if isinstance(error, UnauthorizedError):
+        return True
+    if isinstance(error, BadRequestError) and error.response is not None:
+        return getattr(error.response.content, "error", None) in EXPIRED_TOKEN_ERRORS
+    return False
+
+
+def is_retryable(error: Exception) -> bool:
+    # Transport failures, 429s and server errors are worth another attempt;
+    # anything else (bad request, auth) will fail the same way again.
+    from atproto.exceptions import NetworkError, RateLimitExceededError, RequestException
+
+    if isinstance(error, (NetworkError, RateLimitExceededError)):
+        return True
+    if isinstance(error, RequestException) and error.response is not None:
+        return error.response.status_code >= 500
+    return False
+
+
+def backoff_delay(
+    attempt: int,
+    error: Optional[Exception] = None,
+    base: float = BACKOFF_BASE_SECONDS,
+    cap: float = BACKOFF_CAP_SECONDS,
+    rng: Optional[random.Random] = None,
+) -> float:
+    from atproto.exceptions import RateLimitExceededError
+
+    jitter = (rng or random).uniform
+    if isinstance(error, RateLimitExceededError):
+        if error.retry_after is not None:
+            return error.retry_after + jitter(0, base)
+        if error.reset_at is not None:
+            wait = (error.reset_at - datetime.now(timezone.utc)).total_seconds()
+            return max(wait, 0.0) + jitter(0, base)
+    # Full jitter, so concurrent senders do not retry in lockstep.
+    return jitter(0, min(cap, base * 2 ** attempt))
+
+
+def load_session(path: Path, now: Optional[float] = None) -> Optional[str]:
+    from atproto_client.client.session import Session
+
+    if not path.exists():
+        return None
+    session_string = path.read_text(encoding="utf-8").strip()
+    try:
+        expires_at = Session.decode(session_string).refresh_jwt_payload.exp
+    except Exception:
+        return None
+    if expires_at is None:
+        return None
+    if expires_at - SESSION_MARGIN_SECONDS <= (time.time() if now is None else now):
+        return None
+    return session_string
+
+
+def save_session(path: Path, session_string: str) -> None:
+    # The refresh token is a credential: keep it out of reach of other users.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(session_string)
+    os.replace(tmp_path, path)
 
 
 class BlueskyClient:
-    def __init__(self, handle: str, app_password: str) -> None:
+    def __init__(
+        self,
+        handle: str,
+        app_password: str,
+        session_path: Optional[Path] = None,
+        base_url: Optional[str] = None,
+    ) -> None:
         self.handle = handle
         self.app_password = app_password
+        self.session_path = session_path
+        self.base_url = base_url
         self.client: Optional[Client] = None
+        self.did: Optional[str] = None
+        self.resumed = False
 
-    def login(self) -> None:
-        if self.client is None:
-            self.client = Client()
-        self.client.login(self.handle, self.app_password)
+    def _on_session_change(self, event: SessionEvent, session: Session) -> None:
+        from atproto_client.client.session import SessionEvent
+
+        self.did = session.did
+        if self.session_path is not None and event != SessionEvent.IMPORT:
+            save_session(self.session_path, session.export())
+
+    def _new_client(self) -> Client:
+        from atproto import Client
+
+        client = Client(self.base_url)
+        client.on_session_change(self._on_session_change)
+        return client
+
+    def login(self, fresh: bool = False) -> None:
+        with span("login"):
+            self._login(fresh)
+
+    def _login(self, fresh: bool) -> None:
+        self.client = self._new_client()
+        stored = None if fresh or self.session_path is None else load_session(self.session_path)
+        if stored is not None:
+            # Importing a session is local; the access token is refreshed on the
+            # first request if needed, and that refresh is persisted above.
+            self.client.login(session_string=stored, fetch_bsky_profile=False)
+            self.resumed = True
+            return
+        self.client.login(self.handle, self.app_password, fetch_bsky_profile=False)
+        self.resumed = False
 
     def post(self, text: str, max_retries: int = 3) -> str:
         if self.client is None:
             self.login()
+        with span("post"):
+            return self._post(text, max_retries)
 
+    def _post(self, text: str, max_retries: int) -> str:
         attempt = 0
         while True:
             try:
-                response = self.client.send_post(text)
+                response = self.client.send_post(text, profile_identify=self.did)
                 return response.uri
-            except Exception:  # pragma: no cover - network-dependent
+            except Exception as error:
+                if self.resumed and is_expired_session(error):
+                    # The stored refresh token was revoked or expired server-side.
+                    self.login(fresh=True)
+                    continue
                 attempt += 1
-                if attempt >= max_retries:
+                if attempt >= max_retries or not is_retryable(error):
                     raise
-                sleep_for = 2 ** attempt
-                time.sleep(sleep_for)
+                time.sleep(backoff_delay(attempt, error))
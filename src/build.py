@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from src import dataset, diversity, features, ingest, privacy
+from src import labels as label_store
+from src.cache import combine, file_digest, file_stat, load_manifest, raw_fingerprint, save_manifest, source_digest
+from src.dataset import (
+    DatasetWriter,
+    index_path,
+    iter_dataset,
+    schema_metadata,
+    wave_respondent_id,
+    write_dataset,
+)
+from src.features import (
+    CATEGORICAL_FIELDS,
+    FeatureConfig,
+    WaveSpec,
+    apply_privacy,
+    featurize,
+    joint_min_cell,
+    merge_categories,
+    optional_columns,
+    profile_categories,
+    source_columns,
+    wave_spec,
+    with_categories,
+    with_signature,
+)
+from src.ingest import extract_labels, iter_raw_dta, read_raw_dta, resolve_columns, write_labels
+from src.labels import LabelStore, write_label_store
+from src.metrics import span
+from src.post import build_prerender, prerender_dataset
+from src.prerender import prerender_path, template_fingerprint
+from src.privacy import CellCounts
+from src.state import DEFAULT_STATE
+from src.templates import DEFAULT_WAVE
+
+CACHE_DIR_NAME = ".cache"
+STAGES = ("raw", "mapped", "final", "posts")
+WAVE_STAGES = ("raw", "mapped")
+DEFAULT_CHUNK_ROWS = 50000
+
+RawSources = Union[Path, Mapping[int, Path]]
+
+
+@dataclass
+class WavePlan:
+    spec: WaveSpec
+    raw_path: Path
+    raw_sha256: str
+    cache_dir: Path
+    keys: Dict[str, str]
+    status: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def wave(self) -> int:
+        return self.spec.wave
+
+    def stage_path(self, stage: str, suffix: str = ".parquet") -> Path:
+        return self.cache_dir / f"{stage}-{self.wave}-{self.keys[stage][:16]}{suffix}"
+
+    @property
+    def part_path(self) -> Path:
+        return self.cache_dir / f"part-{self.wave}.parquet"
+
+
+@dataclass
+class BuildPlan:
+    processed_path: Path
+    labels_path: Path
+    config: FeatureConfig
+    waves: Dict[int, WavePlan]
+    keys: Dict[str, str]
+    seed: int
+    sampling: str = DEFAULT_STATE["sampling"]
+    status: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def cache_dir(self) -> Path:
+        return self.processed_path.parent / CACHE_DIR_NAME
+
+    @property
+    def multi_wave(self) -> bool:
+        return len(self.waves) > 1
+
+    def labels_output(self, wave: int) -> Path:
+        if not self.multi_wave:
+            return self.labels_path
+        return self.labels_path.with_name(f"{self.labels_path.stem}.{wave}{self.labels_path.suffix}")
+
+    def summarize(self) -> None:
+        # A stage is only a hit when every wave hit it.
+        for stage in WAVE_STAGES:
+            statuses = {wave.status[stage] for wave in self.waves.values()}
+            self.status[stage] = "built" if "built" in statuses else "miss" if "miss" in statuses else "hit"
+
+
+def raw_sources(raw: RawSources) -> Dict[int, Path]:
+    # A single path is the default (2023) release.
+    if isinstance(raw, Mapping):
+        return {int(wave): Path(path) for wave, path in sorted(raw.items())}
+    return {DEFAULT_WAVE: Path(raw)}
+
+
+def _prune(wave: WavePlan, stage: str) -> None:
+    keep = wave.keys[stage][:16]
+    for path in wave.cache_dir.glob(f"{stage}-{wave.wave}-*"):
+        if keep not in path.name:
+            path.unlink()
+
+
+def plan_wave(spec: WaveSpec, raw_path: Path, cache_dir: Path, previous: Optional[Dict[str, Any]]) -> WavePlan:
+    raw_sha256 = raw_fingerprint(raw_path, previous)
+    raw_key = combine("raw", raw_sha256, source_columns(spec), optional_columns(spec), source_digest([ingest]))
+    mapped_key = combine("mapped", raw_key, spec.wave, source_digest([features]))
+    plan = WavePlan(spec, raw_path, raw_sha256, cache_dir, {"raw": raw_key, "mapped": mapped_key})
+    plan.status["mapped"] = "hit" if plan.stage_path("mapped").exists() else "miss"
+    raw_hit = plan.stage_path("raw").exists() and plan.stage_path("raw", ".labels").exists()
+    plan.status["raw"] = "hit" if raw_hit else "miss"
+    return plan
+
+
+def plan_build(
+    raw: RawSources,
+    processed_path: Path,
+    labels_path: Path,
+    config: FeatureConfig,
+    full_labels: bool = False,
+    seed: int = DEFAULT_STATE["rng_seed"],
+    sampling: str = DEFAULT_STATE["sampling"],
+) -> BuildPlan:
+    manifest = load_manifest(processed_path.parent)
+    cache_dir = processed_path.parent / CACHE_DIR_NAME
+    previous_raws = manifest.get("raw", {})
+    waves = {
+        wave: plan_wave(wave_spec(wave), path, cache_dir, previous_raws.get(str(wave)))
+        for wave, path in raw_sources(raw).items()
+    }
+
+    final_key = combine(
+        "final",
+        {str(wave): plan.keys["mapped"] for wave, plan in waves.items()},
+        asdict(config),
+        full_labels,
+        source_digest([features, privacy, label_store, dataset, diversity]),
+    )
+    posts_key = combine("posts", final_key, seed, sampling, template_fingerprint())
+    plan = BuildPlan(
+        processed_path=processed_path,
+        labels_path=labels_path,
+        config=config,
+        waves=waves,
+        keys={
+            "raw": combine(*(wave.keys["raw"] for wave in waves.values())),
+            "mapped": combine(*(wave.keys["mapped"] for wave in waves.values())),
+            "final": final_key,
+            "posts": posts_key,
+        },
+        seed=seed,
+        sampling=sampling,
+    )
+    plan.summarize()
+
+    outputs = manifest.get("outputs", {})
+    final_hit = (
+        manifest.get("stages", {}).get("final") == final_key
+        and outputs.get("processed") == str(processed_path)
+        and outputs.get("labels") == [str(plan.labels_output(wave)) for wave in waves]
+        and processed_path.exists()
+        and index_path(processed_path).exists()
+        and all(plan.labels_output(wave).exists() for wave in waves)
+    )
+    plan.status["final"] = "hit" if final_hit else "miss"
+    posts_hit = (
+        final_hit
+        and manifest.get("stages", {}).get("posts") == posts_key
+        and prerender_path(processed_path).exists()
+    )
+    plan.status["posts"] = "hit" if posts_hit else "miss"
+    return plan
+
+
+def _load_raw(plan: WavePlan, num_processes: int) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    if plan.status["raw"] == "hit":
+        return pd.read_parquet(plan.stage_path("raw")), LabelStore(plan.stage_path("raw", ".labels")).to_dict()
+
+    df, labels = read_raw_dta(
+        plan.raw_path, source_columns(plan.spec), num_processes=num_processes, optional=optional_columns(plan.spec)
+    )
+    plan.cache_dir.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(plan.stage_path("raw"), index=False)
+    write_label_store(labels, plan.stage_path("raw", ".labels"))
+    _prune(plan, "raw")
+    plan.status["raw"] = "built"
+    return df, labels
+
+
+def _load_mapped(plan: WavePlan, num_processes: int) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    if plan.status["mapped"] == "hit":
+        labels_path = plan.stage_path("raw", ".labels")
+        labels = LabelStore(labels_path).to_dict() if labels_path.exists() else _load_raw(plan, num_processes)[1]
+        return pd.read_parquet(plan.stage_path("mapped")), labels
+
+    df, labels = _load_raw(plan, num_processes)
+    mapped = featurize(df, labels, plan.spec)
+    mapped.to_parquet(plan.stage_path("mapped"), index=False)
+    _prune(plan, "mapped")
+    plan.status["mapped"] = "built"
+    return mapped, labels
+
+
+def mapped_frame(raw_path: Path, processed_path: Path, wave: int = DEFAULT_WAVE) -> pd.DataFrame:
+    # Read-only: reuses a cached mapped stage when one matches the raw file and
+    # otherwise maps the release in memory, writing nothing.
+    manifest = load_manifest(processed_path.parent)
+    previous = manifest.get("raw", {}).get(str(wave))
+    plan = plan_wave(wave_spec(wave), raw_path, processed_path.parent / CACHE_DIR_NAME, previous)
+    if plan.status["mapped"] == "hit":
+        return pd.read_parquet(plan.stage_path("mapped"))
+    if plan.status["raw"] == "hit":
+        df, labels = pd.read_parquet(plan.stage_path("raw")), LabelStore(plan.stage_path("raw", ".labels")).to_dict()
+    else:
+        df, labels = read_raw_dta(raw_path, source_columns(plan.spec), optional=optional_columns(plan.spec))
+    return featurize(df, labels, plan.spec)
+
+
+def build_wave(
+    plan: WavePlan,
+    config: FeatureConfig,
+    num_processes: int = 1,
+    qualify_ids: bool = False,
+) -> Tuple[WavePlan, pd.DataFrame, Dict[str, Any]]:
+    # Cells are suppressed within a wave: each release is its own sample, and
+    # every post names the wave it came from.
+    mapped, labels = _load_mapped(plan, num_processes)
+    out = apply_privacy(mapped, config)
+    if qualify_ids:
+        out["respondent_id"] = wave_respondent_id(plan.wave, out["respondent_id"])
+    # The plan is returned because a worker process updates its own copy.
+    return plan, out, labels
+
+
+def _map_waves(plan: BuildPlan, function: Callable[..., Tuple[Any, ...]], args: Sequence[Tuple[Any, ...]], wave_processes: Optional[int]) -> List[Tuple[Any, ...]]:
+    workers = min(len(args), wave_processes or os.cpu_count() or 1)
+    if workers <= 1:
+        return [function(*arg) for arg in args]
+
+    # Waves are independent until the final write, so the build takes about as
+    # long as the slowest one.
+    with span("waves"), ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(function, *zip(*args)))
+    plan.waves = {result[0].wave: result[0] for result in results}
+    return results
+
+
+def build_waves(
+    plan: BuildPlan,
+    num_processes: int = 1,
+    wave_processes: Optional[int] = None,
+) -> List[Tuple[WavePlan, pd.DataFrame, Dict[str, Any]]]:
+    args = [(wave, plan.config, num_processes, plan.multi_wave) for wave in plan.waves.values()]
+    return _map_waves(plan, build_wave, args, wave_processes)
+
+
+def _raw_labels(plan: WavePlan) -> Dict[str, Any]:
+    labels_path = plan.stage_path("raw", ".labels")
+    if labels_path.exists():
+        return LabelStore(labels_path).to_dict()
+    meta, _ = resolve_columns(plan.raw_path, source_columns(plan.spec))
+    return extract_labels(meta)
+
+
+def _count_mapped(plan: WavePlan, chunk_rows: int, counts: CellCounts) -> Dict[str, Any]:
+    # First pass: featurize chunk by chunk, writing the raw and mapped caches as
+    # it goes and keeping only category counts in memory.
+    if plan.status["mapped"] == "hit":
+        for chunk in iter_dataset(plan.stage_path("mapped"), chunk_rows):
+            counts.add(chunk)
+        return _raw_labels(plan)
+
+    plan.cache_dir.mkdir(parents=True, exist_ok=True)
+    raw_hit = plan.status["raw"] == "hit"
+    if raw_hit:
+        chunks, labels = iter_dataset(plan.stage_path("raw"), chunk_rows), _raw_labels(plan)
+    else:
+        chunks, labels = iter_raw_dta(plan.raw_path, chunk_rows, source_columns(plan.spec), optional_columns(plan.spec))
+
+    raw_writer = nullcontext() if raw_hit else DatasetWriter(plan.stage_path("raw"), index=False)
+    with raw_writer as raw_out, DatasetWriter(plan.stage_path("mapped"), index=False) as mapped_out:
+        for chunk in chunks:
+            if raw_out is not None:
+                raw_out.write(chunk)
+            mapped = featurize(chunk, labels, plan.spec)
+            counts.add(mapped)
+            mapped_out.write(mapped)
+
+    if not raw_hit:
+        write_label_store(labels, plan.stage_path("raw", ".labels"))
+        _prune(plan, "raw")
+        plan.status["raw"] = "built"
+    _prune(plan, "mapped")
+    plan.status["mapped"] = "built"
+    return labels
+
+
+def stream_wave(
+    plan: WavePlan,
+    config: FeatureConfig,
+    output: Path,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    qualify_ids: bool = False,
+    index: bool = True,
+) -> Tuple[WavePlan, Path, Dict[str, Any]]:
+    counts = CellCounts(CATEGORICAL_FIELDS, config.joint_fields)
+    labels = _count_mapped(plan, chunk_rows, counts)
+    categories = profile_categories(labels, plan.spec)
+
+    # Second pass: the counts settle which cells are suppressed, so each chunk
+    # can be filtered and appended to the output on its own.
+    with DatasetWriter(output, index=index, schema=schema_metadata(categories)) as writer:
+        for chunk in iter_dataset(plan.stage_path("mapped"), chunk_rows):
+            with span("privacy"):
+                chunk = counts.apply(chunk, config.min_cell, joint_min_cell(config))
+                chunk = with_signature(with_categories(chunk, categories))
+            if qualify_ids:
+                chunk["respondent_id"] = wave_respondent_id(plan.wave, chunk["respondent_id"])
+            with span("write"):
+                writer.write(chunk)
+    return plan, output, labels
+
+
+def stream_waves(
+    plan: BuildPlan,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    wave_processes: Optional[int] = None,
+) -> Dict[int, Dict[str, Any]]:
+    if not plan.multi_wave:
+        wave = next(iter(plan.waves.values()))
+        _, _, labels = stream_wave(wave, plan.config, plan.processed_path, chunk_rows)
+        return {wave.wave: labels}
+
+    args = [(wave, plan.config, wave.part_path, chunk_rows, True, False) for wave in plan.waves.values()]
+    results = _map_waves(plan, stream_wave, args, wave_processes)
+    categories = merge_categories(profile_categories(labels, wave.spec) for wave, _, labels in results)
+    # Each wave wrote its own part; append them in wave order, one chunk at a time.
+    with span("write"), DatasetWriter(plan.processed_path, schema=schema_metadata(categories)) as writer:
+        for _, part, _ in results:
+            for chunk in iter_dataset(part, chunk_rows):
+                writer.write(with_signature(with_categories(chunk, categories)))
+            part.unlink()
+    return {wave.wave: labels for wave, _, labels in results}
+
+
+def build_dataset(
+    raw: RawSources,
+    processed_path: Path,
+    labels_path: Path,
+    config: Optional[FeatureConfig] = None,
+    num_processes: int = 1,
+    force: bool = False,
+    full_labels: bool = False,
+    seed: int = DEFAULT_STATE["rng_seed"],
+    wave_processes: Optional[int] = None,
+    chunk_rows: Optional[int] = None,
+    sampling: str = DEFAULT_STATE["sampling"],
+) -> BuildPlan:
+    if config is None:
+        config = FeatureConfig()
+
+    plan = plan_build(raw, processed_path, labels_path, config, full_labels, seed, sampling)
+    if force:
+        plan.status = {stage: "miss" for stage in STAGES}
+        for wave in plan.waves.values():
+            wave.status = {stage: "miss" for stage in WAVE_STAGES}
+    if plan.status["posts"] == "hit":
+        return plan
+
+    out: Optional[pd.DataFrame] = None
+    if plan.status["final"] != "hit":
+        if chunk_rows:
+            # Streaming keeps rows in release order; NZES releases are stored
+            # in case order, and the .idx serves lookups either way.
+            labels_by_wave = stream_waves(plan, chunk_rows, wave_processes)
+        else:
+            results = build_waves(plan, num_processes, wave_processes)
+            categories = merge_categories(profile_categories(labels, wave.spec) for wave, _, labels in results)
+            out = pd.concat([with_categories(frame, categories) for _, frame, _ in results], ignore_index=True)
+            out = with_signature(out)
+            write_dataset(out, processed_path, schema=schema_metadata(categories))
+            labels_by_wave = {wave.wave: labels for wave, _, labels in results}
+        for wave, labels in labels_by_wave.items():
+            write_labels(labels, plan.labels_output(wave), full=full_labels, spec=plan.waves[wave].spec)
+        plan.summarize()
+        plan.status["final"] = "built"
+    if out is None:
+        # Streamed builds never hold the dataset; neither does the posts file.
+        prerender_dataset(processed_path, seed, sampling)
+    else:
+        dataset_stat = file_stat(processed_path)
+        build_prerender(out, prerender_path(processed_path), seed, file_digest(processed_path), sampling, dataset_stat)
+    plan.status["posts"] = "built"
+
+    save_manifest(
+        processed_path.parent,
+        {
+            "raw": {
+                str(wave.wave): {
+                    "path": str(wave.raw_path),
+                    "size": wave.raw_path.stat().st_size,
+                    "mtime_ns": wave.raw_path.stat().st_mtime_ns,
+                    "sha256": wave.raw_sha256,
+                }
+                for wave in plan.waves.values()
+            },
+            "config": asdict(config),
+            "seed": seed,
+            "sampling": sampling,
+            "stages": plan.keys,
+            "outputs": {
+                "processed": str(processed_path),
+                "labels": [str(plan.labels_output(wave)) for wave in plan.waves],
+                "posts": str(prerender_path(processed_path)),
+            },
+        },
+    )
+    return plan
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(*paths: Path) -> Tuple[Tuple[int, int, int], ...]:
+    # Cheap enough to check on every use; rewriting a file changes at least one field.
+    stats = [path.stat() for path in paths if path.exists()]
+    return tuple((stat.st_ino, stat.st_size, stat.st_mtime_ns) for stat in stats)
+
+
+def source_digest(modules: Iterable[ModuleType]) -> str:
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()
+
+
+def sequence_digest(values: Iterable[str]) -> str:
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(value.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def combine(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def manifest_path(output_dir: Path) -> Path:
+    return output_dir / MANIFEST_NAME
+
+
+def load_manifest(output_dir: Path) -> Dict[str, Any]:
+    path = manifest_path(output_dir)
+    if not path.exists():
+        return {}
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data
+
+
+def save_manifest(output_dir: Path, manifest: Dict[str, Any]) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest["version"] = MANIFEST_VERSION
+    path = manifest_path(output_dir)
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    tmp_path.replace(path)
+
+
+def file_stat(path: Path) -> Dict[str, int]:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def known_digest(path: Path, recorded: Optional[Dict[str, Any]]) -> str:
+    # Re-hashing a large file is the slowest part of a freshness check, so reuse
+    # the recorded digest while the file's size and mtime are unchanged.
+    if recorded and recorded.get("sha256") and {key: recorded.get(key) for key in ("size", "mtime_ns")} == file_stat(path):
+        return recorded["sha256"]
+    return file_digest(path)
+
+
+def raw_fingerprint(path: Path, previous: Optional[Dict[str, Any]]) -> str:
+    return known_digest(path, previous if previous and previous.get("path") == str(path) else None)
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
 import argparse
+import os
+import sys
 from pathlib import Path
 
-from src.features import FeatureConfig, build_features
-from src.ingest import ingest
-from src.post import post_once
+from typing import TYPE_CHECKING
 
+from src.metrics import Profiler, profiling, span
+from src.schedule import CATCH_UP_POLICIES, DEFAULT_SLOTS, MAX_CATCH_UP
+from src.state import load_state
+
+if TYPE_CHECKING:
+    from src.features import FeatureConfig
+
+# Subcommands import the pipeline lazily: pandas, pyreadstat and atproto each
+# take hundreds of milliseconds to load, and most commands need only one of them.
 
 DEFAULT_RAW = Path("data/raw/2_NZES23Release_100227.dta")
 FALLBACK_RAW = Path("doi-10.26193-hhmeuz/2_NZES23Release_100227.dta")
 DEFAULT_PROCESSED = Path("data/processed/nzes2023.parquet")
-DEFAULT_LABELS = Path("data/processed/labels.json")
+DEFAULT_LABELS = Path("data/processed/labels.bin")
 DEFAULT_STATE = Path("state/state.json")
+DEFAULT_SESSION = Path("state/.bsky_session")
+DEFAULT_METRICS = Path("metrics/profile.jsonl")
 
 
 def resolve_raw_path(path: Path | None) -> Path:
@@ -25,24 +36,141 @@ def resolve_raw_path(path: Path | None) -> Path:
     raise FileNotFoundError("Could not find NZES .dta file. Place it in data/raw.")
 
 
+def parse_waves(values: list[str] | None) -> dict[int, Path]:
+    waves: dict[int, Path] = {}
+    for value in values or []:
+        wave, sep, path = value.partition("=")
+        if not sep or not wave.strip().isdigit() or not path:
+            raise SystemExit(f"--wave expects YEAR=PATH, got {value!r}")
+        waves[int(wave)] = Path(path)
+    return waves
+
+
+def resolve_raw_sources(args: argparse.Namespace) -> Path | dict[int, Path]:
+    waves = parse_waves(getattr(args, "wave", None))
+    if not waves:
+        return resolve_raw_path(Path(args.raw) if args.raw else None)
+    if args.raw:
+        raise SystemExit("Use either --raw or --wave, not both.")
+    missing = [str(path) for path in waves.values() if not path.exists()]
+    if missing:
+        raise FileNotFoundError(f"Could not find NZES release(s): {', '.join(missing)}")
+    return waves
+
+
+def parse_fields(value: str | None) -> tuple[str, ...]:
+    if not value:
+        return ()
+    return tuple(field.strip() for field in value.split(",") if field.strip())
+
+
+def feature_config(args: argparse.Namespace) -> FeatureConfig:
+    from src.features import FeatureConfig
+
+    return FeatureConfig(
+        min_cell=args.min_cell,
+        joint_fields=parse_fields(getattr(args, "joint_fields", None)),
+        joint_min_cell=getattr(args, "joint_min_cell", None),
+    )
+
+
+def resolve_seed(args: argparse.Namespace) -> int:
+    if getattr(args, "seed", None) is not None:
+        return args.seed
+    state_path = Path(args.state) if getattr(args, "state", None) else DEFAULT_STATE
+    return load_state(state_path).get("rng_seed", 1337)
+
+
+def resolve_sampling(args: argparse.Namespace) -> str:
+    from src.sampling import parse_sampling
+
+    if getattr(args, "sampling", None) is not None:
+        return parse_sampling(args.sampling)
+    state_path = Path(args.state) if getattr(args, "state", None) else DEFAULT_STATE
+    return parse_sampling(load_state(state_path)["sampling"])
+
+
 def cmd_build_dataset(args: argparse.Namespace) -> None:
-    raw_path = resolve_raw_path(Path(args.raw) if args.raw else None)
+    from src.build import STAGES, build_dataset
+
+    raw = resolve_raw_sources(args)
     labels_path = Path(args.labels) if args.labels else DEFAULT_LABELS
     processed_path = Path(args.processed) if args.processed else DEFAULT_PROCESSED
 
-    df, labels = ingest(raw_path, labels_path)
-    features = build_features(df, labels, FeatureConfig(min_cell=args.min_cell))
+    plan = build_dataset(
+        raw,
+        processed_path,
+        labels_path,
+        feature_config(args),
+        num_processes=args.processes,
+        force=args.force,
+        full_labels=args.all_labels,
+        seed=resolve_seed(args),
+        sampling=resolve_sampling(args),
+        wave_processes=args.wave_processes,
+        chunk_rows=args.chunk_rows,
+    )
 
-    processed_path.parent.mkdir(parents=True, exist_ok=True)
-    features.to_parquet(processed_path, index=False)
+    print(" ".join(f"{stage}={plan.status[stage]}" for stage in STAGES))
+    if all(status == "hit" for status in plan.status.values()):
+        print(f"Up to date: {processed_path}")
+    else:
+        print(f"Wrote {processed_path}")
 
-    print(f"Wrote {processed_path}")
+
+def cmd_cache_status(args: argparse.Namespace) -> None:
+    from src.build import STAGES, WAVE_STAGES, plan_build
+
+    raw = resolve_raw_sources(args)
+    labels_path = Path(args.labels) if args.labels else DEFAULT_LABELS
+    processed_path = Path(args.processed) if args.processed else DEFAULT_PROCESSED
+
+    plan = plan_build(
+        raw,
+        processed_path,
+        labels_path,
+        feature_config(args),
+        args.all_labels,
+        resolve_seed(args),
+        resolve_sampling(args),
+    )
+    for wave in plan.waves.values():
+        print(f"wave[{wave.wave}]\t{wave.raw_path}\tsha256={wave.raw_sha256}")
+        for stage in WAVE_STAGES:
+            print(f"{stage}[{wave.wave}]\t{wave.status[stage]}\t{wave.keys[stage][:16]}")
+    for stage in STAGES[len(WAVE_STAGES):]:
+        print(f"{stage}\t{plan.status[stage]}\t{plan.keys[stage][:16]}")
+
+
+def cmd_privacy_sweep(args: argparse.Namespace) -> None:
+    from src.build import mapped_frame
+    from src.features import CATEGORICAL_FIELDS
+    from src.privacy import DEFAULT_JOINT_FIELDS, privacy_sweep
+
+    raw_path = resolve_raw_path(Path(args.raw) if args.raw else None)
+    processed_path = Path(args.processed) if args.processed else DEFAULT_PROCESSED
+    thresholds = [int(value) for value in args.thresholds.split(",")]
+
+    features = mapped_frame(raw_path, processed_path)
+    joint_fields = parse_fields(args.joint_fields) if args.joint_fields is not None else DEFAULT_JOINT_FIELDS
+    sweep = privacy_sweep(features, CATEGORICAL_FIELDS, thresholds, joint_fields)
+
+    columns = list(next(iter(sweep.values())).keys())
+    print("min_cell\t" + "\t".join(columns))
+    for threshold, counts in sweep.items():
+        print(f"{threshold}\t" + "\t".join(str(counts[column]) for column in columns))
 
 
 def cmd_post_once(args: argparse.Namespace) -> None:
+    from src.post import post_once, render_respondent
+
     dataset_path = Path(args.dataset) if args.dataset else DEFAULT_PROCESSED
     state_path = Path(args.state) if args.state else DEFAULT_STATE
 
+    if getattr(args, "respondent_id", None):
+        print(render_respondent(dataset_path, args.respondent_id))
+        return
+
     handle = args.handle
     app_password = args.app_password
 
@@ -52,37 +180,259 @@ def cmd_post_once(args: argparse.Namespace) -> None:
         handle=handle,
         app_password=app_password,
         dry_run=args.dry_run,
+        session_path=Path(args.session) if getattr(args, "session", None) else None,
+    )
+
+
+def cmd_post_batch(args: argparse.Namespace) -> None:
+    from src.post import post_batch
+
+    dataset_path = Path(args.dataset) if args.dataset else DEFAULT_PROCESSED
+    state_path = Path(args.state) if args.state else DEFAULT_STATE
+    session_path = Path(args.session) if args.session else DEFAULT_SESSION
+
+    uris = post_batch(
+        dataset_path=dataset_path,
+        state_path=state_path,
+        count=args.count,
+        interval=args.interval,
+        handle=args.handle,
+        app_password=args.app_password,
+        session_path=session_path,
+        dry_run=args.dry_run,
+    )
+    if not args.dry_run:
+        for uri in uris:
+            print(uri)
+
+
+def cmd_publish(args: argparse.Namespace) -> None:
+    from src.publisher import run_publish
+
+    if not args.handle or not args.app_password:
+        raise SystemExit("Missing Bluesky credentials.")
+
+    summary = run_publish(
+        Path(args.dataset) if args.dataset else DEFAULT_PROCESSED,
+        Path(args.state) if args.state else DEFAULT_STATE,
+        count=args.count,
+        handle=args.handle,
+        app_password=args.app_password,
+        session_path=Path(args.session) if args.session else DEFAULT_SESSION,
+        base_url=args.service,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        burst=args.burst,
+    )
+    for error in summary.errors:
+        print(f"error: {error}")
+    print(summary.format())
+    if summary.failed or summary.errors:
+        raise SystemExit(1)
+
+
+def cmd_serve(args: argparse.Namespace) -> None:
+    from src.bsky_client import BlueskyClient
+    from src.schedule import Schedule, parse_slots
+    from src.serve import Daemon, serve
+
+    if not args.handle or not args.app_password:
+        raise SystemExit("Missing Bluesky credentials.")
+    try:
+        schedule = Schedule(parse_slots(args.slots), jitter=args.jitter, catch_up=args.catch_up)
+    except ValueError as error:
+        raise SystemExit(str(error))
+
+    session_path = Path(args.session) if args.session else DEFAULT_SESSION
+    client = BlueskyClient(args.handle, args.app_password, session_path=session_path, base_url=args.service)
+    serve(
+        Daemon(
+            Path(args.dataset) if args.dataset else DEFAULT_PROCESSED,
+            Path(args.state) if args.state else DEFAULT_STATE,
+            schedule,
+            client,
+        )
+    )
+
+
+def cmd_preview(args: argparse.Namespace) -> None:
+    import asyncio
+
+    from src.preview import PreviewIndex, serve_preview
+
+    index = PreviewIndex(
+        Path(args.dataset) if args.dataset else DEFAULT_PROCESSED,
+        Path(args.state) if args.state else DEFAULT_STATE,
+        cache_size=args.cache_size,
+    )
+    try:
+        asyncio.run(serve_preview(index, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def cmd_render_all(args: argparse.Namespace) -> None:
+    from src.render import audit, render_all, rendered_path
+
+    dataset_path = Path(args.dataset) if args.dataset else DEFAULT_PROCESSED
+    output_path = Path(args.output) if args.output else rendered_path(dataset_path)
+
+    report = audit(render_all(dataset_path, output_path, args.processes))
+    print(
+        f"rows={report['rows']} max_length={report['max_length']} over_limit={report['over_limit']} "
+        f"truncated_rows={report['truncated_rows']} bare={report['bare']}"
+    )
+    for field, count in report["dropped"].items():
+        print(f"dropped\t{field}\t{count}")
+    print(f"Wrote {output_path}")
+
+
+def add_build_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--raw", help="Path to .dta file")
+    parser.add_argument(
+        "--wave",
+        action="append",
+        metavar="YEAR=PATH",
+        help="Release for one NZES wave (repeat for a multi-wave build, e.g. --wave 2020=data/raw/nzes2020.dta)",
+    )
+    parser.add_argument("--processed", help="Output parquet path")
+    parser.add_argument("--labels", help="Output label store path")
+    parser.add_argument("--all-labels", action="store_true", help="Export labels for every variable in the release")
+    parser.add_argument("--min-cell", type=int, default=10, help="Minimum cell size")
+    parser.add_argument(
+        "--joint-fields",
+        help="Comma-separated quasi-identifiers for joint cell suppression (e.g. age_bucket,gender,ethnicity,urban_rural)",
+    )
+    parser.add_argument("--joint-min-cell", type=int, help="Minimum joint cell size (defaults to --min-cell)")
+    parser.add_argument("--state", help="State JSON path (source of the queue seed)")
+    parser.add_argument("--seed", type=int, help="Queue seed for the pre-rendered posts (defaults to the state's rng_seed)")
+    parser.add_argument(
+        "--sampling",
+        help="Queue order: uniform, weight (survey weight) or strata:<field> (defaults to the state's sampling)",
     )
 
 
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="NZES Bluesky voter bot")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=str(DEFAULT_METRICS),
+        metavar="PATH",
+        help=f"Append per-stage timings to a JSON lines file (default {DEFAULT_METRICS})",
+    )
+    parser.add_argument("--profile-memory", action="store_true", help="Also trace peak Python memory per stage (slower)")
+    parser.add_argument("--profile-stage", metavar="NAME", help="Write a cProfile dump for this stage (e.g. mapping)")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     build_parser = subparsers.add_parser("build-dataset", help="Build processed dataset")
-    build_parser.add_argument("--raw", help="Path to .dta file")
-    build_parser.add_argument("--processed", help="Output parquet path")
-    build_parser.add_argument("--labels", help="Output labels JSON path")
-    build_parser.add_argument("--min-cell", type=int, default=10, help="Minimum cell size")
+    add_build_arguments(build_parser)
+    build_parser.add_argument("--processes", type=int, default=1, help="Worker processes for reading the .dta")
+    build_parser.add_argument(
+        "--wave-processes", type=int, help="Waves built at once (defaults to one process per wave, up to the CPU count)"
+    )
+    build_parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        metavar="N",
+        help="Stream the .dta N rows at a time, keeping memory bounded by the chunk size",
+    )
+    build_parser.add_argument("--force", action="store_true", help="Rebuild every stage, ignoring the cache")
     build_parser.set_defaults(func=cmd_build_dataset)
 
+    status_parser = subparsers.add_parser("cache-status", help="Show which build stages are cached")
+    add_build_arguments(status_parser)
+    status_parser.set_defaults(func=cmd_cache_status)
+
+    sweep_parser = subparsers.add_parser("privacy-sweep", help="Report suppression counts for several min-cell values")
+    sweep_parser.add_argument("--raw", help="Path to .dta file")
+    sweep_parser.add_argument(
+        "--processed", help="Processed parquet path; its build cache is reused when it matches the raw file"
+    )
+    sweep_parser.add_argument("--thresholds", default="3,5,10,20,50", help="Comma-separated min-cell values")
+    sweep_parser.add_argument(
+        "--joint-fields",
+        help="Comma-separated quasi-identifiers for the joint cell report (default age_bucket,gender,ethnicity,urban_rural)",
+    )
+    sweep_parser.set_defaults(func=cmd_privacy_sweep)
+
     post_parser = subparsers.add_parser("post-once", help="Post one profile to Bluesky")
     post_parser.add_argument("--dataset", help="Processed parquet path")
     post_parser.add_argument("--state", help="State JSON path")
     post_parser.add_argument("--handle", help="Bluesky handle")
     post_parser.add_argument("--app-password", help="Bluesky app password")
+    post_parser.add_argument("--session", help="File to persist the Bluesky session in")
     post_parser.add_argument("--dry-run", action="store_true", help="Print without posting")
     post_parser.set_defaults(func=cmd_post_once)
 
+    batch_parser = subparsers.add_parser("post-batch", help="Post several profiles over one Bluesky session")
+    batch_parser.add_argument("--dataset", help="Processed parquet path")
+    batch_parser.add_argument("--state", help="State JSON path")
+    batch_parser.add_argument("--handle", default=os.getenv("BSKY_HANDLE"), help="Bluesky handle")
+    batch_parser.add_argument("--app-password", default=os.getenv("BSKY_APP_PASSWORD"), help="Bluesky app password")
+    batch_parser.add_argument("--session", help=f"File to persist the Bluesky session in (default {DEFAULT_SESSION})")
+    batch_parser.add_argument("--count", type=int, default=1, help="Number of profiles to post")
+    batch_parser.add_argument("--interval", type=float, default=0.0, help="Seconds to wait between posts")
+    batch_parser.add_argument("--dry-run", action="store_true", help="Print without posting")
+    batch_parser.set_defaults(func=cmd_post_batch)
+
+    publish_parser = subparsers.add_parser("publish", help="Post several profiles concurrently within the rate limit")
+    publish_parser.add_argument("--dataset", help="Processed parquet path")
+    publish_parser.add_argument("--state", help="State JSON path")
+    publish_parser.add_argument("--handle", default=os.getenv("BSKY_HANDLE"), help="Bluesky handle")
+    publish_parser.add_argument("--app-password", default=os.getenv("BSKY_APP_PASSWORD"), help="Bluesky app password")
+    publish_parser.add_argument("--session", help=f"File to persist the Bluesky session in (default {DEFAULT_SESSION})")
+    publish_parser.add_argument("--service", help="PDS base URL (defaults to bsky.social)")
+    publish_parser.add_argument("--count", type=int, default=1, help="Number of profiles to post")
+    publish_parser.add_argument("--concurrency", type=int, default=2, help="Posts in flight at once")
+    publish_parser.add_argument("--rate", type=float, default=1.0, help="Posts per second once the burst is spent")
+    publish_parser.add_argument("--burst", type=int, default=3, help="Posts allowed back to back")
+    publish_parser.set_defaults(func=cmd_publish)
+
+    serve_parser = subparsers.add_parser("serve", help="Stay running and post on a daily schedule")
+    serve_parser.add_argument("--dataset", help="Processed parquet path")
+    serve_parser.add_argument("--state", help="State JSON path")
+    serve_parser.add_argument("--handle", default=os.getenv("BSKY_HANDLE"), help="Bluesky handle")
+    serve_parser.add_argument("--app-password", default=os.getenv("BSKY_APP_PASSWORD"), help="Bluesky app password")
+    serve_parser.add_argument("--session", help=f"File to persist the Bluesky session in (default {DEFAULT_SESSION})")
+    serve_parser.add_argument("--service", help="PDS base URL (defaults to bsky.social)")
+    serve_parser.add_argument(
+        "--slots", default=DEFAULT_SLOTS, help=f"Comma-separated UTC posting times (default {DEFAULT_SLOTS})"
+    )
+    serve_parser.add_argument("--jitter", type=float, default=0.0, help="Delay each post by up to this many seconds")
+    serve_parser.add_argument(
+        "--catch-up",
+        choices=CATCH_UP_POLICIES,
+        default="latest",
+        help=f"Slots missed while down: skip them, post once, or post once per slot (up to {MAX_CATCH_UP})",
+    )
+    serve_parser.set_defaults(func=cmd_serve)
+
+    preview_parser = subparsers.add_parser("preview", help="Serve read-only post previews over local HTTP")
+    preview_parser.add_argument("--dataset", help="Processed parquet path")
+    preview_parser.add_argument("--state", help="State JSON path")
+    preview_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default 127.0.0.1)")
+    preview_parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default 8765)")
+    preview_parser.add_argument("--cache-size", type=int, default=4096, help="Rendered profiles kept in memory")
+    preview_parser.set_defaults(func=cmd_preview)
+
+    render_parser = subparsers.add_parser("render-all", help="Render every respondent and audit post lengths")
+    render_parser.add_argument("--dataset", help="Processed parquet path")
+    render_parser.add_argument("--output", help="Rendered parquet path (default <dataset>.rendered.parquet)")
+    render_parser.add_argument("--processes", type=int, help="Worker processes (defaults to the CPU count)")
+    render_parser.set_defaults(func=cmd_render_all)
+
     dry_parser = subparsers.add_parser("dry-run", help="Generate a post without posting")
     dry_parser.add_argument("--dataset", help="Processed parquet path")
     dry_parser.add_argument("--state", help="State JSON path")
+    dry_parser.add_argument("--respondent-id", help="Render this respondent instead of the next in the queue")
     dry_parser.set_defaults(func=lambda args: cmd_post_once(argparse.Namespace(**{
         "dataset": args.dataset,
         "state": args.state,
         "handle": None,
         "app_password": None,
         "dry_run": True,
+        "respondent_id": args.respondent_id,
     })))
 
     return parser
@@ -91,7 +441,20 @@ def build_parser() -> argparse.ArgumentParser:
 def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
-    args.func(args)
+    if not args.profile:
+        args.func(args)
+        return
+
+    profiler = Profiler(memory=args.profile_memory, cprofile_stage=args.profile_stage)
+    status = "ok"
+    try:
+        with profiling(profiler), span(args.command):
+            args.func(args)
+    except BaseException as error:
+        status = type(error).__name__
+        raise
+    finally:
+        profiler.write(Path(args.profile), command=args.command, argv=sys.argv[1:], status=status)
 
 
 if __name__ == "__main__":
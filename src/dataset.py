@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import bisect
+import json
+import struct
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.metrics import span
+
+ROW_GROUP_SIZE = 2048
+INDEX_MAGIC = b"NZIX"
+INDEX_VERSION = 1
+# magic, format version, row group size, entry count
+INDEX_PREAMBLE = struct.Struct("<4sBIQ")
+# Multi-wave datasets qualify ids as "<wave>-<case>"; the index packs them into
+# one integer so rows stay ordered by wave, then case.
+WAVE_KEY_SHIFT = 32
+# Version 2 stores respondent ids as integer keys and profile fields as
+# dictionary columns whose category order is kept in the schema metadata.
+SCHEMA_VERSION = 2
+SCHEMA_KEY = b"nzes.schema"
+
+
+def index_path(dataset_path: Path) -> Path:
+    return dataset_path.with_suffix(".idx")
+
+
+def wave_respondent_id(wave: int, case_id: Any) -> Any:
+    # Works on a single case number or a whole integer column.
+    return wave << WAVE_KEY_SHIFT | case_id
+
+
+def respondent_label(key: int) -> str:
+    wave, case = divmod(key, 1 << WAVE_KEY_SHIFT)
+    return f"{wave}-{case}" if wave else str(case)
+
+
+def respondent_labels(ids: Any) -> List[str]:
+    # Ids are shown, posted and recorded in state as strings.
+    values = ids.tolist()
+    if not all(isinstance(value, int) for value in values):
+        return [str(value) for value in values]
+    return [respondent_label(value) for value in values]
+
+
+def legacy_respondent_labels(ids: Any) -> Optional[List[str]]:
+    # Version 1 datasets kept the float-formatted case numbers ("12.0").
+    values = ids.tolist()
+    if not all(isinstance(value, int) for value in values):
+        return None
+    labels = []
+    for value in values:
+        wave, case = divmod(value, 1 << WAVE_KEY_SHIFT)
+        labels.append(f"{wave}-{float(case)}" if wave else str(float(case)))
+    return labels
+
+
+def respondent_key(value: Any) -> Optional[int]:
+    if isinstance(value, str) and value.find("-") > 0:
+        wave, _, case = value.partition("-")
+        case_key = respondent_key(case)
+        if not wave.isdigit() or case_key is None or not 0 <= case_key < 1 << WAVE_KEY_SHIFT:
+            return None
+        return int(wave) << WAVE_KEY_SHIFT | case_key
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number != number or not number.is_integer():
+        return None
+    return int(number)
+
+
+def dataset_columns(path: Path) -> List[str]:
+    return pq.read_schema(path).names
+
+
+def schema_metadata(categories: Dict[str, List[str]]) -> Dict[str, Any]:
+    return {"version": SCHEMA_VERSION, "categories": categories}
+
+
+def dataset_schema(path: Path) -> Dict[str, Any]:
+    raw = (pq.read_schema(path).metadata or {}).get(SCHEMA_KEY)
+    if raw is None:
+        return {"version": 1, "categories": {}}
+    return json.loads(raw)
+
+
+def _with_schema(schema: pa.Schema, metadata: Optional[Dict[str, Any]]) -> pa.Schema:
+    if metadata is None:
+        return schema
+    return schema.with_metadata({**(schema.metadata or {}), SCHEMA_KEY: json.dumps(metadata).encode("utf-8")})
+
+
+def read_dataset(path: Path, columns: Optional[List[str]] = None) -> Any:
+    import pandas as pd
+
+    # ParquetFile reads the small row groups without the dataset layer's
+    # per-fragment setup, which costs more than decoding them here.
+    df = pq.ParquetFile(path).read(columns=columns).to_pandas()
+    # Row groups may each carry their own dictionary; impose the recorded order.
+    for name, categories in dataset_schema(path)["categories"].items():
+        if name in df.columns:
+            df[name] = pd.Categorical(df[name], categories=categories)
+    return df
+
+
+def write_dataset(
+    df: Any,
+    path: Path,
+    row_group_size: int = ROW_GROUP_SIZE,
+    schema: Optional[Dict[str, Any]] = None,
+) -> None:
+    # Only the build needs pandas; the lookup side of this module is pyarrow-only.
+    import pandas as pd
+
+    with span("write"):
+        keys = pd.to_numeric(df["respondent_id"], errors="coerce")
+        if keys.isna().any():
+            keys = pd.to_numeric(df["respondent_id"].map(respondent_key), errors="coerce")
+        ordered = df.iloc[keys.argsort(kind="stable").to_numpy()].reset_index(drop=True)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.Table.from_pandas(ordered, preserve_index=False)
+        table = table.replace_schema_metadata(_with_schema(table.schema, schema).metadata)
+        pq.write_table(table, path, row_group_size=row_group_size, write_statistics=True)
+        write_index(ordered["respondent_id"].tolist(), index_path(path), row_group_size)
+
+
+def write_index(ids: Sequence[Any], path: Path, row_group_size: int) -> None:
+    write_index_entries(((respondent_key(value), row) for row, value in enumerate(ids)), path, row_group_size)
+
+
+def write_index_entries(pairs: Iterable[Tuple[Optional[int], int]], path: Path, row_group_size: int) -> None:
+    entries = sorted((key, row) for key, row in pairs if key is not None)
+    keys = array("q", (key for key, _ in entries))
+    rows = array("q", (row for _, row in entries))
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(INDEX_PREAMBLE.pack(INDEX_MAGIC, INDEX_VERSION, row_group_size, len(keys)))
+        keys.tofile(f)
+        rows.tofile(f)
+    tmp_path.replace(path)
+
+
+def _plain_schema(schema: pa.Schema) -> pa.Schema:
+    # pandas infers null for a column that is all missing in one chunk; store
+    # it as a string column so later chunks can fill it.
+    fields = []
+    for field in schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+class DatasetWriter:
+    # Appends frames to one parquet file in fixed-size row groups, so the .idx
+    # arithmetic (row // row_group_size) holds for a file written chunk by chunk.
+    def __init__(
+        self,
+        path: Path,
+        row_group_size: int = ROW_GROUP_SIZE,
+        index: bool = True,
+        schema: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.path = path
+        self.row_group_size = row_group_size
+        self.index = index
+        self.metadata = schema
+        self.rows = 0
+        self.keys = array("q")
+        self.key_rows = array("q")
+        self._tmp_path = path.with_suffix(path.suffix + ".tmp")
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._schema: Optional[pa.Schema] = None
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+
+    def write(self, frame: Any) -> None:
+        table = frame if isinstance(frame, pa.Table) else pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._schema = _plain_schema(table.schema.remove_metadata())
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pq.ParquetWriter(
+                self._tmp_path, _with_schema(self._schema, self.metadata), write_statistics=True
+            )
+        table = table.select(self._schema.names).cast(self._schema)
+
+        if self.index:
+            for row, value in enumerate(table.column("respondent_id").to_pylist(), start=self.rows):
+                key = respondent_key(value)
+                if key is not None:
+                    self.keys.append(key)
+                    self.key_rows.append(row)
+        self.rows += table.num_rows
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows >= self.row_group_size:
+            self._flush(final=False)
+
+    def _flush(self, final: bool) -> None:
+        table = pa.concat_tables(self._pending)
+        ready = table.num_rows if final else table.num_rows - table.num_rows % self.row_group_size
+        if ready:
+            self._writer.write_table(table.slice(0, ready), row_group_size=self.row_group_size)
+        rest = table.slice(ready)
+        self._pending = [rest] if rest.num_rows else []
+        self._pending_rows = rest.num_rows
+
+    def close(self) -> None:
+        if self._writer is None:
+            raise ValueError(f"Nothing was written to {self.path}.")
+        if self._pending:
+            self._flush(final=True)
+        self._writer.close()
+        self._tmp_path.replace(self.path)
+        if self.index:
+            write_index_entries(zip(self.keys, self.key_rows), index_path(self.path), self.row_group_size)
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, *_: Any) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._writer is not None:
+            self._writer.close()
+            self._tmp_path.unlink(missing_ok=True)
+
+
+def iter_dataset(path: Path, batch_rows: int, columns: Optional[List[str]] = None) -> Iterator[Any]:
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+class DatasetIndex:
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            magic, version, row_group_size, count = INDEX_PREAMBLE.unpack(f.read(INDEX_PREAMBLE.size))
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                raise ValueError(f"{path} is not a dataset index (version {INDEX_VERSION}).")
+            self.keys = array("q")
+            self.keys.fromfile(f, count)
+            self.rows = array("q")
+            self.rows.fromfile(f, count)
+        self.row_group_size = row_group_size
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def row_of(self, respondent_id: Any) -> Optional[int]:
+        key = respondent_key(respondent_id)
+        if key is None:
+            return None
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.rows[position]
+        return None
+
+
+def open_index(dataset_path: Path) -> Optional[DatasetIndex]:
+    path = index_path(dataset_path)
+    if not path.exists():
+        return None
+    try:
+        return DatasetIndex(path)
+    except (ValueError, EOFError, struct.error):
+        return None
+
+
+def lookup_respondents(
+    dataset_path: Path,
+    respondent_ids: Iterable[Any],
+    columns: Optional[List[str]] = None,
+    index: Optional[DatasetIndex] = None,
+) -> List[Dict[str, Any]]:
+    ids = list(respondent_ids)
+    index = index or open_index(dataset_path)
+    if index is None:
+        # No sidecar: let row-group statistics prune what they can.
+        id_field = pq.read_schema(dataset_path).field("respondent_id")
+        as_key = respondent_key if pa.types.is_integer(id_field.type) else str
+        wanted = {value: as_key(value) for value in ids}
+        table = pq.read_table(
+            dataset_path,
+            columns=columns,
+            filters=[("respondent_id", "in", [key for key in wanted.values() if key is not None])],
+        )
+        found = {as_key(row["respondent_id"]): row for row in table.to_pylist()} if "respondent_id" in table.column_names else {}
+        return [found[wanted[value]] for value in ids if wanted[value] in found]
+
+    parquet = pq.ParquetFile(dataset_path)
+    rows_by_group: Dict[int, List[int]] = {}
+    for value in ids:
+        row = index.row_of(value)
+        if row is not None:
+            rows_by_group.setdefault(row // index.row_group_size, []).append(row)
+
+    results: Dict[int, Dict[str, Any]] = {}
+    for group, rows in rows_by_group.items():
+        table = parquet.read_row_group(group, columns=columns)
+        start = group * index.row_group_size
+        taken = table.take(pa.array([row - start for row in rows])).to_pylist()
+        results.update(zip(rows, taken))
+
+    ordered = [index.row_of(value) for value in ids]
+    return [results[row] for row in ordered if row is not None]
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Set
+
+# A signature packs a respondent's profile into one integer: each field gets an
+# 8-bit lane, in PROFILE_FIELDS order, holding its category code plus one, so
+# 0 means missing. Comparing profiles is then a mask and an equality test.
+SIGNATURE_FIELDS = (
+    "age_bucket",
+    "gender",
+    "ethnicity",
+    "education",
+    "housing",
+    "urban_rural",
+    "party_vote",
+    "ideology",
+)
+LANE_BITS = 8
+LANE_MAX = (1 << LANE_BITS) - 1
+
+# A candidate is too similar to a recent post when all of these fields match.
+DIVERSITY_FIELDS = ("age_bucket", "gender", "ethnicity", "party_vote")
+DEFAULT_WINDOW = 8
+
+
+def lane_mask(fields: Iterable[str] = DIVERSITY_FIELDS) -> int:
+    mask = 0
+    for name in fields:
+        mask |= LANE_MAX << (LANE_BITS * SIGNATURE_FIELDS.index(name))
+    return mask
+
+
+def recent_signatures(state: Dict[str, Any]) -> List[int]:
+    window = state.get("diversity_window", DEFAULT_WINDOW)
+    return state.get("recent", [])[-window:] if window > 0 else []
+
+
+def blocked_keys(state: Dict[str, Any], mask: int) -> Set[int]:
+    return {signature & mask for signature in recent_signatures(state)}
+
+
+def remember(state: Dict[str, Any], signature: int) -> None:
+    window = state.get("diversity_window", DEFAULT_WINDOW)
+    if window > 0:
+        state["recent"] = [*state.get("recent", []), signature][-window:]
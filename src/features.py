@@ -1,17 +1,46 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, Iterable, List, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
+from src.diversity import LANE_BITS, LANE_MAX, SIGNATURE_FIELDS
+from src.metrics import span
+from src.privacy import OTHER_LABEL, apply_privacy_filter, suppress_joint_cells
+from src.templates import DEFAULT_WAVE
+
 MIN_CELL_DEFAULT = 10
+MAX_DENSE_LOOKUP = 1 << 16
+ID_SOURCE = "amcase"
+# Survey weight used by weighted sampling. It is optional: a release without it
+# builds as before, with every weight missing, and weighted sampling then
+# refuses to run. The name has not been checked against the 2023 codebook.
+WEIGHT_SOURCE = "mweight"
 
 
 @dataclass
 class FeatureConfig:
     min_cell: int = MIN_CELL_DEFAULT
+    # Optional k-anonymity check over combinations of quasi-identifiers.
+    joint_fields: Tuple[str, ...] = ()
+    joint_min_cell: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class LabelField:
+    source: str
+    missing_tokens: Tuple[str, ...] = ()
+
+
+LABEL_FIELDS: Dict[str, LabelField] = {
+    "gender": LabelField("H1"),
+    "ethnicity": LabelField("methnic", ("unknown",)),
+    "education": LabelField("meducate"),
+    "housing": LabelField("H22"),
+    "party_vote": LabelField("mvpartyvote", ("missing", "dk")),
+}
 
 
 def _to_key(value: Any) -> Any:
@@ -22,10 +51,75 @@ def _to_key(value: Any) -> Any:
     return value
 
 
+def _clean_labels(
+    labels: Dict[Any, Any],
+    clean: bool,
+    missing_tokens: Iterable[str],
+) -> Dict[Any, str]:
+    cleaned: Dict[Any, str] = {}
+    tokens = list(missing_tokens)
+    for key, label in labels.items():
+        if clean:
+            label = filter_missing(normalize_text(label), tokens)
+        if label is None:
+            continue
+        cleaned[key] = label
+    return cleaned
+
+
+def _dense_lookup(keys: List[Any]) -> Optional[Tuple[int, int]]:
+    if not keys:
+        return None
+    if not all(isinstance(key, (int, np.integer)) and not isinstance(key, bool) for key in keys):
+        return None
+    low = int(min(keys))
+    high = int(max(keys))
+    if high - low > MAX_DENSE_LOOKUP:
+        return None
+    return low, high
+
+
+def _numeric_values(series: pd.Series) -> Optional[np.ndarray]:
+    if not (pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)):
+        return None
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _label_codes(series: pd.Series, labels: Dict[Any, str], categories: pd.Index) -> np.ndarray:
+    category_codes = {label: code for code, label in enumerate(categories)}
+    key_codes = {key: category_codes[label] for key, label in labels.items()}
+
+    values = _numeric_values(series)
+    bounds = _dense_lookup(list(key_codes))
+    if values is not None and bounds is not None:
+        low, high = bounds
+        lookup = np.full(high - low + 1, -1, dtype=np.int32)
+        for key, code in key_codes.items():
+            lookup[int(key) - low] = code
+        codes = np.full(len(values), -1, dtype=np.int32)
+        with np.errstate(invalid="ignore"):
+            valid = (values == np.floor(values)) & (values >= low) & (values <= high)
+        codes[valid] = lookup[values[valid].astype(np.int64) - low]
+        return codes
+
+    # Non-integer codes: map each distinct value once instead of every cell.
+    value_codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    unique_codes = np.array(
+        [key_codes.get(_to_key(value), -1) for value in uniques],
+        dtype=np.int32,
+    )
+    codes = np.full(len(value_codes), -1, dtype=np.int32)
+    present = value_codes >= 0
+    codes[present] = unique_codes[value_codes[present]]
+    return codes
+
+
 def map_value(
     series: Optional[pd.Series],
     labels: Optional[Dict[Any, str]],
     index: Optional[pd.Index] = None,
+    clean: bool = False,
+    missing_tokens: Iterable[str] = (),
 ) -> pd.Series:
     if series is None:
         if index is None:
@@ -34,66 +128,138 @@ def map_value(
     if labels is None:
         return pd.Series([None] * len(series), index=series.index)
 
-    def mapper(value: Any) -> Optional[str]:
-        key = _to_key(value)
-        if key is None:
-            return None
-        label = labels.get(key)
-        return label
+    cleaned = _clean_labels(labels, clean, missing_tokens)
+    categories = pd.Index(list(dict.fromkeys(cleaned.values())), dtype=object)
+    codes = _label_codes(series, cleaned, categories)
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=categories),
+        index=series.index,
+    )
 
-    return series.map(mapper)
 
+@dataclass(frozen=True)
+class RangeBuckets:
+    # Lower edges (inclusive) of each bin over the truncated integer value.
+    edges: Tuple[float, ...]
+    labels: Tuple[str, ...]
+    sentinels: Tuple[int, ...] = ()
+
+    def assign(self, values: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(np.asarray(self.edges, dtype=np.float64), values, side="right") - 1
+        positions[np.isin(values, self.sentinels)] = -1
+        return positions
+
+
+@dataclass(frozen=True)
+class CodeBuckets:
+    codes: Dict[int, str]
+
+    @property
+    def labels(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(self.codes.values()))
+
+    def assign(self, values: np.ndarray) -> np.ndarray:
+        label_positions = {label: position for position, label in enumerate(self.labels)}
+        low, high = min(self.codes), max(self.codes)
+        lookup = np.full(high - low + 1, -1, dtype=np.int64)
+        for code, label in self.codes.items():
+            lookup[code - low] = label_positions[label]
+        positions = np.full(len(values), -1, dtype=np.int64)
+        in_range = (values >= low) & (values <= high)
+        positions[in_range] = lookup[values[in_range].astype(np.int64) - low]
+        return positions
+
+
+Buckets = Union[RangeBuckets, CodeBuckets]
+
+
+@dataclass(frozen=True)
+class BucketField:
+    # Candidate source variables; the first one present in the frame is used.
+    sources: Tuple[str, ...]
+    buckets: Buckets
+
+
+AGE_BUCKETS = RangeBuckets(
+    edges=(18, 25, 35, 45, 55, 65),
+    labels=("18-24", "25-34", "35-44", "45-54", "55-64", "65+"),
+)
+
+IDEOLOGY_BUCKETS = RangeBuckets(
+    edges=(-np.inf, 4, 7),
+    labels=("left", "center", "right"),
+    sentinels=(99,),
+)
+
+URBAN_RURAL_BUCKETS = CodeBuckets(
+    {
+        111: "urban",
+        112: "urban",
+        113: "urban",
+        221: "rural/remote",
+        222: "rural/remote",
+        223: "rural/remote",
+        224: "rural/remote",
+        225: "rural/remote",
+    }
+)
+
+PROFILE_FIELDS = [
+    "age_bucket",
+    "gender",
+    "ethnicity",
+    "education",
+    "housing",
+    "urban_rural",
+    "party_vote",
+    "ideology",
+]
+
+BUCKET_FIELDS: Dict[str, BucketField] = {
+    "age_bucket": BucketField(("H3c", "mage"), AGE_BUCKETS),
+    "urban_rural": BucketField(("murbrur",), URBAN_RURAL_BUCKETS),
+    "ideology": BucketField(("B6",), IDEOLOGY_BUCKETS),
+}
+
+
+def bucketize(series: Optional[pd.Series], buckets: Buckets, index: Optional[pd.Index] = None) -> pd.Series:
+    if series is None:
+        return pd.Series([None] * len(index if index is not None else []), index=index, dtype=object)
 
-def age_bucket(age: Any) -> Optional[str]:
-    if age is None or (isinstance(age, float) and np.isnan(age)):
-        return None
-    try:
-        age_int = int(age)
-    except (TypeError, ValueError):
-        return None
-    if age_int < 18:
-        return None
-    if age_int <= 24:
-        return "18-24"
-    if age_int <= 34:
-        return "25-34"
-    if age_int <= 44:
-        return "35-44"
-    if age_int <= 54:
-        return "45-54"
-    if age_int <= 64:
-        return "55-64"
-    return "65+"
+    values = _numeric_values(series)
+    if values is None:
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
 
+    codes = np.full(len(values), -1, dtype=np.int64)
+    finite = np.isfinite(values)
+    codes[finite] = buckets.assign(np.trunc(values[finite]))
+    categories = pd.Index(list(dict.fromkeys(buckets.labels)), dtype=object)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=series.index)
 
-def ideology_bucket(value: Any) -> Optional[str]:
+
+def bucket_value(value: Any, buckets: Buckets) -> Optional[str]:
     if value is None or (isinstance(value, float) and np.isnan(value)):
         return None
     try:
         value_int = int(value)
     except (TypeError, ValueError):
         return None
-    if value_int == 99:
+    position = int(buckets.assign(np.array([value_int], dtype=np.float64))[0])
+    if position < 0:
         return None
-    if value_int <= 3:
-        return "left"
-    if value_int <= 6:
-        return "center"
-    return "right"
+    return buckets.labels[position]
+
+
+def age_bucket(age: Any) -> Optional[str]:
+    return bucket_value(age, AGE_BUCKETS)
+
+
+def ideology_bucket(value: Any) -> Optional[str]:
+    return bucket_value(value, IDEOLOGY_BUCKETS)
 
 
 def urban_rural_bucket(code: Any) -> Optional[str]:
-    if code is None or (isinstance(code, float) and np.isnan(code)):
-        return None
-    try:
-        code_int = int(code)
-    except (TypeError, ValueError):
-        return None
-    if code_int in {111, 112, 113}:
-        return "urban"
-    if code_int in {221, 222, 223, 224, 225}:
-        return "rural/remote"
-    return None
+    return bucket_value(code, URBAN_RURAL_BUCKETS)
 
 
 def normalize_text(value: Optional[str]) -> Optional[str]:
@@ -116,80 +282,172 @@ def filter_missing(label: Optional[str], missing_tokens: Iterable[str]) -> Optio
     return label
 
 
-def apply_privacy_filter(df: pd.DataFrame, fields: List[str], min_cell: int) -> pd.DataFrame:
-    filtered = df.copy()
-    for field in fields:
-        counts = filtered[field].value_counts(dropna=True)
-        rare_values = set(counts[counts < min_cell].index)
-        if not rare_values:
-            continue
-        filtered[field] = filtered[field].apply(
-            lambda value: "Other" if value in rare_values else value
+@dataclass(frozen=True)
+class WaveSpec:
+    # How one NZES release maps onto the common profile schema.
+    wave: int
+    raw_name: Optional[str] = None
+    id_source: str = ID_SOURCE
+    weight_source: Optional[str] = WEIGHT_SOURCE
+    label_fields: Dict[str, LabelField] = field(default_factory=lambda: dict(LABEL_FIELDS))
+    bucket_fields: Dict[str, BucketField] = field(default_factory=lambda: dict(BUCKET_FIELDS))
+
+
+# Only releases whose variable names have been checked against their codebook.
+# Add a wave here, with its own source, id and weight names, before building it.
+WAVES: Dict[int, WaveSpec] = {
+    2023: WaveSpec(2023, raw_name="2_NZES23Release_100227.dta"),
+}
+
+
+def wave_spec(wave: int) -> WaveSpec:
+    if wave not in WAVES:
+        raise ValueError(
+            f"No verified variable mapping for NZES wave {wave} (have {', '.join(map(str, WAVES))}); "
+            "add a WaveSpec for it to WAVES in src/features.py from that release's codebook."
         )
-    return filtered
+    return WAVES[wave]
 
 
-def build_features(df: pd.DataFrame, labels: Dict[str, Any], config: FeatureConfig | None = None) -> pd.DataFrame:
-    if config is None:
-        config = FeatureConfig()
+def source_columns(spec: Optional[WaveSpec] = None) -> List[Tuple[str, ...]]:
+    spec = spec or WAVES[DEFAULT_WAVE]
+    # Each entry lists interchangeable source variables; one of them must exist.
+    groups: List[Tuple[str, ...]] = [(spec.id_source,)]
+    groups.extend((field.source,) for field in spec.label_fields.values())
+    groups.extend(field.sources for field in spec.bucket_fields.values())
+    return groups
 
-    values = labels.get("values", {})
 
-    gender = map_value(df.get("H1"), values.get("H1"), index=df.index)
-    gender = gender.map(lambda v: normalize_text(v))
+def optional_columns(spec: Optional[WaveSpec] = None) -> List[str]:
+    spec = spec or WAVES[DEFAULT_WAVE]
+    return [spec.weight_source] if spec.weight_source else []
 
-    age_source = df.get("H3c")
-    if age_source is None:
-        age_source = df.get("mage")
-    age = age_source.map(age_bucket)
 
-    ethnicity = map_value(df.get("methnic"), values.get("methnic"), index=df.index)
-    ethnicity = ethnicity.map(lambda v: filter_missing(normalize_text(v), ["unknown"]))
+CATEGORICAL_FIELDS = [
+    "gender",
+    "ethnicity",
+    "education",
+    "housing",
+    "urban_rural",
+    "party_vote",
+    "ideology",
+]
 
-    education = map_value(df.get("meducate"), values.get("meducate"), index=df.index)
-    education = education.map(lambda v: normalize_text(v))
 
-    housing = map_value(df.get("H22"), values.get("H22"), index=df.index)
-    housing = housing.map(lambda v: normalize_text(v))
+def profile_categories(labels: Dict[str, Any], spec: Optional[WaveSpec] = None) -> Dict[str, List[str]]:
+    # The order featurize gives each field: label code order for labelled
+    # variables, bucket order for bucketed ones, then the privacy filter's "Other".
+    spec = spec or WAVES[DEFAULT_WAVE]
+    values = labels.get("values", {})
+    categories: Dict[str, List[str]] = {}
+    for name, field in spec.label_fields.items():
+        cleaned = _clean_labels(values.get(field.source) or {}, True, field.missing_tokens)
+        categories[name] = list(dict.fromkeys(cleaned.values()))
+    for name, field in spec.bucket_fields.items():
+        categories[name] = list(dict.fromkeys(field.buckets.labels))
+    for name in CATEGORICAL_FIELDS:
+        categories[name] = [value for value in categories[name] if value != OTHER_LABEL] + [OTHER_LABEL]
+    return {name: categories[name] for name in PROFILE_FIELDS}
+
+
+def merge_categories(per_wave: Iterable[Mapping[str, List[str]]]) -> Dict[str, List[str]]:
+    merged: Dict[str, Dict[str, None]] = {name: {} for name in PROFILE_FIELDS}
+    for categories in per_wave:
+        for name in PROFILE_FIELDS:
+            merged[name].update(dict.fromkeys(categories[name]))
+    # "Other" stays last however many waves contribute.
+    return {
+        name: [value for value in values if value != OTHER_LABEL] + ([OTHER_LABEL] if OTHER_LABEL in values else [])
+        for name, values in merged.items()
+    }
+
+
+def with_categories(df: pd.DataFrame, categories: Mapping[str, List[str]]) -> pd.DataFrame:
+    for name, values in categories.items():
+        df[name] = pd.Categorical(df[name], categories=values)
+    return df
+
+
+def profile_signatures(df: pd.DataFrame) -> np.ndarray:
+    # Category codes are fixed by the dataset schema, so signatures compare
+    # across chunks and waves; plain columns fall back to first-seen order.
+    packed = np.zeros(len(df), dtype=np.uint64)
+    for lane, name in enumerate(SIGNATURE_FIELDS):
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes = column.cat.codes.to_numpy()
+        else:
+            codes, _ = pd.factorize(column.where(column.ne("")))
+        if codes.max(initial=-1) >= LANE_MAX:
+            raise ValueError(f"{name} has too many categories for a {LANE_BITS}-bit signature lane.")
+        packed |= (codes + 1).astype(np.uint64) << np.uint64(LANE_BITS * lane)
+    return packed.view(np.int64)
+
+
+def with_signature(df: pd.DataFrame) -> pd.DataFrame:
+    df["signature"] = profile_signatures(df)
+    return df
+
 
-    urban_rural = df.get("murbrur")
-    if urban_rural is not None:
-        urban_rural = urban_rural.map(urban_rural_bucket)
+def featurize(df: pd.DataFrame, labels: Dict[str, Any], spec: Optional[WaveSpec] = None) -> pd.DataFrame:
+    spec = spec or WAVES[DEFAULT_WAVE]
+    values = labels.get("values", {})
 
-    party_vote = map_value(df.get("mvpartyvote"), values.get("mvpartyvote"), index=df.index)
-    party_vote = party_vote.map(lambda v: filter_missing(normalize_text(v), ["missing", "dk"]))
+    with span("mapping"):
+        mapped = {
+            name: map_value(
+                df.get(field.source),
+                values.get(field.source),
+                index=df.index,
+                clean=True,
+                missing_tokens=field.missing_tokens,
+            )
+            for name, field in spec.label_fields.items()
+        }
 
-    ideology = df.get("B6")
-    if ideology is not None:
-        ideology = ideology.map(ideology_bucket)
+    with span("bucketing"):
+        for name, field in spec.bucket_fields.items():
+            source = next((df[column] for column in field.sources if column in df.columns), None)
+            mapped[name] = bucketize(source, field.buckets, index=df.index)
 
+    ids = pd.to_numeric(df.get(spec.id_source), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    weights = np.full(len(df), np.nan, dtype=np.float32)
+    if spec.weight_source in df.columns:
+        weights = pd.to_numeric(df[spec.weight_source], errors="coerce").to_numpy(dtype=np.float32, na_value=np.nan)
     out = pd.DataFrame(
         {
-            "respondent_id": df.get("amcase").astype(str),
-            "age_bucket": age,
-            "gender": gender,
-            "ethnicity": ethnicity,
-            "education": education,
-            "housing": housing,
-            "urban_rural": urban_rural,
-            "party_vote": party_vote,
-            "ideology": ideology,
-        }
+            "respondent_id": np.nan_to_num(ids).astype(np.int64),
+            "wave": np.full(len(df), spec.wave, dtype=np.int16),
+            **{name: mapped[name] for name in PROFILE_FIELDS},
+            "weight": weights,
+        },
+        index=df.index,
     )
 
-    # Drop rows without an id
-    out = out.dropna(subset=["respondent_id"]).copy()
+    # Drop rows without a whole-number id
+    with np.errstate(invalid="ignore"):
+        has_id = np.isfinite(ids) & (ids == np.floor(ids))
+    return out if has_id.all() else out[has_id]
 
-    categorical_fields = [
-        "gender",
-        "ethnicity",
-        "education",
-        "housing",
-        "urban_rural",
-        "party_vote",
-        "ideology",
-    ]
 
-    out = apply_privacy_filter(out, categorical_fields, config.min_cell)
+def joint_min_cell(config: FeatureConfig) -> Optional[int]:
+    if not config.joint_fields:
+        return None
+    return config.joint_min_cell if config.joint_min_cell is not None else config.min_cell
+
+
+def apply_privacy(df: pd.DataFrame, config: FeatureConfig) -> pd.DataFrame:
+    with span("privacy"):
+        apply_privacy_filter(df, CATEGORICAL_FIELDS, config.min_cell)
+        if config.joint_fields:
+            suppress_joint_cells(df, config.joint_fields, joint_min_cell(config))
+    return df
+
+
+def build_features(df: pd.DataFrame, labels: Dict[str, Any], config: FeatureConfig | None = None) -> pd.DataFrame:
+    if config is None:
+        config = FeatureConfig()
 
-    return out
+    return apply_privacy(featurize(df, labels), config)
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-import json
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import pyreadstat
 
+from src.features import WaveSpec, optional_columns, source_columns
+from src.labels import write_label_store
+from src.metrics import span
+
 
 def clean_label(label: str | None) -> str | None:
     if not label:
@@ -18,8 +21,22 @@ def clean_label(label: str | None) -> str | None:
     return cleaned
 
 
-def read_raw_dta(path: Path) -> Tuple[Any, Dict[str, Any]]:
-    df, meta = pyreadstat.read_dta(path, apply_value_formats=False)
+def resolve_columns(
+    path: Path,
+    groups: Sequence[Tuple[str, ...]],
+    optional: Sequence[str] = (),
+) -> Tuple[Any, List[str]]:
+    _, meta = pyreadstat.read_dta(path, metadataonly=True)
+    available = set(meta.column_names)
+    missing = [" or ".join(group) for group in groups if not any(name in available for name in group)]
+    if missing:
+        raise ValueError(f"{path} is missing required NZES variables: {', '.join(missing)}")
+    columns = [next(name for name in group if name in available) for group in groups]
+    columns.extend(name for name in optional if name in available)
+    return meta, list(dict.fromkeys(columns))
+
+
+def extract_labels(meta: Any) -> Dict[str, Any]:
     labels = {
         "variables": {
             name: clean_label(label)
@@ -30,16 +47,77 @@ def read_raw_dta(path: Path) -> Tuple[Any, Dict[str, Any]]:
     for var, label_map in meta.variable_value_labels.items():
         if isinstance(label_map, dict):
             labels["values"][var] = {int(k) if isinstance(k, float) and k.is_integer() else k: clean_label(v) for k, v in label_map.items()}
-    return df, labels
+    return labels
+
+
+def read_raw_dta(
+    path: Path,
+    groups: Optional[Sequence[Tuple[str, ...]]] = None,
+    num_processes: int = 1,
+    optional: Optional[Sequence[str]] = None,
+) -> Tuple[Any, Dict[str, Any]]:
+    # Probe the metadata first so only the variables the features use are read.
+    with span("projection"):
+        meta, columns = resolve_columns(
+            path,
+            groups if groups is not None else source_columns(),
+            optional if optional is not None else optional_columns(),
+        )
+    with span("ingest"):
+        if num_processes > 1:
+            df, _ = pyreadstat.read_file_multiprocessing(
+                pyreadstat.read_dta,
+                str(path),
+                num_processes=num_processes,
+                usecols=columns,
+                apply_value_formats=False,
+            )
+        else:
+            df, _ = pyreadstat.read_dta(path, usecols=columns, apply_value_formats=False)
+    return df, extract_labels(meta)
+
+
+def iter_raw_dta(
+    path: Path,
+    chunk_rows: int,
+    groups: Optional[Sequence[Tuple[str, ...]]] = None,
+    optional: Optional[Sequence[str]] = None,
+) -> Tuple[Iterator[Any], Dict[str, Any]]:
+    # Same projection as read_raw_dta, but rows arrive chunk_rows at a time.
+    with span("projection"):
+        meta, columns = resolve_columns(
+            path,
+            groups if groups is not None else source_columns(),
+            optional if optional is not None else optional_columns(),
+        )
+    chunks = (
+        df
+        for df, _ in pyreadstat.read_file_in_chunks(
+            pyreadstat.read_dta,
+            str(path),
+            chunksize=chunk_rows,
+            usecols=columns,
+            apply_value_formats=False,
+        )
+    )
+    return chunks, extract_labels(meta)
+
+
+def pipeline_variables(spec: Optional[WaveSpec] = None) -> List[str]:
+    names = [name for group in source_columns(spec) for name in group]
+    return list(dict.fromkeys([*names, *optional_columns(spec)]))
 
 
-def write_labels(labels: Dict[str, Any], path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(labels, f, indent=2, ensure_ascii=False)
+def write_labels(labels: Dict[str, Any], path: Path, full: bool = False, spec: Optional[WaveSpec] = None) -> None:
+    write_label_store(labels, path, None if full else pipeline_variables(spec))
 
 
-def ingest(raw_path: Path, labels_path: Path) -> Tuple[Any, Dict[str, Any]]:
-    df, labels = read_raw_dta(raw_path)
-    write_labels(labels, labels_path)
+def ingest(
+    raw_path: Path,
+    labels_path: Path,
+    num_processes: int = 1,
+    full_labels: bool = False,
+) -> Tuple[Any, Dict[str, Any]]:
+    df, labels = read_raw_dta(raw_path, num_processes=num_processes)
+    write_labels(labels, labels_path, full=full_labels)
     return df, labels
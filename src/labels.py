@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+MAGIC = b"NZLB"
+FORMAT_VERSION = 1
+# magic, format version, header length
+PREAMBLE = struct.Struct("<4sBI")
+
+
+def _compact(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_label_store(
+    labels: Dict[str, Any],
+    path: Path,
+    variables: Optional[Iterable[str]] = None,
+) -> None:
+    variable_labels: Dict[str, Optional[str]] = labels.get("variables", {})
+    value_labels: Dict[str, Dict[Any, str]] = labels.get("values", {})
+    names = list(variable_labels) if variables is None else [name for name in variables if name in variable_labels or name in value_labels]
+
+    index: Dict[str, List[Any]] = {}
+    blobs: List[bytes] = []
+    offset = 0
+    for name in names:
+        label_map = value_labels.get(name)
+        if label_map is None:
+            index[name] = [variable_labels.get(name), -1, 0]
+            continue
+        # Pairs keep integer codes intact; JSON object keys would become strings.
+        blob = zlib.compress(_compact(list(label_map.items())))
+        index[name] = [variable_labels.get(name), offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = _compact({"index": index})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    tmp_path.replace(path)
+
+
+class LabelStore:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as f:
+            magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a label store (version {FORMAT_VERSION}).")
+            self._index: Dict[str, List[Any]] = json.loads(f.read(header_length))["index"]
+        self._data_start = PREAMBLE.size + header_length
+        self._values: Dict[str, Optional[Dict[Any, str]]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def variables(self) -> List[str]:
+        return list(self._index)
+
+    def variable_label(self, name: str) -> Optional[str]:
+        entry = self._index.get(name)
+        return entry[0] if entry else None
+
+    def value_labels(self, name: str) -> Optional[Dict[Any, str]]:
+        if name in self._values:
+            return self._values[name]
+        entry = self._index.get(name)
+        if entry is None or entry[1] < 0:
+            return None
+        _, offset, length = entry
+        with self.path.open("rb") as f:
+            f.seek(self._data_start + offset)
+            pairs = json.loads(zlib.decompress(f.read(length)))
+        label_map = {key: label for key, label in pairs}
+        self._values[name] = label_map
+        return label_map
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = {}
+        for name in self._index:
+            label_map = self.value_labels(name)
+            if label_map is not None:
+                values[name] = label_map
+        return {
+            "variables": {name: entry[0] for name, entry in self._index.items()},
+            "values": values,
+        }
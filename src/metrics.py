@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, ContextManager, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    import cProfile
+
+METRICS_VERSION = 1
+
+
+def rss_peak_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_revision() -> Optional[str]:
+    import subprocess
+
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parents[1],
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+@dataclass
+class SpanStats:
+    name: str
+    count: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_traced_bytes: Optional[int] = None
+    rss_peak_bytes: Optional[int] = None
+
+
+class _OpenSpan:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Highest traced peak seen before a child span reset the counter.
+        self.max_seen = 0
+
+
+class Profiler:
+    def __init__(self, memory: bool = False, cprofile_stage: Optional[str] = None) -> None:
+        self.memory = memory
+        self.cprofile_stage = cprofile_stage
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.spans: Dict[str, SpanStats] = {}
+        self._stack: List[_OpenSpan] = []
+
+    def start(self) -> None:
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self) -> None:
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        parent = self._stack[-1] if self._stack else None
+        current = _OpenSpan(f"{parent.path}/{name}" if parent else name)
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            if parent is not None:
+                parent.max_seen = max(parent.max_seen, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        profile = name == self.cprofile_stage
+        if profile:
+            import cProfile
+
+            self.cprofile = self.cprofile or cProfile.Profile()
+            self.cprofile.enable()
+
+        self._stack.append(current)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._stack.pop()
+            if profile:
+                self.cprofile.disable()
+
+            stats = self.spans.setdefault(current.path, SpanStats(current.path))
+            stats.count += 1
+            stats.wall_s += wall
+            stats.cpu_s += cpu
+            stats.rss_peak_bytes = rss_peak_bytes()
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], current.max_seen)
+                stats.peak_traced_bytes = max(stats.peak_traced_bytes or 0, peak)
+                if parent is not None:
+                    parent.max_seen = max(parent.max_seen, peak)
+
+    def report(self, **extra: Any) -> Dict[str, Any]:
+        import platform
+
+        return {
+            "version": METRICS_VERSION,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            **extra,
+            "spans": [asdict(stats) for stats in self.spans.values()],
+        }
+
+    def write(self, path: Path, **extra: Any) -> Dict[str, Any]:
+        # One JSON object per line, so repeated runs build up a history.
+        report = self.report(**extra)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(report, sort_keys=True) + "\n")
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(cprofile_path(path, self.cprofile_stage))
+        return report
+
+
+def cprofile_path(metrics_path: Path, stage: Optional[str]) -> Path:
+    return metrics_path.with_name(f"{metrics_path.stem}-{stage}.prof")
+
+
+_active: Optional[Profiler] = None
+
+
+@contextmanager
+def profiling(profiler: Profiler) -> Iterator[Profiler]:
+    global _active
+    previous, _active = _active, profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = previous
+
+
+def span(name: str) -> ContextManager[None]:
+    # A no-op unless a profiler is active, so library code can mark stages freely.
+    if _active is None:
+        return nullcontext()
+    return _active.span(name)
@@ -1,77 +1,182 @@
 from __future__ import annotations
 
-import json
-import random
-from datetime import datetime, timezone
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional
-
-import pandas as pd
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
 
 from src.bsky_client import BlueskyClient
-from src.state import load_state, save_state
+from src.cache import file_digest, file_stat, sequence_digest
+from src.diversity import blocked_keys, lane_mask, remember
+from src.metrics import span
+from src.prerender import DEFAULT_SAMPLING, Prerender, open_prerender, prerender_path, write_prerender
+from src.state import UsedBitmap, bind_dataset, load_state, record_post, save_state
 from src.templates import TemplateContext, context_from_row, render_profile
 
-MIN_FIELDS = 3
-
-
-def load_dataset(path: Path) -> pd.DataFrame:
-    df = pd.read_parquet(path)
-    if "respondent_id" in df.columns:
-        df["respondent_id"] = df["respondent_id"].astype(str)
-    return df
-
-
-def build_queue(ids: pd.Series, seed: int) -> list[str]:
-    rng = random.Random(seed)
-    queue = [str(value) for value in ids.dropna().unique().tolist()]
-    rng.shuffle(queue)
-    return queue
-
-
-def row_field_count(row: pd.Series) -> int:
-    fields = [
-        "age_bucket",
-        "gender",
-        "ethnicity",
-        "education",
-        "housing",
-        "urban_rural",
-        "party_vote",
-        "ideology",
-    ]
-    count = 0
-    for field in fields:
-        value = row.get(field)
-        if value is None or value == "":
-            continue
-        if pd.isna(value):
-            continue
-        count += 1
-    return count
-
-
-def select_candidate(df: pd.DataFrame, state: Dict[str, Any]) -> Dict[str, Any]:
-    if not state.get("queue"):
-        state["queue"] = build_queue(df["respondent_id"], state.get("rng_seed", 1337))
-        state["queue_index"] = 0
-
-    used_ids = set(str(value) for value in state.get("used_ids", []))
-    df_indexed = df.set_index("respondent_id", drop=False)
-
-    while state["queue_index"] < len(state["queue"]):
-        respondent_id = str(state["queue"][state["queue_index"]])
-        state["queue_index"] += 1
-        if respondent_id in used_ids:
-            continue
-        if respondent_id not in df_indexed.index:
-            continue
-        row = df_indexed.loc[respondent_id]
-        if row_field_count(row) < MIN_FIELDS:
-            continue
-        return row.to_dict()
-
-    raise RuntimeError("No remaining candidates with sufficient fields.")
+if TYPE_CHECKING:
+    import pandas as pd
+
+# First run of queue entries read when looking for the next post; it doubles
+# while every entry in it is used or too close to a recent post.
+SCAN_BLOCK = 256
+# Columns the queue order is worked out from; the texts are rendered from the
+# dataset file afterwards.
+ORDER_COLUMNS = ("respondent_id", "weight", "signature")
+
+# Posting from an up-to-date pre-rendered file needs only the standard library;
+# pandas, numpy and pyarrow are imported only when the file has to be rebuilt or
+# a respondent is looked up in the parquet.
+
+
+def build_prerender(
+    df: pd.DataFrame,
+    path: Path,
+    seed: int,
+    dataset_sha256: str,
+    sampling: str = DEFAULT_SAMPLING,
+    dataset_stat: Optional[Dict[str, int]] = None,
+    render_from: Optional[Path] = None,
+) -> int:
+    from src.dataset import legacy_respondent_labels, respondent_labels
+    from src.features import profile_signatures
+    from src.render import render_frame, render_rows
+    from src.selection import eligible_queue
+
+    ids = respondent_labels(df["respondent_id"])
+    signatures = df["signature"] if "signature" in df.columns else profile_signatures(df)
+    rows = df.assign(respondent_id=ids, _row=range(len(df)), _signature=signatures)
+    rows = rows.drop_duplicates("respondent_id")
+    with span("selection"):
+        queue = eligible_queue(rows, seed, sampling)
+    with span("render"):
+        positions = dict(zip(rows["respondent_id"], rows["_row"].tolist()))
+        signature_of = dict(zip(rows["respondent_id"], rows["_signature"].tolist()))
+        if render_from is None:
+            # render_frame renders each distinct profile once, instead of once per row.
+            texts = dict(zip(rows["_row"].tolist(), render_frame(rows, processes=1)["text"]))
+        else:
+            texts = render_rows(render_from, [positions[respondent_id] for respondent_id in queue])
+        records = [
+            (respondent_id, positions[respondent_id], texts[positions[respondent_id]], signature_of[respondent_id])
+            for respondent_id in queue
+        ]
+    legacy = legacy_respondent_labels(df["respondent_id"])
+    with span("write-posts"):
+        return write_prerender(
+            records,
+            path,
+            seed,
+            dataset_sha256,
+            sequence_digest(ids),
+            sampling=sampling,
+            legacy_ids_fingerprint=sequence_digest(legacy) if legacy is not None else None,
+            dataset_stat=dataset_stat,
+        )
+
+
+def prerender_dataset(dataset_path: Path, seed: int, sampling: str = DEFAULT_SAMPLING) -> int:
+    from src.dataset import dataset_columns, read_dataset
+    from src.features import PROFILE_FIELDS
+
+    # Ids stay integers and profile fields categoricals; only the queued rows
+    # are rendered, straight from the row groups.
+    stat = file_stat(dataset_path)
+    digest = file_digest(dataset_path)
+    available = set(dataset_columns(dataset_path))
+    columns = [name for name in (*ORDER_COLUMNS, *PROFILE_FIELDS) if name in available]
+    with span("load"):
+        df = read_dataset(dataset_path, columns=columns)
+    return build_prerender(df, prerender_path(dataset_path), seed, digest, sampling, stat, render_from=dataset_path)
+
+
+def load_prerender(dataset_path: Path, seed: int, sampling: str = DEFAULT_SAMPLING) -> Prerender:
+    path = prerender_path(dataset_path)
+    with span("load"):
+        prerender = open_prerender(path)
+        current = prerender is not None and prerender.is_current(seed, dataset_path, sampling)
+    if not current:
+        prerender_dataset(dataset_path, seed, sampling)
+        prerender = Prerender(path)
+    return prerender
+
+
+def next_prerendered(prerender: Prerender, state: Dict[str, Any]) -> tuple[str, int, str, int]:
+    used: UsedBitmap = state["used"]
+    cursor = state.get("cursor", 0)
+    mask = lane_mask()
+    blocked = blocked_keys(state, mask)
+
+    # Entries too close to a recent post are passed over but not used up: the
+    # cursor stays on the first open entry so a later post can still take it.
+    # When every open entry is too close, the first one is posted anyway.
+    first_open: Optional[int] = None
+    chosen: Optional[int] = None
+    position, block = cursor, SCAN_BLOCK
+    while position < len(prerender):
+        rows, signatures = prerender.scan(position, block)
+        open_entries = [offset for offset, row in enumerate(rows) if row not in used]
+        if open_entries and first_open is None:
+            first_open = position + open_entries[0]
+        fresh = next((offset for offset in open_entries if signatures[offset] & mask not in blocked), None)
+        if fresh is not None:
+            chosen = position + fresh
+            break
+        position += len(rows)
+        block *= 2
+    if chosen is None:
+        chosen = first_open
+    if chosen is None:
+        raise RuntimeError("No remaining candidates with sufficient fields.")
+
+    respondent_id, row, text, _ = prerender.record(chosen)
+    state["cursor"] = first_open if first_open < chosen else chosen + 1
+    return respondent_id, row, text, prerender.scan(chosen, 1)[1][0]
+
+
+def selection_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    # Picks made ahead of posting are marked on a copy, so later picks in the
+    # same batch neither repeat them nor resemble them.
+    selection = dict(state)
+    selection["used"] = UsedBitmap(bytes(state["used"].bits))
+    selection["recent"] = list(state.get("recent", []))
+    return selection
+
+
+def mark_taken(selection: Dict[str, Any], row: int, signature: int) -> None:
+    selection["used"].add(row)
+    remember(selection, signature)
+
+
+def take_prerendered(
+    prerender: Prerender, state: Dict[str, Any], count: int
+) -> List[tuple[str, int, str, int, int]]:
+    # Each entry carries the cursor just past it, so progress can be recorded
+    # post by post rather than for the whole batch up front.
+    selection = selection_state(state)
+    batch: List[tuple[str, int, str, int, int]] = []
+    while len(batch) < count:
+        try:
+            respondent_id, row, text, signature = next_prerendered(prerender, selection)
+        except RuntimeError:
+            if not batch:
+                raise
+            break
+        mark_taken(selection, row, signature)
+        batch.append((respondent_id, row, text, signature, selection["cursor"]))
+    return batch
+
+
+def render_respondent(dataset_path: Path, respondent_id: str) -> str:
+    from src.dataset import dataset_columns, lookup_respondents
+    from src.render import RENDER_COLUMNS
+
+    with span("load"):
+        available = set(dataset_columns(dataset_path))
+        columns = [name for name in RENDER_COLUMNS if name in available]
+        rows = lookup_respondents(dataset_path, [respondent_id], columns=columns)
+    if not rows:
+        raise KeyError(f"Respondent {respondent_id} not found in {dataset_path}.")
+    with span("render"):
+        return render_profile(context_from_row(rows[0]))
 
 
 def post_once(
@@ -80,13 +185,15 @@ def post_once(
     handle: Optional[str] = None,
     app_password: Optional[str] = None,
     dry_run: bool = False,
+    session_path: Optional[Path] = None,
 ) -> str:
-    df = load_dataset(dataset_path)
     state = load_state(state_path)
-
-    row = select_candidate(df, state)
-    context = context_from_row(row)
-    text = render_profile(context)
+    prerender = load_prerender(dataset_path, state["rng_seed"], state["sampling"])
+    legacy_ids = prerender.header.get("legacy_ids")
+    if bind_dataset(state, prerender.header["ids"], prerender.positions_of, legacy_ids) and not dry_run:
+        save_state(state_path, state)
+    with span("selection"):
+        respondent_id, row, text, signature = next_prerendered(prerender, state)
 
     if dry_run:
         print(text)
@@ -95,15 +202,50 @@ def post_once(
     if not handle or not app_password:
         raise RuntimeError("Missing Bluesky credentials.")
 
-    client = BlueskyClient(handle, app_password)
+    client = BlueskyClient(handle, app_password, session_path=session_path)
     uri = client.post(text)
 
-    state.setdefault("used_ids", []).append(str(row["respondent_id"]))
-    state["last_post"] = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "uri": uri,
-        "text": text,
-    }
-    save_state(state_path, state)
+    record_post(state_path, state, respondent_id, row, uri, text, signature)
 
     return uri
+
+
+def post_batch(
+    dataset_path: Path,
+    state_path: Path,
+    count: int,
+    interval: float = 0.0,
+    handle: Optional[str] = None,
+    app_password: Optional[str] = None,
+    session_path: Optional[Path] = None,
+    dry_run: bool = False,
+    sleep: Callable[[float], None] = time.sleep,
+) -> List[str]:
+    state = load_state(state_path)
+    prerender = load_prerender(dataset_path, state["rng_seed"], state["sampling"])
+    bind_dataset(state, prerender.header["ids"], prerender.positions_of, prerender.header.get("legacy_ids"))
+    with span("selection"):
+        batch = take_prerendered(prerender, state, count)
+
+    if dry_run:
+        for _, _, text, _, _ in batch:
+            print(text)
+        return [text for _, _, text, _, _ in batch]
+
+    if not handle or not app_password:
+        raise RuntimeError("Missing Bluesky credentials.")
+
+    client = BlueskyClient(handle, app_password, session_path=session_path)
+    uris: List[str] = []
+    try:
+        for index, (respondent_id, row, text, signature, cursor) in enumerate(batch):
+            if index and interval > 0:
+                sleep(interval)
+            uri = client.post(text)
+            state["cursor"] = cursor
+            record_post(state_path, state, respondent_id, row, uri, text, signature)
+            uris.append(uri)
+    finally:
+        # One snapshot per batch; the journal covers a crash in between.
+        save_state(state_path, state)
+    return uris
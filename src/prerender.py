@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src import templates
+from src.cache import known_digest, source_digest
+
+# Files written before sampling schemes existed are in uniform order.
+DEFAULT_SAMPLING = "uniform"
+MAGIC = b"NZPR"
+FORMAT_VERSION = 3
+# magic, format version, header length, record count
+PREAMBLE = struct.Struct("<4sBIQ")
+OFFSET = struct.Struct("<Q")
+# Row position and profile signature of each record, packed so a run of queue
+# entries can be checked without decoding their JSON.
+ENTRY = struct.Struct("<qq")
+
+
+def template_fingerprint() -> str:
+    return source_digest([templates])
+
+
+def prerender_path(dataset_path: Path) -> Path:
+    return dataset_path.with_suffix(".posts")
+
+
+def write_prerender(
+    records: Iterable[Tuple[str, int, str, int]],
+    path: Path,
+    seed: int,
+    dataset_sha256: str,
+    ids_fingerprint: str,
+    sampling: str = DEFAULT_SAMPLING,
+    legacy_ids_fingerprint: Optional[str] = None,
+    dataset_stat: Optional[Dict[str, int]] = None,
+) -> int:
+    encoded: List[bytes] = []
+    entries = array("q")
+    for respondent_id, row, text, signature in records:
+        encoded.append(
+            json.dumps([respondent_id, row, text, len(text)], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        )
+        entries.extend((row, signature))
+
+    fields: Dict[str, Any] = {
+        "template": template_fingerprint(),
+        "seed": seed,
+        "sampling": sampling,
+        "dataset": dataset_sha256,
+        # Identifies the respondent row order, which state row positions refer to.
+        "ids": ids_fingerprint,
+    }
+    if dataset_stat is not None:
+        # Size and mtime of the dataset when it was hashed, so a check at post
+        # time can skip re-hashing an unchanged file.
+        fields["dataset_stat"] = dataset_stat
+    if legacy_ids_fingerprint is not None:
+        # The same rows as a version 1 dataset named them, so older state still binds.
+        fields["legacy_ids"] = legacy_ids_fingerprint
+    header = json.dumps(fields, separators=(",", ":")).encode("utf-8")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header), len(encoded)))
+        f.write(header)
+        offset = 0
+        for record in encoded:
+            f.write(OFFSET.pack(offset))
+            offset += len(record)
+        f.write(OFFSET.pack(offset))
+        if sys.byteorder == "big":
+            entries.byteswap()
+        f.write(entries.tobytes())
+        for record in encoded:
+            f.write(record)
+    tmp_path.replace(path)
+    return len(encoded)
+
+
+class Prerender:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as f:
+            magic, version, header_length, count = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a pre-rendered post file (version {FORMAT_VERSION}).")
+            self.header: Dict[str, Any] = json.loads(f.read(header_length))
+        self.count = count
+        self._offsets_start = PREAMBLE.size + header_length
+        self._entries_start = self._offsets_start + (count + 1) * OFFSET.size
+        self._records_start = self._entries_start + count * ENTRY.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def is_current(self, seed: int, dataset_path: Optional[Path] = None, sampling: str = DEFAULT_SAMPLING) -> bool:
+        if self.header.get("template") != template_fingerprint():
+            return False
+        if self.header.get("seed") != seed:
+            return False
+        if self.header.get("sampling", DEFAULT_SAMPLING) != sampling:
+            return False
+        if dataset_path is not None:
+            # Files without the recorded stat would be hashed on every check;
+            # rebuilding them once is cheaper.
+            if "dataset_stat" not in self.header:
+                return False
+            recorded = {**self.header["dataset_stat"], "sha256": self.header.get("dataset")}
+            if known_digest(dataset_path, recorded) != self.header.get("dataset"):
+                return False
+        return True
+
+    def record(self, position: int) -> Tuple[str, int, str, int]:
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        with self.path.open("rb") as f:
+            f.seek(self._offsets_start + position * OFFSET.size)
+            start, end = struct.unpack("<QQ", f.read(2 * OFFSET.size))
+            f.seek(self._records_start + start)
+            respondent_id, row, text, length = json.loads(f.read(end - start))
+        return respondent_id, row, text, length
+
+    def scan(self, start: int, count: int) -> Tuple[array, array]:
+        # Rows and signatures of the queue entries from start on, as two arrays.
+        count = max(0, min(count, self.count - start))
+        entries = array("q")
+        with self.path.open("rb") as f:
+            f.seek(self._entries_start + start * ENTRY.size)
+            entries.frombytes(f.read(count * ENTRY.size))
+        if sys.byteorder == "big":
+            entries.byteswap()
+        return entries[0::2], entries[1::2]
+
+    def records(self) -> Iterator[Tuple[str, int, str, int]]:
+        with self.path.open("rb") as f:
+            f.seek(self._offsets_start)
+            offsets = struct.unpack(f"<{self.count + 1}Q", f.read((self.count + 1) * OFFSET.size))
+            f.seek(self._records_start)
+            for start, end in zip(offsets, offsets[1:]):
+                respondent_id, row, text, length = json.loads(f.read(end - start))
+                yield respondent_id, row, text, length
+
+    def positions_of(self, respondent_ids: Iterable[str]) -> Dict[str, int]:
+        wanted = set(respondent_ids)
+        return {respondent_id: row for respondent_id, row, _, _ in self.records() if respondent_id in wanted}
+
+
+def open_prerender(path: Path) -> Optional[Prerender]:
+    if not path.exists():
+        return None
+    try:
+        return Prerender(path)
+    except (ValueError, struct.error):
+        return None
@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from src.cache import combine, file_fingerprint
+from src.dataset import dataset_columns, read_dataset, respondent_key, respondent_labels
+from src.post import take_prerendered
+from src.prerender import Prerender, open_prerender, prerender_path, template_fingerprint
+from src.render import RENDER_COLUMNS, TEMPLATE_FIELDS
+from src.state import bind_dataset, journal_path, load_state
+from src.templates import context_from_row, render_profile
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+PROFILE_CACHE_SIZE = 4096
+MAX_PEEK = 100
+# Files are checked for changes at most this often.
+REFRESH_SECONDS = 1.0
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+class PreviewIndex:
+    def __init__(self, dataset_path: Path, state_path: Path, cache_size: int = PROFILE_CACHE_SIZE) -> None:
+        self.dataset_path = dataset_path
+        self.state_path = state_path
+        self.cache_size = cache_size
+        self.texts: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.dataset_fingerprint: Any = None
+        self.state_fingerprint: Any = None
+        self.state: Dict[str, Any] = {}
+        self.prerender: Optional[Prerender] = None
+        self.keys = np.empty(0, dtype=np.int64)
+        self.order = np.empty(0, dtype=np.int64)
+        self.columns: Dict[str, List[Any]] = {}
+        self._upcoming: List[Dict[str, Any]] = []
+        self._counts: Optional[Tuple[int, int]] = None
+        self.template = ""
+        # Why /next and /stats cannot be answered, when they cannot.
+        self.unavailable: Optional[str] = None
+
+    def _dataset_files(self) -> Any:
+        return file_fingerprint(self.dataset_path, prerender_path(self.dataset_path))
+
+    def _state_files(self) -> Any:
+        return file_fingerprint(self.state_path, journal_path(self.state_path))
+
+    def stale(self) -> bool:
+        return self._dataset_files() != self.dataset_fingerprint or self._state_files() != self.state_fingerprint
+
+    def load(self) -> Dict[str, Any]:
+        # Reads everything a refresh needs without touching the index, so it
+        # can run in a worker thread while requests are served from the old one.
+        # Nothing is written: a posts file that is missing or out of date is
+        # reported, never rebuilt.
+        updates: Dict[str, Any] = {"state_fingerprint": self._state_files(), "state": load_state(self.state_path)}
+        dataset_files = self._dataset_files()
+        if dataset_files != self.dataset_fingerprint:
+            updates.update(self._read_dataset())
+        state = updates["state"]
+        prerender = open_prerender(prerender_path(self.dataset_path))
+        if prerender is None:
+            updates["unavailable"] = f"No posts file for {self.dataset_path}; run build-dataset."
+        elif not prerender.is_current(state["rng_seed"], self.dataset_path, state["sampling"]):
+            prerender = None
+            updates["unavailable"] = f"The posts file for {self.dataset_path} is out of date; run build-dataset."
+        else:
+            try:
+                bind_dataset(state, prerender.header["ids"], prerender.positions_of, prerender.header.get("legacy_ids"))
+                updates["unavailable"] = None
+            except RuntimeError as error:
+                prerender, updates["unavailable"] = None, str(error)
+        updates["prerender"] = prerender
+        updates["dataset_fingerprint"] = dataset_files
+        updates["template"] = template_fingerprint()
+        return updates
+
+    def apply(self, updates: Dict[str, Any]) -> None:
+        if "columns" in updates:
+            self.texts.clear()
+        for name, value in updates.items():
+            setattr(self, name, value)
+        self._upcoming = []
+        self._counts = None
+
+    def refresh(self) -> None:
+        self.apply(self.load())
+
+    def _read_dataset(self) -> Dict[str, Any]:
+        available = set(dataset_columns(self.dataset_path))
+        df = read_dataset(self.dataset_path, columns=[name for name in RENDER_COLUMNS if name in available])
+        ids = df["respondent_id"]
+        if ids.dtype.kind == "i":
+            keys = ids.to_numpy()
+        else:
+            # Ids that are not valid keys never match a lookup.
+            keys = np.array([-1 if key is None else key for key in map(respondent_key, ids)], dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        columns = {"respondent_id": respondent_labels(ids)}
+        for name in TEMPLATE_FIELDS:
+            columns[name] = df[name].tolist() if name in df.columns else [None] * len(df)
+        return {"order": order, "keys": keys[order], "columns": columns}
+
+    def row_of(self, respondent_id: str) -> Optional[int]:
+        key = respondent_key(respondent_id)
+        if key is None:
+            return None
+        position = int(np.searchsorted(self.keys, key))
+        if position < len(self.keys) and self.keys[position] == key:
+            return int(self.order[position])
+        return None
+
+    def profile(self, respondent_id: str) -> Optional[str]:
+        text = self.texts.get(respondent_id)
+        if text is not None:
+            self.hits += 1
+            self.texts.move_to_end(respondent_id)
+            return text
+        row = self.row_of(respondent_id)
+        if row is None:
+            return None
+        self.misses += 1
+        text = render_profile(context_from_row({name: values[row] for name, values in self.columns.items()}))
+        self.texts[respondent_id] = text
+        if len(self.texts) > self.cache_size:
+            self.texts.popitem(last=False)
+        return text
+
+    def upcoming(self, count: int) -> List[Dict[str, Any]]:
+        # Picks work on a copy of the state, so peeking never moves the queue.
+        if len(self._upcoming) < count:
+            try:
+                batch = take_prerendered(self.prerender, self.state, count)
+            except RuntimeError:
+                batch = []
+            self._upcoming = [
+                {"respondent_id": respondent_id, "row": row, "text": text} for respondent_id, row, text, _, _ in batch
+            ]
+        return self._upcoming[:count]
+
+    def counts(self) -> Tuple[int, int]:
+        # Posted and still-queued respondents; both walk the whole bitmap, so
+        # they are worked out once per state change.
+        if self._counts is None:
+            rows, _ = self.prerender.scan(0, len(self.prerender))
+            used = self.state["used"]
+            self._counts = (len(used), sum(1 for row in rows if row not in used))
+        return self._counts
+
+    def stats(self) -> Dict[str, Any]:
+        posted, remaining = self.counts()
+        return {
+            "dataset": str(self.dataset_path),
+            "dataset_sha256": self.prerender.header["dataset"],
+            "respondents": len(self.keys),
+            "queue": len(self.prerender),
+            "posted": posted,
+            "remaining": remaining,
+            "cursor": self.state["cursor"],
+            "seed": self.state["rng_seed"],
+            "sampling": self.state["sampling"],
+            "last_post": self.state["last_post"],
+            "cache": {"size": len(self.texts), "capacity": self.cache_size, "hits": self.hits, "misses": self.misses},
+        }
+
+    def etag(self, target: str, with_state: bool) -> str:
+        # Profiles depend only on the dataset and the templates; the queue and
+        # the stats also change with every post.
+        parts: List[Any] = [self.dataset_fingerprint, self.template, target]
+        if with_state:
+            parts.append(self.state_fingerprint)
+        return f'"{combine(*parts)[:32]}"'
+
+
+def _json(status: int, payload: Any, etag: Optional[str] = None) -> Response:
+    headers = {"Content-Type": "application/json; charset=utf-8", "Cache-Control": "no-cache"}
+    if etag is not None:
+        headers["ETag"] = etag
+    return status, headers, json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def respond(index: PreviewIndex, method: str, target: str, headers: Mapping[str, str]) -> Response:
+    if method not in ("GET", "HEAD"):
+        return _json(HTTPStatus.METHOD_NOT_ALLOWED, {"error": "read-only"})
+    url = urlsplit(target)
+    path = url.path.rstrip("/") or "/"
+
+    if path.startswith("/profile/"):
+        respondent_id = unquote(path[len("/profile/") :])
+        text = index.profile(respondent_id)
+        if text is None:
+            return _json(HTTPStatus.NOT_FOUND, {"error": f"Respondent {respondent_id} not found."})
+        etag = index.etag(path, with_state=False)
+        if headers.get("if-none-match") == etag:
+            return HTTPStatus.NOT_MODIFIED, {"ETag": etag}, b""
+        return _json(HTTPStatus.OK, {"respondent_id": respondent_id, "text": text, "length": len(text)}, etag)
+
+    if path in ("/next", "/stats"):
+        query = parse_qs(url.query)
+        count = 1
+        if path == "/next":
+            try:
+                count = int(query.get("n", ["1"])[0])
+            except ValueError:
+                return _json(HTTPStatus.BAD_REQUEST, {"error": "n must be an integer."})
+            if not 1 <= count <= MAX_PEEK:
+                return _json(HTTPStatus.BAD_REQUEST, {"error": f"n must be between 1 and {MAX_PEEK}."})
+        if index.prerender is None:
+            return _json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": index.unavailable})
+        etag = index.etag(f"{path}?{count}", with_state=True)
+        if headers.get("if-none-match") == etag:
+            return HTTPStatus.NOT_MODIFIED, {"ETag": etag}, b""
+        payload = index.upcoming(count) if path == "/next" else index.stats()
+        return _json(HTTPStatus.OK, payload, etag)
+
+    return _json(HTTPStatus.NOT_FOUND, {"error": "Unknown path; try /profile/<id>, /next?n=20 or /stats."})
+
+
+class PreviewServer:
+    def __init__(self, index: PreviewIndex) -> None:
+        self.index = index
+        self.checked = 0.0
+        self._loading = False
+
+    async def refresh(self) -> None:
+        # Checking is a few stat calls on the loop. Reloading reads files, so
+        # it runs in a worker thread while requests are still answered from
+        # the current index. The result is swapped in on the loop, so no
+        # request ever sees a half-updated index.
+        now = time.monotonic()
+        if self._loading or now - self.checked < REFRESH_SECONDS:
+            return
+        self.checked = now
+        if not self.index.stale():
+            return
+        self._loading = True
+        try:
+            self.index.apply(await asyncio.to_thread(self.index.load))
+        finally:
+            self._loading = False
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                await self.refresh()
+                status, response_headers, body = respond(self.index, method, target, headers)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                # Anything but GET or HEAD may carry a body we do not read.
+                keep_alive = keep_alive and method in ("GET", "HEAD")
+                head = [f"HTTP/1.1 {int(status)} {HTTPStatus(status).phrase}"]
+                head += [f"{name}: {value}" for name, value in response_headers.items()]
+                head.append(f"Content-Length: {len(body)}")
+                head.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.Server:
+        await self.refresh()
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def serve_preview(index: PreviewIndex, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+    server = await PreviewServer(index).start(host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving previews on http://{address[0]}:{address[1]}/", flush=True)
+    async with server:
+        await server.serve_forever()
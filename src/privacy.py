@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+OTHER_LABEL = "Other"
+JOINT_KEY = "joint"
+
+# Quasi-identifiers that together are most likely to single out a respondent.
+DEFAULT_JOINT_FIELDS = ("age_bucket", "gender", "ethnicity", "urban_rural")
+
+
+def _as_categorical(df: pd.DataFrame, field: str) -> pd.Categorical:
+    column = df[field]
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype("category")
+        df[field] = column
+    return column.array
+
+
+def category_counts(df: pd.DataFrame, field: str) -> np.ndarray:
+    categorical = _as_categorical(df, field)
+    codes = np.asarray(categorical.codes)
+    return np.bincount(codes[codes >= 0], minlength=len(categorical.categories))
+
+
+def _remap_rare(categorical: pd.Categorical, rare: np.ndarray) -> pd.Categorical:
+    categories = list(categorical.categories)
+    kept = [category for category, is_rare in zip(categories, rare) if not is_rare]
+    if OTHER_LABEL not in kept:
+        kept.append(OTHER_LABEL)
+    positions = {category: position for position, category in enumerate(kept)}
+    other_code = positions[OTHER_LABEL]
+
+    remap = np.array(
+        [other_code if is_rare else positions[category] for category, is_rare in zip(categories, rare)] + [-1],
+        dtype=np.int32,
+    )
+    # Missing values carry code -1, which indexes the trailing -1 entry.
+    codes = remap[np.asarray(categorical.codes)]
+    return pd.Categorical.from_codes(codes, categories=pd.Index(kept, dtype=object))
+
+
+def apply_privacy_filter(df: pd.DataFrame, fields: List[str], min_cell: int) -> pd.DataFrame:
+    # Columns are replaced in place; the frame itself is never copied.
+    for field in fields:
+        counts = category_counts(df, field)
+        rare = (counts > 0) & (counts < min_cell)
+        if not rare.any():
+            continue
+        df[field] = pd.Series(_remap_rare(df[field].array, rare), index=df.index)
+    return df
+
+
+def _joint_codes(df: pd.DataFrame, fields: Sequence[str]) -> np.ndarray:
+    columns = []
+    for field in fields:
+        categorical = _as_categorical(df, field)
+        # Shift so missing (-1) becomes its own level 0.
+        columns.append((np.asarray(categorical.codes, dtype=np.int64) + 1, len(categorical.categories) + 1))
+
+    radix_product = 1
+    for _, radix in columns:
+        radix_product *= radix
+    if radix_product < 2**62:
+        keys = np.zeros(len(df), dtype=np.int64)
+        for codes, radix in columns:
+            keys = keys * radix + codes
+        return keys
+
+    # Too many combinations to pack into one integer; hash the rows instead.
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({index: codes for index, (codes, _) in enumerate(columns)}),
+        index=False,
+    ).to_numpy()
+
+
+def joint_cell_sizes(df: pd.DataFrame, fields: Sequence[str]) -> np.ndarray:
+    keys = _joint_codes(df, fields)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    return counts[inverse]
+
+
+def suppress_joint_cells(
+    df: pd.DataFrame,
+    fields: Sequence[str],
+    min_cell: int,
+    suppress: Optional[Sequence[str]] = None,
+) -> int:
+    if not fields or len(df) == 0:
+        return 0
+    sizes = joint_cell_sizes(df, fields)
+    small = sizes < min_cell
+    suppressed = int(small.sum())
+    if not suppressed:
+        return 0
+
+    for field in suppress if suppress is not None else fields:
+        categorical = _as_categorical(df, field)
+        codes = np.asarray(categorical.codes).copy()
+        codes[small] = -1
+        df[field] = pd.Series(
+            pd.Categorical.from_codes(codes, categories=categorical.categories),
+            index=df.index,
+        )
+    return suppressed
+
+
+def _unique_cells(columns: Sequence[np.ndarray], radices: Sequence[int]) -> Tuple[List[Tuple[int, ...]], np.ndarray]:
+    # Distinct rows of the code columns, and which of them each row is. Rows are
+    # packed into one integer key when the combinations fit, as in _joint_codes.
+    radix_product = 1
+    for radix in radices:
+        radix_product *= radix
+    if radix_product < 2**62:
+        keys = np.zeros(len(columns[0]), dtype=np.int64)
+        for codes, radix in zip(columns, radices):
+            keys = keys * radix + codes
+        unique, inverse = np.unique(keys, return_inverse=True)
+        cells = np.empty((len(unique), len(columns)), dtype=np.int64)
+        for position in range(len(columns) - 1, -1, -1):
+            unique, cells[:, position] = np.divmod(unique, radices[position])
+    else:
+        cells, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+    return [tuple(cell) for cell in cells.tolist()], inverse.reshape(-1)
+
+
+class CellCounts:
+    # The counts apply_privacy_filter and suppress_joint_cells take from a whole
+    # frame, accumulated chunk by chunk so a second pass can filter each chunk
+    # without holding the dataset in memory. Values get codes in the order they
+    # are first seen, so each chunk is counted with bincount, and joint cells
+    # are keyed by those codes plus one (0 for missing).
+    def __init__(self, fields: Sequence[str], joint_fields: Sequence[str] = ()) -> None:
+        self.fields = list(fields)
+        self.joint_fields = list(joint_fields)
+        self.labels: Dict[str, List[Any]] = {field: [] for field in dict.fromkeys([*self.fields, *self.joint_fields])}
+        self._codes: Dict[str, Dict[Any, int]] = {field: {} for field in self.labels}
+        self.counts: Dict[str, np.ndarray] = {field: np.zeros(0, dtype=np.int64) for field in self.fields}
+        self.joint: Counter = Counter()
+        self._sizes: Dict[int, Counter] = {}
+
+    def _code(self, field: str, value: Any) -> int:
+        codes = self._codes[field]
+        if value not in codes:
+            codes[value] = len(codes)
+            self.labels[field].append(value)
+        return codes[value]
+
+    def codes(self, df: pd.DataFrame, field: str) -> np.ndarray:
+        column = df[field]
+        categorical = column.array if isinstance(column.dtype, pd.CategoricalDtype) else pd.Categorical(column)
+        # Missing values carry code -1, which indexes the trailing -1 entry.
+        remap = np.array([self._code(field, value) for value in categorical.categories] + [-1], dtype=np.int64)
+        return remap[np.asarray(categorical.codes)]
+
+    def add(self, df: pd.DataFrame) -> None:
+        codes = {field: self.codes(df, field) for field in self.labels}
+        for field in self.fields:
+            counts = np.bincount(codes[field][codes[field] >= 0], minlength=len(self.labels[field]))
+            counts[: len(self.counts[field])] += self.counts[field]
+            self.counts[field] = counts
+        if self.joint_fields and len(df):
+            radices = [len(self.labels[field]) + 1 for field in self.joint_fields]
+            cells, inverse = _unique_cells([codes[field] + 1 for field in self.joint_fields], radices)
+            for cell, count in zip(cells, np.bincount(inverse, minlength=len(cells)).tolist()):
+                self.joint[cell] += count
+        self._sizes.clear()
+
+    def remap(self, field: str, min_cell: int) -> np.ndarray:
+        # Code -> code once rare values have become "Other"; the trailing entry
+        # keeps missing (-1) missing.
+        counts = self.counts.get(field, np.zeros(0, dtype=np.int64))
+        rare = np.flatnonzero((counts > 0) & (counts < min_cell))
+        other = self._code(field, OTHER_LABEL) if rare.size else -1
+        remap = np.append(np.arange(len(self.labels[field]), dtype=np.int64), -1)
+        remap[rare] = other
+        return remap
+
+    def joint_sizes(self, min_cell: int) -> Counter:
+        # Joint cells are counted after rare categories have become "Other".
+        if min_cell not in self._sizes:
+            remaps = [self.remap(field, min_cell) for field in self.joint_fields]
+            sizes: Counter = Counter()
+            for cell, count in self.joint.items():
+                sizes[tuple(int(remap[code - 1]) + 1 for code, remap in zip(cell, remaps))] += count
+            self._sizes[min_cell] = sizes
+        return self._sizes[min_cell]
+
+    def apply(self, df: pd.DataFrame, min_cell: int, joint_min_cell: Optional[int] = None) -> pd.DataFrame:
+        codes = {field: self.codes(df, field) for field in self.labels}
+        codes = {field: self.remap(field, min_cell)[field_codes] for field, field_codes in codes.items()}
+        changed = list(self.fields)
+
+        if self.joint_fields and joint_min_cell is not None and len(df):
+            sizes = self.joint_sizes(min_cell)
+            radices = [len(self.labels[field]) + 1 for field in self.joint_fields]
+            cells, inverse = _unique_cells([codes[field] + 1 for field in self.joint_fields], radices)
+            small = np.array([sizes[cell] < joint_min_cell for cell in cells], dtype=bool)[inverse]
+            if small.any():
+                for field in self.joint_fields:
+                    codes[field][small] = -1
+                changed.extend(field for field in self.joint_fields if field not in changed)
+
+        for field in changed:
+            categories = pd.Index(self.labels[field], dtype=object)
+            df[field] = pd.Series(pd.Categorical.from_codes(codes[field], categories=categories), index=df.index)
+        return df
+
+
+def _suppressed_rows(counts: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    # Rows that fall in a cell smaller than each threshold, from one sorted pass.
+    ordered = np.sort(counts[counts > 0])
+    cumulative = np.concatenate([[0], np.cumsum(ordered)])
+    return cumulative[np.searchsorted(ordered, thresholds, side="left")]
+
+
+def privacy_sweep(
+    df: pd.DataFrame,
+    fields: Iterable[str],
+    thresholds: Iterable[int],
+    joint_fields: Sequence[str] = (),
+) -> Dict[int, Dict[str, int]]:
+    thresholds_array = np.asarray(sorted(set(thresholds)), dtype=np.int64)
+    per_field = {field: _suppressed_rows(category_counts(df, field), thresholds_array) for field in fields}
+    if joint_fields:
+        _, counts = np.unique(_joint_codes(df, joint_fields), return_counts=True)
+        per_field[JOINT_KEY] = _suppressed_rows(counts, thresholds_array)
+
+    return {
+        int(threshold): {field: int(rows[position]) for field, rows in per_field.items()}
+        for position, threshold in enumerate(thresholds_array)
+    }
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from atproto import AsyncClient
+from atproto.exceptions import RateLimitExceededError
+from atproto_client.client.session import Session, SessionEvent
+from atproto_client.request import AsyncRequest
+
+from src.bsky_client import (
+    BACKOFF_BASE_SECONDS,
+    is_expired_session,
+    backoff_delay,
+    is_retryable,
+    load_session,
+    save_session,
+)
+from src.metrics import span
+from src.post import load_prerender, mark_taken, next_prerendered, selection_state
+from src.state import bind_dataset, load_state, record_post, save_state
+
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 3
+DEFAULT_CONCURRENCY = 2
+MAX_RETRIES = 5
+
+
+def _header_int(headers: Mapping[str, Any], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        while True:
+            now = self.clock()
+            self._refill(now)
+            wait = self.blocked_until - now
+            if wait <= 0:
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            await self.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+    def observe(self, headers: Mapping[str, Any]) -> None:
+        # The server's budget wins over the local estimate: never hold more
+        # tokens than it says remain, and wait out an exhausted window.
+        remaining = _header_int(headers, "ratelimit-remaining")
+        if remaining is None:
+            return
+        self._refill(self.clock())
+        self.tokens = min(self.tokens, float(remaining))
+        reset = _header_int(headers, "ratelimit-reset")
+        if remaining <= 0 and reset is not None:
+            self.pause(reset - self.wall_clock())
+
+
+@dataclass
+class PublishSummary:
+    requested: int = 0
+    posted: int = 0
+    failed: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    elapsed: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return self.posted / self.elapsed if self.elapsed > 0 else 0.0
+
+    def latency(self, quantile: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def format(self) -> str:
+        return (
+            f"posted={self.posted}/{self.requested} failed={self.failed} retries={self.retries} "
+            f"rate_limited={self.rate_limited} elapsed={self.elapsed:.2f}s throughput={self.throughput:.2f}/s "
+            f"latency_p50={self.latency(0.5) * 1000:.0f}ms latency_p95={self.latency(0.95) * 1000:.0f}ms "
+            f"latency_max={max(self.latencies, default=0.0) * 1000:.0f}ms"
+        )
+
+
+class AsyncPublisher:
+    def __init__(
+        self,
+        handle: str,
+        app_password: str,
+        bucket: TokenBucket,
+        session_path: Optional[Path] = None,
+        base_url: Optional[str] = None,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE_SECONDS,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.handle = handle
+        self.app_password = app_password
+        self.bucket = bucket
+        self.session_path = session_path
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.rng = rng
+        self.client: Optional[AsyncClient] = None
+        self.request: Optional[AsyncRequest] = None
+        self.did: Optional[str] = None
+        self.resumed = False
+        self._login_lock = asyncio.Lock()
+
+    def _on_session_change(self, event: SessionEvent, session: Session) -> None:
+        self.did = session.did
+        if self.session_path is not None and event != SessionEvent.IMPORT:
+            save_session(self.session_path, session.export())
+
+    async def _on_response(self, response: Any) -> None:
+        self.bucket.observe(response.headers)
+
+    async def login(self, fresh: bool = False) -> None:
+        # Logging in again keeps the connection pool; posts still in flight on
+        # the previous client finish on it.
+        if self.request is None:
+            self.request = AsyncRequest(event_hooks={"response": [self._on_response]})
+        self.client = AsyncClient(self.base_url, request=self.request)
+        self.client.on_session_change(self._on_session_change)
+        stored = None if fresh or self.session_path is None else load_session(self.session_path)
+        if stored is not None:
+            await self.client.login(session_string=stored, fetch_bsky_profile=False)
+            self.resumed = True
+            return
+        await self.client.login(self.handle, self.app_password, fetch_bsky_profile=False)
+        self.resumed = False
+
+    async def close(self) -> None:
+        if self.request is not None:
+            await self.request.close()
+        self.client = None
+        self.request = None
+
+    async def _relogin(self, stale: AsyncClient) -> None:
+        async with self._login_lock:
+            # Another in-flight post may already have replaced the session.
+            if self.client is stale and self.resumed:
+                await self.login(fresh=True)
+
+    async def post(self, text: str, summary: PublishSummary) -> str:
+        if self.client is None:
+            await self.login()
+
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            client = self.client
+            try:
+                response = await client.send_post(text, profile_identify=self.did)
+                return response.uri
+            except Exception as error:
+                if is_expired_session(error) and (self.resumed or client is not self.client):
+                    await self._relogin(client)
+                    continue
+                attempt += 1
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                delay = backoff_delay(attempt, error, base=self.backoff_base, rng=self.rng)
+                summary.retries += 1
+                if isinstance(error, RateLimitExceededError):
+                    # Hold every sender back, not just this one.
+                    summary.rate_limited += 1
+                    self.bucket.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+
+async def publish_batch(
+    dataset_path: Path,
+    state_path: Path,
+    count: int,
+    handle: str,
+    app_password: str,
+    session_path: Optional[Path] = None,
+    base_url: Optional[str] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate: float = DEFAULT_RATE,
+    burst: int = DEFAULT_BURST,
+    backoff_base: float = BACKOFF_BASE_SECONDS,
+) -> PublishSummary:
+    summary = PublishSummary(requested=count)
+    started = time.perf_counter()
+
+    state = load_state(state_path)
+    prerender = await asyncio.to_thread(load_prerender, dataset_path, state["rng_seed"], state["sampling"])
+    bind_dataset(state, prerender.header["ids"], prerender.positions_of, prerender.header.get("legacy_ids"))
+
+    publisher = AsyncPublisher(
+        handle,
+        app_password,
+        TokenBucket(rate, burst),
+        session_path=session_path,
+        base_url=base_url,
+        backoff_base=backoff_base,
+    )
+    queue: asyncio.Queue[Optional[Tuple[int, str, int, str, int, int]]] = asyncio.Queue(maxsize=2 * concurrency)
+    stop = asyncio.Event()
+
+    # Posts can finish out of order, so the cursor only moves over the
+    # contiguous run of finished picks; rows posted past a gap are still
+    # covered by the used bitmap.
+    cursors: Dict[int, int] = {}
+    finished: set[int] = set()
+    frontier = 0
+
+    async def produce() -> None:
+        # Selection reads from the pre-rendered file, so it runs in a thread
+        # and fills the queue while earlier posts are still in flight.
+        selection = selection_state(state)
+        for index in range(count):
+            if stop.is_set():
+                break
+            try:
+                respondent_id, row, text, signature = await asyncio.to_thread(next_prerendered, prerender, selection)
+            except RuntimeError:
+                if index == 0:
+                    summary.errors.append("No remaining candidates with sufficient fields.")
+                break
+            mark_taken(selection, row, signature)
+            await queue.put((index, respondent_id, row, text, signature, selection["cursor"]))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def consume() -> None:
+        nonlocal frontier
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if stop.is_set():
+                continue
+            index, respondent_id, row, text, signature, cursor = item
+            cursors[index] = cursor
+            sent = time.perf_counter()
+            try:
+                uri = await publisher.post(text, summary)
+            except Exception as error:
+                summary.failed += 1
+                summary.errors.append(f"{respondent_id}: {error}")
+                stop.set()
+                continue
+            summary.latencies.append(time.perf_counter() - sent)
+            summary.posted += 1
+
+            finished.add(index)
+            while frontier in finished:
+                state["cursor"] = max(state["cursor"], cursors.pop(frontier))
+                finished.discard(frontier)
+                frontier += 1
+            record_post(state_path, state, respondent_id, row, uri, text, signature)
+
+    try:
+        # Posts overlap, so only the sequential login gets its own span.
+        with span("login"):
+            await publisher.login()
+        await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    finally:
+        await publisher.close()
+        save_state(state_path, state)
+        summary.elapsed = time.perf_counter() - started
+    return summary
+
+
+def run_publish(*args: Any, **kwargs: Any) -> PublishSummary:
+    return asyncio.run(publish_batch(*args, **kwargs))
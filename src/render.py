@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.dataset import dataset_columns, iter_dataset, read_dataset, respondent_labels
+from src.features import PROFILE_FIELDS
+from src.templates import (
+    DEFAULT_WAVE,
+    MAX_POST_CHARS,
+    context_from_row,
+    profile_hashtag,
+    profile_prefix,
+    render_profile_details,
+)
+
+# Everything the text depends on: the profile and the wave it names.
+TEMPLATE_FIELDS = [*PROFILE_FIELDS, "wave"]
+RENDER_COLUMNS = ["respondent_id", *TEMPLATE_FIELDS]
+RESULT_COLUMNS = ("respondent_id", "wave", "text", "length", "truncated", "dropped_fields")
+# Below this many rows a process pool costs more to start than it saves.
+POOL_MIN_ROWS = 20000
+CHUNK_ROWS = 10000
+# Rows read per batch when rendering straight from the dataset file.
+STREAM_ROWS = 50000
+
+
+def rendered_path(dataset_path: Path) -> Path:
+    return dataset_path.with_suffix(".rendered.parquet")
+
+
+def render_chunk(df: pd.DataFrame) -> Dict[str, List[Any]]:
+    columns: Dict[str, List[Any]] = {name: [] for name in RESULT_COLUMNS[2:]}
+    # Zipping plain column lists is several times faster than to_dict("records")
+    # on arrow-backed string columns.
+    values = [df[name].tolist() for name in TEMPLATE_FIELDS]
+    for row in (dict(zip(TEMPLATE_FIELDS, row_values)) for row_values in zip(*values)):
+        rendered = render_profile_details(context_from_row(row))
+        columns["text"].append(rendered.text)
+        columns["length"].append(len(rendered.text))
+        columns["truncated"].append(rendered.truncated)
+        columns["dropped_fields"].append(list(rendered.dropped_fields))
+    return columns
+
+
+def distinct_profiles(df: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray, pd.DataFrame]:
+    source = df.reindex(columns=RENDER_COLUMNS)
+    # Datasets built before waves existed are all from the default release.
+    source["wave"] = source["wave"].fillna(DEFAULT_WAVE).astype(np.int16)
+    # The text depends only on the template fields, so each distinct combination
+    # is rendered once and broadcast back to its rows.
+    codes = source.groupby(TEMPLATE_FIELDS, dropna=False, sort=False).ngroup().to_numpy()
+    _, first = np.unique(codes, return_index=True)
+    return source, codes, source.iloc[first]
+
+
+def render_frame(df: pd.DataFrame, processes: Optional[int] = None) -> pd.DataFrame:
+    source, codes, unique = distinct_profiles(df)
+    processes = processes or os.cpu_count() or 1
+    chunks = [unique.iloc[start : start + CHUNK_ROWS] for start in range(0, len(unique), CHUNK_ROWS)]
+
+    if processes > 1 and len(unique) >= POOL_MIN_ROWS:
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as pool:
+            parts = list(pool.map(render_chunk, chunks))
+    else:
+        parts = [render_chunk(chunk) for chunk in chunks]
+
+    columns = {name: [value for part in parts for value in part[name]] for name in RESULT_COLUMNS[2:]}
+    return pd.DataFrame(
+        {
+            "respondent_id": respondent_labels(source["respondent_id"]),
+            "wave": source["wave"].to_numpy(),
+            "text": np.asarray(columns["text"], dtype=object)[codes],
+            "length": np.asarray(columns["length"], dtype=np.int32)[codes],
+            "truncated": np.asarray(columns["truncated"], dtype=np.int8)[codes],
+            "dropped_fields": [columns["dropped_fields"][code] for code in codes],
+        }
+    )
+
+
+def render_all(dataset_path: Path, output_path: Path, processes: Optional[int] = None) -> pd.DataFrame:
+    available = set(dataset_columns(dataset_path))
+    columns = [name for name in RENDER_COLUMNS if name in available]
+    rendered = render_frame(read_dataset(dataset_path, columns=columns), processes)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    rendered.to_parquet(output_path, index=False)
+    return rendered
+
+
+def render_rows(dataset_path: Path, rows: Any, batch_rows: int = STREAM_ROWS) -> Dict[int, str]:
+    # Texts for the given row positions. Row groups are small, so the wanted
+    # rows are gathered into batches of batch_rows; only a batch is ever held,
+    # and profiles already rendered in an earlier batch are reused.
+    available = set(dataset_columns(dataset_path))
+    columns = [name for name in RENDER_COLUMNS if name in available]
+    wanted = np.unique(np.asarray(rows, dtype=np.int64))
+    texts: Dict[int, str] = {}
+    rendered: Dict[Tuple[Any, ...], str] = {}
+    pending: List[pd.DataFrame] = []
+    positions: List[np.ndarray] = []
+
+    def flush() -> None:
+        _, codes, unique = distinct_profiles(pd.concat(pending, ignore_index=True))
+        values = unique[TEMPLATE_FIELDS].astype(object)
+        keys = list(zip(*(values[name].where(values[name].notna(), None).tolist() for name in TEMPLATE_FIELDS)))
+        fresh = [position for position, key in enumerate(keys) if key not in rendered]
+        if fresh:
+            rendered.update(zip((keys[position] for position in fresh), render_chunk(unique.iloc[fresh])["text"]))
+        batch_texts = np.array([rendered[key] for key in keys], dtype=object)[codes]
+        texts.update(zip(np.concatenate(positions).tolist(), batch_texts.tolist()))
+        pending.clear()
+        positions.clear()
+
+    start = 0
+    for batch in iter_dataset(dataset_path, batch_rows, columns=columns):
+        stop = start + len(batch)
+        picked = wanted[np.searchsorted(wanted, start) : np.searchsorted(wanted, stop)]
+        if picked.size:
+            pending.append(batch.iloc[picked - start])
+            positions.append(picked)
+            if sum(map(len, positions)) >= batch_rows:
+                flush()
+        start = stop
+    if pending:
+        flush()
+    return texts
+
+
+def audit(rendered: pd.DataFrame, max_chars: int = MAX_POST_CHARS) -> Dict[str, Any]:
+    dropped = rendered["dropped_fields"].explode().dropna()
+    # Rows with no field to describe render as just the prefix and hashtag.
+    bare_text = rendered["wave"].map(lambda wave: profile_prefix(wave) + profile_hashtag(wave))
+    return {
+        "rows": len(rendered),
+        "max_length": int(rendered["length"].max()) if len(rendered) else 0,
+        "over_limit": int((rendered["length"] > max_chars).sum()),
+        "truncated_rows": int((rendered["truncated"] > 0).sum()),
+        "bare": int((rendered["text"] == bare_text).sum()),
+        "dropped": {field: int(count) for field, count in dropped.value_counts().items()},
+    }
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.features import PROFILE_FIELDS, WEIGHT_SOURCE
+
+UNIFORM = "uniform"
+WEIGHTED = "weight"
+STRATA_PREFIX = "strata:"
+
+
+def parse_sampling(text: str) -> str:
+    scheme = text.strip()
+    if scheme in (UNIFORM, WEIGHTED):
+        return scheme
+    if scheme.startswith(STRATA_PREFIX) and scheme[len(STRATA_PREFIX) :] in PROFILE_FIELDS:
+        return scheme
+    choices = ", ".join([UNIFORM, WEIGHTED, *(STRATA_PREFIX + name for name in PROFILE_FIELDS)])
+    raise ValueError(f"Unknown sampling scheme {text!r}; expected one of {choices}.")
+
+
+def sampling_weights(df: pd.DataFrame, scheme: str) -> Optional[np.ndarray]:
+    # None means every respondent is equally likely.
+    if scheme == UNIFORM:
+        return None
+    if scheme == WEIGHTED:
+        if "weight" not in df.columns:
+            raise ValueError("Weighted sampling needs a dataset with a weight column; rebuild the dataset.")
+        weights = df["weight"].to_numpy(dtype=np.float64, na_value=np.nan)
+        usable = np.isfinite(weights) & (weights > 0)
+        # All-zero weights would quietly fall back to uniform order.
+        if len(df) and not usable.any():
+            raise ValueError(
+                f"Weighted sampling needs survey weights, but no respondent has a positive one; "
+                f"check that the release has the {WEIGHT_SOURCE!r} variable."
+            )
+        return np.where(usable, weights, 0.0)
+
+    # Balanced strata: each stratum, missing values included, gets equal total weight.
+    codes, _ = pd.factorize(df[scheme[len(STRATA_PREFIX) :]], use_na_sentinel=False)
+    return 1.0 / np.bincount(codes)[codes]
+
+
+def alias_table(weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Walker's alias table, built without a Python loop. Small columns (scaled
+    # weight below 1) are topped up from the large ones in order. A large
+    # column serves smalls until its surplus runs out, then becomes a small
+    # topped up by the next large. Both hand-offs follow from running totals:
+    # the deficits the smalls need and the surplus the larges give.
+    n = len(weights)
+    scaled = np.asarray(weights, dtype=np.float64) * (n / np.sum(weights))
+    prob = np.minimum(scaled, 1.0)
+    alias = np.arange(n)
+
+    small = np.flatnonzero(scaled < 1.0)
+    large = np.flatnonzero(scaled >= 1.0)
+    if not small.size or not large.size:
+        return np.ones(n), alias
+
+    needed = np.cumsum(1.0 - scaled[small])
+    given = np.cumsum(scaled[large] - 1.0)
+    before = np.concatenate([[0.0], needed[:-1]])
+    alias[small] = large[np.minimum(np.searchsorted(given, before, side="left"), large.size - 1)]
+
+    # Every large but the last runs dry once the total needed passes its
+    # running surplus; what it has left is its own probability.
+    passed = np.minimum(np.searchsorted(needed, given[:-1], side="right"), small.size - 1)
+    prob[large[:-1]] = np.clip(1.0 - (needed[passed] - given[:-1]), 0.0, 1.0)
+    alias[large[:-1]] = large[1:]
+    prob[large[-1]] = 1.0
+    return prob, alias
+
+
+def alias_draws(prob: np.ndarray, alias: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    columns = rng.integers(0, len(prob), size=count)
+    return np.where(rng.random(count) < prob[columns], columns, alias[columns])
+
+
+def weighted_order(weights: np.ndarray, seed: int) -> np.ndarray:
+    # Draws with replacement, keeping each position the first time it comes up:
+    # that is sampling without replacement in proportion to weight. The table
+    # is rebuilt over what is left after each batch, so batches stay productive.
+    rng = np.random.default_rng(seed)
+    remaining = np.flatnonzero(weights > 0)
+    taken = []
+    while remaining.size:
+        prob, alias = alias_table(weights[remaining])
+        draws = alias_draws(prob, alias, remaining.size, rng)
+        _, first = np.unique(draws, return_index=True)
+        picked = draws[np.sort(first)]
+        taken.append(remaining[picked])
+        remaining = np.delete(remaining, picked)
+    # Respondents without a usable weight come last, in seeded order.
+    unweighted = np.flatnonzero(~(weights > 0))
+    taken.append(unweighted[rng.permutation(unweighted.size)])
+    return np.concatenate(taken)
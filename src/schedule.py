@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+from typing import List, Optional, Tuple
+
+# What to do about slots that passed while the daemon was down or busy:
+# skip them, post once for all of them, or post once per slot.
+CATCH_UP_POLICIES = ("skip", "latest", "all")
+DEFAULT_SLOTS = "00:00,12:00"
+# A slot still counts as on time this long after it (plus any jitter).
+LATE_GRACE_SECONDS = 60.0
+# Posts made at once under "all", however long the daemon was away.
+MAX_CATCH_UP = 4
+
+
+def parse_slots(text: str) -> Tuple[time, ...]:
+    slots = set()
+    for value in text.split(","):
+        hour, sep, minute = value.strip().partition(":")
+        if not sep or not hour.isdigit() or not minute.isdigit() or int(hour) > 23 or int(minute) > 59:
+            raise ValueError(f"Slots are comma-separated UTC times like 00:00,12:00; got {value.strip()!r}.")
+        slots.add(time(int(hour), int(minute)))
+    return tuple(sorted(slots))
+
+
+@dataclass(frozen=True)
+class Schedule:
+    slots: Tuple[time, ...]
+    jitter: float = 0.0
+    catch_up: str = "latest"
+
+    def __post_init__(self) -> None:
+        if not self.slots:
+            raise ValueError("A schedule needs at least one slot.")
+        if self.catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy {self.catch_up!r}; expected one of {', '.join(CATCH_UP_POLICIES)}.")
+
+    def _day(self, day: datetime) -> List[datetime]:
+        return [datetime.combine(day.date(), slot, tzinfo=timezone.utc) for slot in self.slots]
+
+    def next_slot(self, after: datetime) -> datetime:
+        day = after
+        while True:
+            for moment in self._day(day):
+                if moment > after:
+                    return moment
+            day += timedelta(days=1)
+
+    def due(self, since: datetime, now: datetime) -> List[datetime]:
+        # Slots in (since, now], oldest first.
+        slots: List[datetime] = []
+        day = since
+        while day.date() <= now.date():
+            slots.extend(moment for moment in self._day(day) if since < moment <= now)
+            day += timedelta(days=1)
+        return slots
+
+    def owed(self, due: List[datetime], now: datetime) -> int:
+        if not due:
+            return 0
+        if self.catch_up == "all":
+            return min(len(due), MAX_CATCH_UP)
+        late = (now - due[-1]).total_seconds() > self.jitter + LATE_GRACE_SECONDS
+        if self.catch_up == "skip" and late:
+            return 0
+        return 1
+
+    def delay(self, slot: datetime, now: datetime, rng: Optional[random.Random] = None) -> float:
+        # Jitter only ever delays a post, so a slot is never taken early.
+        offset = (rng or random).uniform(0, self.jitter) if self.jitter > 0 else 0.0
+        return max(0.0, (slot - now).total_seconds()) + offset
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import random
+
+import numpy as np
+import pandas as pd
+
+from src.features import PROFILE_FIELDS
+from src.sampling import UNIFORM, sampling_weights, weighted_order
+
+MIN_FIELDS = 3
+
+
+def build_queue(ids: pd.Series, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    queue = [str(value) for value in ids.dropna().unique().tolist()]
+    rng.shuffle(queue)
+    return queue
+
+
+def row_field_count(row: pd.Series) -> int:
+    count = 0
+    for field in PROFILE_FIELDS:
+        value = row.get(field)
+        if value is None or value == "":
+            continue
+        if pd.isna(value):
+            continue
+        count += 1
+    return count
+
+
+def field_counts(df: pd.DataFrame) -> np.ndarray:
+    profile = df.reindex(columns=PROFILE_FIELDS)
+    present = profile.notna() & profile.ne("")
+    return present.sum(axis=1).to_numpy()
+
+
+def eligible_queue(df: pd.DataFrame, seed: int, sampling: str = UNIFORM) -> list[str]:
+    # The pre-rendered queue: respondents with enough profile fields, in seeded
+    # (optionally weighted) order. Posting walks it with src.post.next_prerendered.
+    ids = df["respondent_id"].astype(str)
+    eligible = field_counts(df) >= MIN_FIELDS
+    if sampling == UNIFORM:
+        first = ~ids.duplicated().to_numpy() & ids.notna().to_numpy()
+        position = dict(zip(ids[first], np.flatnonzero(first).tolist()))
+        return [respondent_id for respondent_id in build_queue(ids, seed) if eligible[position[respondent_id]]]
+
+    rows = np.flatnonzero(eligible)
+    weights = sampling_weights(df.iloc[rows], sampling)
+    return ids.to_numpy()[rows[weighted_order(weights, seed)]].tolist()
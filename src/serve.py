@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import random
+import signal
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.bsky_client import BlueskyClient
+from src.cache import file_fingerprint
+from src.post import load_prerender, next_prerendered
+from src.prerender import Prerender, prerender_path
+from src.schedule import Schedule
+from src.state import bind_dataset, load_state, record_post, save_state
+
+# The daemon keeps the state, the pre-rendered queue and a logged-in client
+# between posts, so each slot costs one record read and one request.
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _log(message: str) -> None:
+    print(f"{utc_now().isoformat(timespec='seconds')} {message}", flush=True)
+
+
+class Daemon:
+    def __init__(
+        self,
+        dataset_path: Path,
+        state_path: Path,
+        schedule: Schedule,
+        client: BlueskyClient,
+        clock: Callable[[], datetime] = utc_now,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.dataset_path = dataset_path
+        self.state_path = state_path
+        self.schedule = schedule
+        self.client = client
+        self.clock = clock
+        self.rng = rng
+        self.state: Dict[str, Any] = load_state(state_path)
+        self.prerender: Optional[Prerender] = None
+        self.fingerprint: Tuple[Tuple[int, int, int], ...] = ()
+        self.posted = 0
+
+    def reload_if_changed(self) -> bool:
+        # The posts file is read record by record, so a rebuild underneath an
+        # open queue would be read with stale offsets; reopen it first.
+        paths = (self.dataset_path, prerender_path(self.dataset_path))
+        fingerprint = file_fingerprint(*paths)
+        if self.prerender is not None and fingerprint == self.fingerprint:
+            return False
+        if self.prerender is not None:
+            _log(f"reloading {self.dataset_path}")
+        self.prerender = load_prerender(self.dataset_path, self.state["rng_seed"], self.state["sampling"])
+        legacy_ids = self.prerender.header.get("legacy_ids")
+        if bind_dataset(self.state, self.prerender.header["ids"], self.prerender.positions_of, legacy_ids):
+            save_state(self.state_path, self.state)
+        self.fingerprint = file_fingerprint(*paths)
+        return True
+
+    def post(self) -> str:
+        self.reload_if_changed()
+        respondent_id, row, text, signature = next_prerendered(self.prerender, self.state)
+        uri = self.client.post(text)
+        # The journal record is fsynced before this returns.
+        record_post(self.state_path, self.state, respondent_id, row, uri, text, signature)
+        self.posted += 1
+        _log(f"posted {respondent_id} {uri}")
+        return uri
+
+    def last_slot(self) -> datetime:
+        # Slots after the last post are the ones still owed.
+        last_post = self.state.get("last_post") or {}
+        if not last_post.get("timestamp"):
+            return self.clock()
+        timestamp = datetime.fromisoformat(last_post["timestamp"])
+        return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+    def run(self, stop: threading.Event, wait: Optional[Callable[[float], bool]] = None) -> None:
+        wait = wait or stop.wait
+        self.reload_if_changed()
+        self.client.login()
+        since = self.last_slot()
+        while not stop.is_set():
+            now = self.clock()
+            due = self.schedule.due(since, now)
+            if due:
+                since = due[-1]
+                for _ in range(self.schedule.owed(due, now)):
+                    try:
+                        self.post()
+                    except Exception as error:
+                        _log(f"error: {type(error).__name__}: {error}")
+                        break
+                continue
+            slot = self.schedule.next_slot(since)
+            if wait(self.schedule.delay(slot, now, self.rng)):
+                break
+
+    def close(self) -> None:
+        save_state(self.state_path, self.state)
+
+
+def serve(daemon: Daemon) -> None:
+    stop = threading.Event()
+
+    def request_stop(signum: int, frame: Any) -> None:
+        stop.set()
+
+    previous = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        daemon.run(stop)
+    finally:
+        # Fold the journal into the snapshot on the way out.
+        daemon.close()
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        _log(f"stopped after {daemon.posted} posts")
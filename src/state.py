@@ -1,29 +1,239 @@
 from __future__ import annotations
 
+import base64
+import hashlib
 import json
+import os
+import zlib
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from src.diversity import DEFAULT_WINDOW, remember
+
+STATE_VERSION = 2
 
 DEFAULT_STATE = {
-    "used_ids": [],
-    "queue": [],
-    "queue_index": 0,
+    "version": STATE_VERSION,
     "rng_seed": 1337,
+    # How the queue orders respondents: "uniform", "weight" or "strata:<field>".
+    "sampling": "uniform",
+    # Fingerprint of the respondent order that `used` row positions refer to.
+    "dataset": None,
+    "cursor": 0,
+    "used": "",
     "last_post": None,
+    # Sequence number of the last journal record folded into this snapshot.
+    "seq": 0,
+    # Profile signatures of the latest posts; a candidate matching one of them
+    # is passed over. A window of 0 turns the check off.
+    "recent": [],
+    "diversity_window": DEFAULT_WINDOW,
 }
 
+# Fold the journal into a fresh snapshot once it grows past this size.
+COMPACT_BYTES = 16 * 1024
+
+# Keys only found in the original state.json layout.
+LEGACY_KEYS = ("used_ids", "queue", "queue_index", "post_cursor")
+
+
+class UsedBitmap:
+    def __init__(self, data: bytes = b"") -> None:
+        self.bits = bytearray(data)
+
+    @classmethod
+    def decode(cls, encoded: str) -> "UsedBitmap":
+        if not encoded:
+            return cls()
+        return cls(zlib.decompress(base64.b64decode(encoded)))
+
+    def encode(self) -> str:
+        if not any(self.bits):
+            return ""
+        return base64.b64encode(zlib.compress(bytes(self.bits), 9)).decode("ascii")
+
+    def add(self, position: int) -> None:
+        byte, bit = divmod(position, 8)
+        if byte >= len(self.bits):
+            self.bits.extend(b"\x00" * (byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << bit
+
+    def __contains__(self, position: int) -> bool:
+        byte, bit = divmod(position, 8)
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << bit))
+
+    def __len__(self) -> int:
+        return sum(bin(value).count("1") for value in self.bits)
+
+
+def _migrate(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Version 1 stored the whole shuffled queue and a list of used ids. The queue
+    # is now re-derived from the seed, and used ids can only be turned into row
+    # positions once the dataset is known, so keep them aside until bind_dataset.
+    migrated = {key: value for key, value in data.items() if key not in LEGACY_KEYS}
+    migrated["version"] = STATE_VERSION
+    migrated["cursor"] = data.get("post_cursor", 0)
+    used_ids = [str(value) for value in data.get("used_ids", [])]
+    if used_ids:
+        migrated["pending_used_ids"] = used_ids
+    return migrated
+
+
+def journal_path(path: Path) -> Path:
+    return path.with_suffix(path.suffix + ".log")
+
+
+def _encode_record(record: Dict[str, Any]) -> bytes:
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def read_journal(path: Path) -> Iterator[Dict[str, Any]]:
+    log_path = journal_path(path)
+    if not log_path.exists():
+        return
+    with log_path.open("rb") as f:
+        for line in f:
+            # A crash can leave a partial last line; stop at the first record
+            # that is unterminated or fails its checksum.
+            if not line.endswith(b"\n"):
+                return
+            checksum, _, payload = line.rstrip(b"\n").partition(b" ")
+            try:
+                valid = int(checksum, 16) == zlib.crc32(payload)
+            except ValueError:
+                valid = False
+            if not valid:
+                return
+            yield json.loads(payload)
+
+
+def apply_record(state: Dict[str, Any], record: Dict[str, Any]) -> None:
+    state["used"].add(record["row"])
+    state["cursor"] = max(state.get("cursor", 0), record["cursor"])
+    state["last_post"] = {
+        "timestamp": record["ts"],
+        "uri": record["uri"],
+        "respondent_id": record["id"],
+        "text_sha256": record["sha"],
+    }
+    state["seq"] = record["seq"]
+    # Records written before signatures existed leave the ring as it is.
+    if "sig" in record:
+        remember(state, record["sig"])
+
 
 def load_state(path: Path) -> Dict[str, Any]:
-    if not path.exists():
-        return DEFAULT_STATE.copy()
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    data: Dict[str, Any] = {}
+    if path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    if data.get("version", 1) < STATE_VERSION:
+        data = _migrate(data)
     merged = DEFAULT_STATE.copy()
     merged.update(data)
+    merged["used"] = UsedBitmap.decode(merged["used"]) if isinstance(merged["used"], str) else merged["used"]
+
+    for record in read_journal(path):
+        if record["seq"] > merged["seq"]:
+            apply_record(merged, record)
     return merged
 
 
+def dump_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    data = dict(state)
+    if isinstance(data.get("used"), UsedBitmap):
+        data["used"] = data["used"].encode()
+    return data
+
+
+def _fsync_directory(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:  # pragma: no cover - platform-dependent
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # pragma: no cover - platform-dependent
+        pass
+    finally:
+        os.close(fd)
+
+
 def save_state(path: Path, state: Dict[str, Any]) -> None:
+    # Write the snapshot to a temp file and rename it over the old one, so a
+    # crash leaves either the previous snapshot or the new one, never a mix.
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2, ensure_ascii=False)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(dump_state(state), f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(path.parent)
+
+    # Every journal record is now in the snapshot (records carry seq numbers,
+    # so replaying a log left behind by a crash here is harmless).
+    log_path = journal_path(path)
+    if log_path.exists():
+        log_path.unlink()
+
+
+def record_post(
+    path: Path,
+    state: Dict[str, Any],
+    respondent_id: str,
+    row: int,
+    uri: str,
+    text: str,
+    signature: Optional[int] = None,
+    compact_bytes: int = COMPACT_BYTES,
+) -> None:
+    record = {
+        "seq": state.get("seq", 0) + 1,
+        "id": respondent_id,
+        "row": row,
+        "cursor": state.get("cursor", 0),
+        "uri": uri,
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "sha": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+    }
+    if signature is not None:
+        record["sig"] = signature
+    if not path.exists():
+        save_state(path, state)
+
+    log_path = journal_path(path)
+    with log_path.open("ab") as f:
+        f.write(_encode_record(record))
+        f.flush()
+        os.fsync(f.fileno())
+    apply_record(state, record)
+
+    if log_path.stat().st_size >= compact_bytes:
+        save_state(path, state)
+
+
+def bind_dataset(
+    state: Dict[str, Any],
+    fingerprint: str,
+    positions_of: Callable[[Iterable[str]], Dict[str, int]],
+    legacy_fingerprint: Optional[str] = None,
+) -> bool:
+    # Returns True when the snapshot on disk needs rewriting (first bind or migration).
+    used: UsedBitmap = state["used"]
+    if state.get("dataset") not in (None, fingerprint, legacy_fingerprint) and len(used):
+        raise RuntimeError(
+            "State was recorded against a different respondent order; "
+            "rebuild the original dataset or reset state/state.json."
+        )
+    changed = state.get("dataset") != fingerprint
+    state["dataset"] = fingerprint
+
+    pending = state.pop("pending_used_ids", None)
+    if pending:
+        for position in positions_of(pending).values():
+            used.add(position)
+        changed = True
+    return changed
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyreadstat
+
+from src.features import ID_SOURCE, WEIGHT_SOURCE
+
+# Roughly the number of respondents in the 2023 release; scale 1 produces this many rows.
+BASE_ROWS = 4000
+# The release has hundreds of variables the pipeline never reads; filler columns
+# keep column projection honest.
+EXTRA_COLUMNS = 40
+
+
+@dataclass(frozen=True)
+class CodedVariable:
+    label: str
+    # Share of respondents per code; renormalised after the missing share.
+    weights: Dict[int, float]
+    value_labels: Dict[int, str] = field(default_factory=dict)
+    # Share left as system missing (Stata ".").
+    missing: float = 0.0
+
+
+def _age_weights() -> Dict[int, float]:
+    ages = np.arange(18, 96)
+    weights = np.exp(-0.5 * ((ages - 50) / 19) ** 2)
+    return {int(age): float(weight) for age, weight in zip(ages, weights / weights.sum())}
+
+
+def _scale_weights() -> Dict[int, float]:
+    shares = (0.02, 0.02, 0.05, 0.09, 0.10, 0.22, 0.12, 0.12, 0.08, 0.03, 0.03)
+    weights = {score: share for score, share in enumerate(shares)}
+    weights[99] = 0.13
+    return weights
+
+
+NZES_VARIABLES: Dict[str, CodedVariable] = {
+    "H1": CodedVariable(
+        "Gender",
+        {1: 0.48, 2: 0.51, 3: 0.01},
+        {1: "1. Male", 2: "2. Female", 3: "3. Another gender"},
+        missing=0.01,
+    ),
+    "H3c": CodedVariable("Age in years", _age_weights(), missing=0.02),
+    "methnic": CodedVariable(
+        "Ethnicity (prioritised)",
+        {1: 0.66, 2: 0.13, 3: 0.05, 4: 0.12, 5: 0.02, 9: 0.02},
+        {1: "European", 2: "Māori", 3: "Pacific", 4: "Asian", 5: "Other ethnicity", 9: "Unknown"},
+    ),
+    "meducate": CodedVariable(
+        "Highest qualification",
+        {1: 0.16, 2: 0.09, 3: 0.17, 4: 0.26, 5: 0.30, 6: 0.02},
+        {
+            1: "1. No Formal",
+            2: "2. Level 1",
+            3: "3. Level 2 or 3",
+            4: "4. Level 4",
+            5: "5. University",
+            6: "6. Unclassfied",
+        },
+        missing=0.03,
+    ),
+    "H22": CodedVariable(
+        "Housing tenure",
+        {1: 0.30, 2: 0.33, 3: 0.20, 4: 0.04, 5: 0.07, 6: 0.01, 7: 0.05},
+        {
+            1: "1. Own your house or flat mortgage free",
+            2: "2. Own your house or flat with a mortgage",
+            3: "3. Rent your house or flat privately",
+            4: "4. Rent a house or flat with a group of individuals",
+            5: "5. Live at your parents' or other family members' home",
+            6: "6. Board or live in a hotel / hostel / rest home / temporary housing",
+            7: "7. Rent a house or flat from Kāinga Ora: Home and Communities, a local authority or trust",
+        },
+        missing=0.02,
+    ),
+    "murbrur": CodedVariable(
+        "Urban/rural classification",
+        {111: 0.38, 112: 0.18, 113: 0.14, 221: 0.11, 222: 0.08, 223: 0.05, 224: 0.04, 225: 0.02},
+        {
+            111: "Major urban area",
+            112: "Large urban area",
+            113: "Medium urban area",
+            221: "Small urban area",
+            222: "Rural settlement",
+            223: "Rural other",
+            224: "Inland water",
+            225: "Remote",
+        },
+        missing=0.01,
+    ),
+    "mvpartyvote": CodedVariable(
+        "Party vote",
+        {1: 0.24, 2: 0.31, 3: 0.10, 4: 0.08, 5: 0.06, 6: 0.03, 7: 0.02, 8: 0.02, 9: 0.10, 98: 0.03, 99: 0.01},
+        {
+            1: "Labour",
+            2: "National",
+            3: "Green",
+            4: "ACT",
+            5: "NZ First",
+            6: "Maori",
+            7: "TOP",
+            8: "Other party",
+            9: "Nonvote",
+            98: "DK",
+            99: "Missing",
+        },
+    ),
+    "B6": CodedVariable(
+        "Left-right self-placement",
+        _scale_weights(),
+        {0: "0. Left", 10: "10. Right", 99: "99. Don't know"},
+        missing=0.01,
+    ),
+}
+
+
+def _draw(variable: CodedVariable, rows: int, rng: np.random.Generator) -> np.ndarray:
+    codes = np.fromiter(variable.weights, dtype=np.float64)
+    weights = np.fromiter(variable.weights.values(), dtype=np.float64)
+    values = rng.choice(codes, size=rows, p=weights / weights.sum())
+    if variable.missing:
+        values[rng.random(rows) < variable.missing] = np.nan
+    return values
+
+
+def generate(
+    scale: float = 1.0,
+    seed: int = 0,
+    extra_columns: int = EXTRA_COLUMNS,
+) -> Tuple[pd.DataFrame, Dict[str, Dict[int, str]], Dict[str, str]]:
+    rows = max(1, int(round(BASE_ROWS * scale)))
+    rng = np.random.default_rng(seed)
+
+    data: Dict[str, np.ndarray] = {ID_SOURCE: np.arange(1, rows + 1, dtype=np.float64)}
+    variable_labels = {ID_SOURCE: "Case ID"}
+    value_labels: Dict[str, Dict[int, str]] = {}
+    for name, variable in NZES_VARIABLES.items():
+        data[name] = _draw(variable, rows, rng)
+        variable_labels[name] = variable.label
+        if variable.value_labels:
+            value_labels[name] = dict(variable.value_labels)
+
+    likert = CodedVariable("", {1: 0.1, 2: 0.2, 3: 0.4, 4: 0.2, 5: 0.1}, missing=0.05)
+    for position in range(1, extra_columns + 1):
+        name = f"Q{position:03d}"
+        data[name] = _draw(likert, rows, rng)
+        variable_labels[name] = f"Filler question {position}"
+
+    # Younger respondents answer less often, so a real release weights them up.
+    # Drawn last so the variables above do not change with it.
+    age = np.nan_to_num(data["H3c"], nan=50.0)
+    weight = np.exp((50.0 - age) / 40.0) * rng.lognormal(0.0, 0.25, rows)
+    data[WEIGHT_SOURCE] = weight / weight.mean()
+    variable_labels[WEIGHT_SOURCE] = "Survey weight"
+
+    return pd.DataFrame(data), value_labels, variable_labels
+
+
+def synthetic_stem(scale: float) -> str:
+    return f"nzes_synthetic_{scale:g}x"
+
+
+def write_synthetic(
+    directory: Path,
+    scale: float = 1.0,
+    seed: int = 0,
+    extra_columns: int = EXTRA_COLUMNS,
+    parquet: bool = True,
+) -> Tuple[Path, Optional[Path]]:
+    df, value_labels, variable_labels = generate(scale, seed, extra_columns)
+    directory.mkdir(parents=True, exist_ok=True)
+    dta_path = directory / f"{synthetic_stem(scale)}.dta"
+    pyreadstat.write_dta(
+        df,
+        str(dta_path),
+        column_labels=[variable_labels[name] for name in df.columns],
+        variable_value_labels=value_labels,
+    )
+    parquet_path = None
+    if parquet:
+        parquet_path = dta_path.with_suffix(".parquet")
+        df.to_parquet(parquet_path, index=False)
+    return dta_path, parquet_path
@@ -1,10 +1,53 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 import math
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 MAX_POST_CHARS = 300
+# Release year used when a row carries no wave (datasets built before waves).
+DEFAULT_WAVE = 2023
+# Distinct values per sentence group are few, so this bound is rarely reached.
+SENTENCE_CACHE_SIZE = 4096
+
+EDUCATION_PHRASES = {
+    "No Formal": "no formal qualifications",
+    "Level 1": "Level 1 qualifications",
+    "Level 2 or 3": "Level 2 or 3 qualifications",
+    "Level 4": "Level 4 qualifications",
+    "University": "a university qualification",
+    "Unclassfied": "an unclassified qualification",
+}
+
+HOUSING_PHRASES = {
+    "Own your house or flat mortgage free": "own their home mortgage-free",
+    "Own your house or flat with a mortgage": "own their home with a mortgage",
+    "Rent your house or flat privately": "rent privately",
+    "Rent a house or flat with a group of individuals": "rent with others",
+    "Live at your parents' or other family members' home": "live with family",
+    "Board or live in a hotel / hostel / rest home / temporary housing": "board or live in temporary housing",
+    "Rent a house or flat from Kāinga Ora: Home and Communities, a local authority or trust": "rent from Kāinga Ora or a public provider",
+}
+
+PARTY_VOTE_PHRASES = {
+    "Nonvote": "did not cast a party vote",
+    "Maori": "voted for Te Pāti Māori",
+}
+
+SentenceGroup = Tuple[Tuple[str, ...], str]
+
+
+def profile_prefix(wave: int = DEFAULT_WAVE) -> str:
+    return f"NZES {wave} profile."
+
+
+def profile_hashtag(wave: int = DEFAULT_WAVE) -> str:
+    return f" #NZES{wave}"
+
+
+PREFIX = profile_prefix()
+HASHTAG = profile_hashtag()
 
 
 @dataclass
@@ -18,6 +61,7 @@ class TemplateContext:
     urban_rural: Optional[str]
     party_vote: Optional[str]
     ideology: Optional[str]
+    wave: Optional[int] = None
 
 
 def _clean_value(value: Optional[str]) -> Optional[str]:
@@ -30,6 +74,12 @@ def _clean_value(value: Optional[str]) -> Optional[str]:
     return value
 
 
+def _wave_year(value: Any) -> int:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return DEFAULT_WAVE
+    return int(value)
+
+
 def _join_phrases(phrases: List[str]) -> str:
     if len(phrases) == 1:
         return phrases[0]
@@ -55,42 +105,21 @@ def _normalize_education(value: Optional[str]) -> Optional[str]:
     cleaned = _clean_value(value)
     if cleaned is None:
         return None
-    mapping = {
-        "No Formal": "no formal qualifications",
-        "Level 1": "Level 1 qualifications",
-        "Level 2 or 3": "Level 2 or 3 qualifications",
-        "Level 4": "Level 4 qualifications",
-        "University": "a university qualification",
-        "Unclassfied": "an unclassified qualification",
-    }
-    return mapping.get(cleaned, cleaned)
+    return EDUCATION_PHRASES.get(cleaned, cleaned)
 
 
 def _normalize_housing(value: Optional[str]) -> Optional[str]:
     cleaned = _clean_value(value)
     if cleaned is None:
         return None
-    mapping = {
-        "Own your house or flat mortgage free": "own their home mortgage-free",
-        "Own your house or flat with a mortgage": "own their home with a mortgage",
-        "Rent your house or flat privately": "rent privately",
-        "Rent a house or flat with a group of individuals": "rent with others",
-        "Live at your parents' or other family members' home": "live with family",
-        "Board or live in a hotel / hostel / rest home / temporary housing": "board or live in temporary housing",
-        "Rent a house or flat from Kāinga Ora: Home and Communities, a local authority or trust": "rent from Kāinga Ora or a public provider",
-    }
-    return mapping.get(cleaned, cleaned)
+    return HOUSING_PHRASES.get(cleaned, cleaned)
 
 
 def _normalize_party_vote(value: Optional[str]) -> Optional[str]:
     cleaned = _clean_value(value)
     if cleaned is None:
         return None
-    mapping = {
-        "Nonvote": "did not cast a party vote",
-        "Maori": "voted for Te Pāti Māori",
-    }
-    return mapping.get(cleaned, f"voted for {cleaned}")
+    return PARTY_VOTE_PHRASES.get(cleaned, f"voted for {cleaned}")
 
 
 def _normalize_ideology(value: Optional[str]) -> Optional[str]:
@@ -100,69 +129,134 @@ def _normalize_ideology(value: Optional[str]) -> Optional[str]:
     return cleaned
 
 
-def build_sentences(context: TemplateContext) -> List[str]:
-    sentences: List[str] = []
-
-    intro_parts: List[str] = []
-    if _clean_value(context.age_bucket):
-        intro_parts.append(f"aged {context.age_bucket}")
-    gender = _normalize_gender(context.gender)
+@lru_cache(maxsize=SENTENCE_CACHE_SIZE)
+def _intro_sentence(age_bucket: Any, gender: Any, ethnicity: Any) -> Optional[SentenceGroup]:
+    fields: List[str] = []
+    parts: List[str] = []
+    if age_bucket:
+        fields.append("age_bucket")
+        parts.append(f"aged {age_bucket}")
+    gender = _normalize_gender(gender)
     if gender:
-        intro_parts.append(f"identifies as {gender}")
-    if _clean_value(context.ethnicity):
-        intro_parts.append(f"reports {context.ethnicity} ethnicity")
-    if intro_parts:
-        sentences.append(f"This respondent is {_join_phrases(intro_parts)}.")
-
-    living_parts: List[str] = []
-    education = _normalize_education(context.education)
+        fields.append("gender")
+        parts.append(f"identifies as {gender}")
+    if ethnicity:
+        fields.append("ethnicity")
+        parts.append(f"reports {ethnicity} ethnicity")
+    if not parts:
+        return None
+    return tuple(fields), f"This respondent is {_join_phrases(parts)}."
+
+
+@lru_cache(maxsize=SENTENCE_CACHE_SIZE)
+def _living_sentence(education: Any, housing: Any, urban_rural: Any) -> Optional[SentenceGroup]:
+    fields: List[str] = []
+    parts: List[str] = []
+    education = _normalize_education(education)
     if education:
-        living_parts.append(f"have {education}")
-    housing = _normalize_housing(context.housing)
+        fields.append("education")
+        parts.append(f"have {education}")
+    housing = _normalize_housing(housing)
     if housing:
-        living_parts.append(housing)
-    if _clean_value(context.urban_rural):
-        article = _article(context.urban_rural)
-        living_parts.append(f"live in {article} {context.urban_rural} area")
-    if living_parts:
-        sentences.append(f"They {_join_phrases(living_parts)}.")
+        fields.append("housing")
+        parts.append(housing)
+    if urban_rural:
+        fields.append("urban_rural")
+        parts.append(f"live in {_article(urban_rural)} {urban_rural} area")
+    if not parts:
+        return None
+    return tuple(fields), f"They {_join_phrases(parts)}."
+
 
-    party_vote = _normalize_party_vote(context.party_vote)
-    if party_vote:
-        if party_vote.startswith("did not"):
-            sentences.append(f"They {party_vote} in 2023.")
-        else:
-            sentences.append(f"They {party_vote} in 2023.")
+@lru_cache(maxsize=SENTENCE_CACHE_SIZE)
+def _vote_sentence(party_vote: Any, wave: int) -> Optional[SentenceGroup]:
+    party_vote = _normalize_party_vote(party_vote)
+    if not party_vote:
+        return None
+    return ("party_vote",), f"They {party_vote} in {wave}."
 
-    ideology = _normalize_ideology(context.ideology)
-    if ideology:
-        sentences.append(f"On the left-right scale they place themselves on the {ideology}.")
 
-    return sentences
+@lru_cache(maxsize=SENTENCE_CACHE_SIZE)
+def _ideology_sentence(ideology: Any) -> Optional[SentenceGroup]:
+    ideology = _normalize_ideology(ideology)
+    if not ideology:
+        return None
+    return ("ideology",), f"On the left-right scale they place themselves on the {ideology}."
 
 
-def render_profile(context: TemplateContext, max_chars: int = MAX_POST_CHARS) -> str:
-    prefix = "NZES 2023 profile."
-    sentences = build_sentences(context)
-
-    if not sentences:
-        text = prefix
-    else:
-        selected = sentences.copy()
-        while selected:
-            candidate = " ".join([prefix] + selected)
-            if len(candidate) <= max_chars:
-                text = candidate
-                break
-            selected.pop()
-        else:
-            text = prefix
-
-    hashtag = " #NZES2023"
+SENTENCE_BUILDERS = {
+    "intro": _intro_sentence,
+    "living": _living_sentence,
+    "vote": _vote_sentence,
+    "ideology": _ideology_sentence,
+}
+
+
+def sentence_cache_info() -> Dict[str, Any]:
+    return {name: builder.cache_info() for name, builder in SENTENCE_BUILDERS.items()}
+
+
+def clear_sentence_cache() -> None:
+    for builder in SENTENCE_BUILDERS.values():
+        builder.cache_clear()
+
+
+def build_sentence_groups(context: TemplateContext) -> List[SentenceGroup]:
+    # Each sentence is paired with the fields it mentions, so truncation can
+    # report which fields were dropped. Values are cleaned before the cache
+    # lookup: NaN never compares equal to itself, so it would always miss.
+    groups = (
+        _intro_sentence(_clean_value(context.age_bucket), _clean_value(context.gender), _clean_value(context.ethnicity)),
+        _living_sentence(
+            _clean_value(context.education), _clean_value(context.housing), _clean_value(context.urban_rural)
+        ),
+        _vote_sentence(_clean_value(context.party_vote), _wave_year(context.wave)),
+        _ideology_sentence(_clean_value(context.ideology)),
+    )
+    return [group for group in groups if group is not None]
+
+
+def build_sentences(context: TemplateContext) -> List[str]:
+    return [sentence for _, sentence in build_sentence_groups(context)]
+
+
+@dataclass
+class RenderedProfile:
+    text: str
+    truncated: int
+    dropped_fields: Tuple[str, ...]
+
+
+def fit_sentences(sentences: List[str], max_chars: int = MAX_POST_CHARS, prefix: str = PREFIX) -> int:
+    # Each kept sentence adds its length plus a joining space, so the longest
+    # prefix that fits follows from a running total; no candidate strings.
+    total = len(prefix)
+    kept = 0
+    for sentence in sentences:
+        total += 1 + len(sentence)
+        if total > max_chars:
+            break
+        kept += 1
+    return kept
+
+
+def render_profile_details(context: TemplateContext, max_chars: int = MAX_POST_CHARS) -> RenderedProfile:
+    wave = _wave_year(context.wave)
+    prefix, hashtag = profile_prefix(wave), profile_hashtag(wave)
+    groups = build_sentence_groups(context)
+    sentences = [sentence for _, sentence in groups]
+    kept = fit_sentences(sentences, max_chars, prefix)
+
+    text = " ".join([prefix] + sentences[:kept])
     if len(text) + len(hashtag) <= max_chars:
         text += hashtag
 
-    return text
+    dropped = tuple(name for fields, _ in groups[kept:] for name in fields)
+    return RenderedProfile(text, len(groups) - kept, dropped)
+
+
+def render_profile(context: TemplateContext, max_chars: int = MAX_POST_CHARS) -> str:
+    return render_profile_details(context, max_chars).text
 
 
 def context_from_row(row: Dict[str, object]) -> TemplateContext:
@@ -176,4 +270,5 @@ def context_from_row(row: Dict[str, object]) -> TemplateContext:
         urban_rural=row.get("urban_rural"),
         party_vote=row.get("party_vote"),
         ideology=row.get("ideology"),
+        wave=row.get("wave"),
     )
@@ -1,6 +1,150 @@
 import sys
+import threading
+import time
 from pathlib import Path
 
+import pytest
+
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture
+def nzes_dta(tmp_path):
+    import pandas as pd
+    import pyreadstat
+
+    rows = 40
+    df = pd.DataFrame(
+        {
+            "amcase": [float(i) for i in range(1, rows + 1)],
+            "H1": [float(1 + i % 2) for i in range(rows)],
+            "H3c": [float(18 + (i * 7) % 70) for i in range(rows)],
+            "methnic": [float(i % 3) for i in range(rows)],
+            "meducate": [float(1 + i % 5) for i in range(rows)],
+            "H22": [float(1 + i % 3) for i in range(rows)],
+            "murbrur": [111.0 if i % 4 else 221.0 for i in range(rows)],
+            "mvpartyvote": [float(1 + i % 4) for i in range(rows)],
+            "B6": [float(i % 11) for i in range(rows)],
+            "unused": [0.5] * rows,
+        }
+    )
+    value_labels = {
+        "H1": {1: "1. Male", 2: "2. Female"},
+        "methnic": {0: "European", 1: "Māori", 2: "Pacific"},
+        "meducate": {1: "No Formal", 2: "Level 1", 3: "Level 2 or 3", 4: "Level 4", 5: "University"},
+        "H22": {
+            1: "Own your house or flat mortgage free",
+            2: "Own your house or flat with a mortgage",
+            3: "Rent your house or flat privately",
+        },
+        "mvpartyvote": {1: "Labour", 2: "National", 3: "Green", 4: "Nonvote"},
+    }
+    path = tmp_path / "raw" / "nzes.dta"
+    path.parent.mkdir()
+    pyreadstat.write_dta(df, str(path), variable_value_labels=value_labels)
+    return path
+
+
+class FakePDS:
+    def __init__(self) -> None:
+        self.calls = []
+        self.posts = []
+        self.access_ttl = 3600
+        self.refresh_ttl = 90 * 24 * 3600
+        self.revoked = set()
+        self.clock = time.time
+        self._serial = 0
+        self.latency = 0.0
+        # Statuses returned by createRecord before it succeeds, e.g. [429, 503].
+        self.inject = []
+        self.retry_after = 0
+        self.remaining = None
+        self.lock = threading.Lock()
+
+    def token(self, kind: str, ttl: int) -> str:
+        import base64
+        import json
+
+        self._serial += 1
+        payload = {"sub": "did:plc:fake", "scope": kind, "exp": int(self.clock()) + ttl, "jti": str(self._serial)}
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).rstrip(b"=").decode()
+        return f"eyJhbGciOiJIUzI1NiJ9.{encoded}.sig"
+
+    def session(self) -> dict:
+        return {
+            "did": "did:plc:fake",
+            "handle": "bot.test",
+            "accessJwt": self.token("access", self.access_ttl),
+            "refreshJwt": self.token("refresh", self.refresh_ttl),
+        }
+
+    def handle(self, method: str, headers, body: dict):
+        status, payload = self._handle(method, headers, body)
+        extra = {}
+        if status == 429:
+            extra = {"retry-after": str(self.retry_after), "ratelimit-remaining": "0"}
+        elif self.remaining is not None and method == "com.atproto.repo.createRecord":
+            extra = {"ratelimit-remaining": str(self.remaining), "ratelimit-reset": str(int(self.clock()) + 60)}
+        return status, payload, extra
+
+    def _handle(self, method: str, headers, body: dict):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            return self._dispatch(method, headers, body)
+
+    def _dispatch(self, method: str, headers, body: dict):
+        self.calls.append(method)
+        bearer = headers.get("Authorization", "").removeprefix("Bearer ")
+        if method == "com.atproto.server.createSession":
+            return 200, self.session()
+        if bearer in self.revoked:
+            return 400, {"error": "ExpiredToken", "message": "Token has been revoked"}
+        if method == "com.atproto.server.refreshSession":
+            self.revoked.add(bearer)
+            return 200, self.session()
+        if method == "com.atproto.repo.createRecord":
+            if self.inject:
+                status = self.inject.pop(0)
+                errors = {400: "InvalidRequest", 429: "RateLimitExceeded"}
+                return status, {"error": errors.get(status, "InternalServerError")}
+            if self.remaining is not None:
+                self.remaining -= 1
+            self.posts.append(body["record"]["text"])
+            return 200, {"uri": f"at://did:plc:fake/app.bsky.feed.post/{len(self.posts)}", "cid": "bafyfake"}
+        return 404, {"error": "MethodNotImplemented"}
+
+
+@pytest.fixture
+def fake_pds():
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    pds = FakePDS()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            status, payload, extra = pds.handle(self.path.rsplit("/", 1)[-1], self.headers, body)
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in extra.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    pds.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield pds
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,94 @@
+import functools
+
+from src import post
+from src.bsky_client import BlueskyClient, load_session
+from src.state import journal_path, load_state
+from tests.test_post import make_dataset
+
+
+def test_session_is_persisted_and_reused(tmp_path, fake_pds):
+    session_path = tmp_path / ".bsky_session"
+
+    first = BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url)
+    first.post("one")
+    first.post("two")
+    assert fake_pds.calls.count("com.atproto.server.createSession") == 1
+    assert load_session(session_path) is not None
+
+    second = BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url)
+    uri = second.post("three")
+
+    assert uri.endswith("/3")
+    assert fake_pds.calls.count("com.atproto.server.createSession") == 1
+    assert fake_pds.posts == ["one", "two", "three"]
+
+
+def test_expired_session_logs_in_again(tmp_path, fake_pds):
+    session_path = tmp_path / ".bsky_session"
+    fake_pds.refresh_ttl = 60
+    BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url).post("one")
+
+    assert load_session(session_path) is None
+    BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url).post("two")
+    assert fake_pds.calls.count("com.atproto.server.createSession") == 2
+
+
+def test_stale_access_token_is_refreshed_and_saved(tmp_path, fake_pds):
+    session_path = tmp_path / ".bsky_session"
+    fake_pds.access_ttl = 60
+    BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url).post("one")
+    before = session_path.read_text()
+
+    BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url).post("two")
+
+    assert "com.atproto.server.refreshSession" in fake_pds.calls
+    assert fake_pds.calls.count("com.atproto.server.createSession") == 1
+    assert session_path.read_text() != before
+
+
+def test_revoked_session_falls_back_to_password(tmp_path, fake_pds):
+    session_path = tmp_path / ".bsky_session"
+    BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url).post("one")
+    access_jwt = session_path.read_text().split(":::")[2]
+    fake_pds.revoked.add(access_jwt)
+
+    BlueskyClient("bot.test", "pw", session_path=session_path, base_url=fake_pds.url).post("two")
+
+    assert fake_pds.posts == ["one", "two"]
+    assert fake_pds.calls.count("com.atproto.server.createSession") == 2
+
+
+def test_post_batch_uses_one_session_and_one_snapshot(tmp_path, fake_pds, monkeypatch):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    session_path = tmp_path / ".bsky_session"
+    make_dataset(dataset)
+    monkeypatch.setattr(post, "BlueskyClient", functools.partial(BlueskyClient, base_url=fake_pds.url))
+    sleeps = []
+
+    preview = post.post_batch(dataset, state_path, count=3, dry_run=True)
+    uris = post.post_batch(
+        dataset,
+        state_path,
+        count=3,
+        interval=5,
+        handle="bot.test",
+        app_password="pw",
+        session_path=session_path,
+        sleep=sleeps.append,
+    )
+
+    assert len(uris) == 3
+    assert fake_pds.posts == preview
+    assert sleeps == [5, 5]
+    assert fake_pds.calls.count("com.atproto.server.createSession") == 1
+    assert not journal_path(state_path).exists()
+    state = load_state(state_path)
+    assert state["cursor"] == 3 and len(state["used"]) == 3 and state["seq"] == 3
+
+    remaining = post.post_batch(
+        dataset, state_path, count=10, handle="bot.test", app_password="pw", session_path=session_path
+    )
+    assert len(remaining) == 3
+    assert fake_pds.calls.count("com.atproto.server.createSession") == 1
+    assert len(set(fake_pds.posts)) == 6
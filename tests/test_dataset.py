@@ -0,0 +1,99 @@
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.dataset import (
+    DatasetWriter,
+    dataset_schema,
+    lookup_respondents,
+    open_index,
+    read_dataset,
+    respondent_key,
+    respondent_labels,
+    schema_metadata,
+    wave_respondent_id,
+    write_dataset,
+)
+
+
+def make_frame(rows):
+    return pd.DataFrame(
+        {
+            "respondent_id": [str(value) for value in reversed(range(1, rows + 1))],
+            "gender": ["Female" if value % 2 else "Male" for value in reversed(range(1, rows + 1))],
+        }
+    )
+
+
+def test_write_dataset_sorts_by_numeric_id_in_row_groups(tmp_path):
+    path = tmp_path / "nzes.parquet"
+    write_dataset(make_frame(25), path, row_group_size=10)
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.metadata.row_group(0).column(0).statistics.has_min_max
+    assert parquet.read().column("respondent_id").to_pylist()[:3] == ["1", "2", "3"]
+    assert open_index(path).row_of("12") == 11
+
+
+def test_lookup_respondents_reads_only_requested_rows(tmp_path):
+    path = tmp_path / "nzes.parquet"
+    write_dataset(make_frame(25), path, row_group_size=10)
+
+    rows = lookup_respondents(path, ["23", "4", "999"], columns=["respondent_id", "gender"])
+
+    assert rows == [{"respondent_id": "23", "gender": "Female"}, {"respondent_id": "4", "gender": "Male"}]
+
+
+def test_dataset_writer_appends_chunks_in_full_row_groups(tmp_path):
+    path = tmp_path / "nzes.parquet"
+    frame = make_frame(25)
+
+    with DatasetWriter(path, row_group_size=10) as writer:
+        for start in range(0, 25, 7):
+            writer.write(frame.iloc[start : start + 7])
+
+    parquet = pq.ParquetFile(path)
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.metadata.num_row_groups)] == [10, 10, 5]
+    assert lookup_respondents(path, ["25", "3"]) == [
+        {"respondent_id": "25", "gender": "Female"},
+        {"respondent_id": "3", "gender": "Female"},
+    ]
+
+
+def test_lookup_respondents_without_index_uses_filters(tmp_path):
+    path = tmp_path / "nzes.parquet"
+    make_frame(5).to_parquet(path, index=False)
+
+    rows = lookup_respondents(path, ["2"])
+
+    assert rows == [{"respondent_id": "2", "gender": "Male"}]
+
+
+def test_wave_qualified_ids_sort_by_wave_then_case(tmp_path):
+    path = tmp_path / "nzes.parquet"
+    ids = ["2023-2.0", "2020-10.0", "2023-1.0", "2020-9.0"]
+    write_dataset(pd.DataFrame({"respondent_id": ids, "wave": [2023, 2020, 2023, 2020]}), path, row_group_size=2)
+
+    assert pq.read_table(path).column("respondent_id").to_pylist() == ["2020-9.0", "2020-10.0", "2023-1.0", "2023-2.0"]
+    assert respondent_key("2020-10") == respondent_key("2020-10.0") != respondent_key("2023-10")
+    assert lookup_respondents(path, ["2023-1"]) == [{"respondent_id": "2023-1.0", "wave": 2023}]
+
+
+def test_integer_ids_and_categories_round_trip(tmp_path):
+    path = tmp_path / "nzes.parquet"
+    categories = {"gender": ["Male", "Female", "Other"]}
+    df = pd.DataFrame(
+        {
+            "respondent_id": wave_respondent_id(2020, pd.Series([5, 2, 9], dtype="int64")),
+            "gender": pd.Categorical(["Female", None, "Female"]),
+        }
+    )
+    write_dataset(df, path, row_group_size=2, schema=schema_metadata(categories))
+    (tmp_path / "nzes.idx").unlink()
+
+    loaded = read_dataset(path)
+
+    assert dataset_schema(path)["categories"] == categories
+    assert list(loaded["gender"].cat.categories) == categories["gender"]
+    assert respondent_labels(loaded["respondent_id"]) == ["2020-2", "2020-5", "2020-9"]
+    assert lookup_respondents(path, ["2020-9"]) == [{"respondent_id": wave_respondent_id(2020, 9), "gender": "Female"}]
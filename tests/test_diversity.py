@@ -0,0 +1,82 @@
+import pandas as pd
+
+from src.diversity import SIGNATURE_FIELDS, lane_mask
+from src.features import PROFILE_FIELDS, profile_signatures
+from src.post import build_prerender, next_prerendered, take_prerendered
+from src.prerender import Prerender
+from src.state import UsedBitmap, load_state, record_post
+
+
+def make_profiles():
+    # Rows 0-2 share the fields the diversity check compares; row 3 differs.
+    return pd.DataFrame(
+        {
+            "respondent_id": ["1", "2", "3", "4"],
+            "age_bucket": ["18-24", "18-24", "18-24", "65+"],
+            "gender": ["Female", "Female", "Female", "Male"],
+            "ethnicity": ["European"] * 4,
+            "education": ["University", "Level 4", None, "Level 1"],
+            "housing": ["Renting"] * 4,
+            "urban_rural": ["urban"] * 4,
+            "party_vote": ["Labour", "Labour", "Labour", "National"],
+            "ideology": ["left", "right", "center", "right"],
+        }
+    )
+
+
+def test_signature_lanes_follow_category_codes():
+    df = make_profiles()
+    df["gender"] = pd.Categorical(df["gender"], categories=["Male", "Female"])
+
+    signatures = profile_signatures(df)
+
+    assert list(SIGNATURE_FIELDS) == PROFILE_FIELDS
+    assert (signatures[0] >> 8) & 0xFF == 2 and (signatures[3] >> 8) & 0xFF == 1
+    assert (signatures[2] >> 24) & 0xFF == 0
+    mask = lane_mask()
+    assert signatures[0] & mask == signatures[1] & mask != signatures[3] & mask
+
+
+def queue_state(**extra):
+    return {"used": UsedBitmap(), "cursor": 0, "recent": [], **extra}
+
+
+def test_similar_candidates_are_skipped_but_kept(tmp_path):
+    df = make_profiles()
+    path = tmp_path / "nzes.posts"
+    build_prerender(df, path, seed=5, dataset_sha256="x")
+    prerender = Prerender(path)
+    rows = [prerender.record(position)[1] for position in range(len(prerender))]
+    similar = [position for position, row in enumerate(rows) if row < 3]
+    state = queue_state(recent=[int(profile_signatures(df)[0])])
+
+    _, row, _, _ = next_prerendered(prerender, state)
+
+    assert row == 3
+    # The cursor stays on the first skipped entry, which is still unused.
+    assert state["cursor"] == similar[0]
+
+    batch = take_prerendered(prerender, queue_state(), 4)
+    assert len({row for _, row, _, _, _ in batch}) == 4
+    assert [row < 3 for _, row, _, _, _ in batch[:2]] != [True, True]
+
+
+def test_window_of_zero_keeps_queue_order(tmp_path):
+    path = tmp_path / "nzes.posts"
+    build_prerender(make_profiles(), path, seed=5, dataset_sha256="x")
+    prerender = Prerender(path)
+    state = queue_state(diversity_window=0)
+
+    picks = [next_prerendered(prerender, state)[1] for _ in range(len(prerender))]
+
+    assert picks == [prerender.record(position)[1] for position in range(len(prerender))]
+
+
+def test_recent_signatures_replay_from_journal(tmp_path):
+    path = tmp_path / "state.json"
+    state = load_state(path)
+    state["diversity_window"] = 2
+    for row in range(3):
+        record_post(path, state, str(row), row, f"at://{row}", "text", signature=100 + row)
+
+    assert load_state(path)["recent"] == [101, 102]
@@ -1,6 +1,19 @@
 import pandas as pd
 
-from src.features import FeatureConfig, build_features
+from src.features import (
+    AGE_BUCKETS,
+    IDEOLOGY_BUCKETS,
+    URBAN_RURAL_BUCKETS,
+    FeatureConfig,
+    age_bucket,
+    bucketize,
+    build_features,
+    featurize,
+    ideology_bucket,
+    map_value,
+    profile_categories,
+    urban_rural_bucket,
+)
 
 
 def test_build_features_and_privacy_filter():
@@ -35,3 +48,73 @@ def test_build_features_and_privacy_filter():
 
     # Age buckets should be derived
     assert set(features["age_bucket"].values) == {"18-24", "45-54", "65+"}
+
+
+def test_featurize_keeps_integer_ids_and_label_order():
+    df = pd.DataFrame({"amcase": [3.0, None, 1.5, 7.0], "mvpartyvote": [2, 1, 1, 9]})
+    labels = {"values": {"mvpartyvote": {1: "Labour", 2: "National", 9: "Don't know (missing)"}}}
+
+    features = featurize(df, labels)
+    categories = profile_categories(labels)
+
+    assert features["respondent_id"].tolist() == [3, 7]
+    assert features["respondent_id"].dtype == "int64"
+    assert categories["party_vote"] == ["Labour", "National", "Other"]
+    assert categories["age_bucket"] == list(AGE_BUCKETS.labels)
+    assert list(features["party_vote"].cat.categories) == ["Labour", "National"]
+
+
+def test_map_value_cleans_labels_once_and_masks_missing():
+    series = pd.Series([1.0, 2.0, float("nan"), 2.5, 3.0, 99.0, -1.0])
+    labels = {1: " Labour ", 2: "National", 3: "Don't know (DK)", 99: ""}
+
+    mapped = map_value(series, labels, clean=True, missing_tokens=["dk"])
+
+    assert isinstance(mapped.dtype, pd.CategoricalDtype)
+    assert mapped.tolist()[:2] == ["Labour", "National"]
+    assert mapped.isna().tolist() == [False, False, True, True, True, True, True]
+
+
+def test_map_value_handles_non_numeric_codes():
+    series = pd.Series(["a", "b", None, "a"])
+
+    mapped = map_value(series, {"a": "Yes", "b": "No"})
+
+    assert mapped.astype(object).where(mapped.notna(), None).tolist() == ["Yes", "No", None, "Yes"]
+
+
+EDGE_INPUTS = [None, float("nan"), -5, 17, 18, 29, 30, 99, 99.5, 111, 225, 150, "30", "111", "abc", True, False]
+# What the original row-by-row bucketers returned for EDGE_INPUTS.
+BASELINE_BUCKETS = {
+    "age": [
+        None, None, None, None, "18-24", "25-34", "25-34", "65+", "65+", "65+", "65+", "65+",
+        "25-34", "65+", None, None, None,
+    ],
+    "ideology": [
+        None, None, "left", "right", "right", "right", "right", None, None, "right", "right", "right",
+        "right", "right", None, "left", "left",
+    ],
+    "urban_rural": [
+        None, None, None, None, None, None, None, None, None, "urban", "rural/remote", None,
+        None, "urban", None, None, None,
+    ],
+}
+
+
+def test_bucketize_matches_baseline_buckets():
+    numeric = [i for i, value in enumerate(EDGE_INPUTS) if type(value) in (int, float)]
+    for name, buckets, scalar in [
+        ("age", AGE_BUCKETS, age_bucket),
+        ("ideology", IDEOLOGY_BUCKETS, ideology_bucket),
+        ("urban_rural", URBAN_RURAL_BUCKETS, urban_rural_bucket),
+    ]:
+        expected = BASELINE_BUCKETS[name]
+        assert [scalar(value) for value in EDGE_INPUTS] == expected
+
+        for series, wanted in [
+            (pd.Series(EDGE_INPUTS, dtype=object), expected),
+            (pd.Series([EDGE_INPUTS[i] for i in numeric], dtype=float), [expected[i] for i in numeric]),
+        ]:
+            bucketed = bucketize(series, buckets)
+            assert isinstance(bucketed.dtype, pd.CategoricalDtype)
+            assert bucketed.astype(object).where(bucketed.notna(), None).tolist() == wanted
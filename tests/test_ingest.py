@@ -0,0 +1,30 @@
+import pandas as pd
+import pyreadstat
+import pytest
+
+from src.ingest import read_raw_dta
+
+
+def write_dta(path, columns):
+    df = pd.DataFrame({name: [1.0, 2.0] for name in columns})
+    pyreadstat.write_dta(df, str(path), variable_value_labels={"H1": {1: "1. Male", 2: "2. Female"}})
+
+
+def test_read_raw_dta_reads_only_required_columns(tmp_path):
+    path = tmp_path / "raw.dta"
+    write_dta(path, ["amcase", "H1", "mage", "methnic", "meducate", "H22", "murbrur", "mvpartyvote", "B6", "unused"])
+
+    df, labels = read_raw_dta(path)
+
+    assert "unused" not in df.columns
+    assert "mage" in df.columns
+    assert labels["values"]["H1"] == {1: "Male", 2: "Female"}
+    assert "unused" in labels["variables"]
+
+
+def test_read_raw_dta_fails_fast_on_missing_variables(tmp_path):
+    path = tmp_path / "raw.dta"
+    write_dta(path, ["amcase", "H1"])
+
+    with pytest.raises(ValueError, match="H3c or mage"):
+        read_raw_dta(path)
@@ -0,0 +1,44 @@
+from src.ingest import write_labels
+from src.labels import LabelStore, write_label_store
+
+LABELS = {
+    "variables": {"H1": "Gender", "B6": "Left-right", "unused": "Not in the pipeline"},
+    "values": {
+        "H1": {1: "Male", 2: "Female"},
+        "unused": {1: "Yes", 2: "No"},
+    },
+}
+
+
+def test_label_store_round_trips_integer_codes(tmp_path):
+    path = tmp_path / "labels.bin"
+    write_label_store(LABELS, path)
+
+    store = LabelStore(path)
+
+    assert store.variables() == ["H1", "B6", "unused"]
+    assert store.variable_label("H1") == "Gender"
+    assert store.value_labels("H1") == {1: "Male", 2: "Female"}
+    assert store.value_labels("B6") is None
+    assert store.to_dict() == LABELS
+
+
+def test_label_store_reads_only_requested_variable(tmp_path):
+    path = tmp_path / "labels.bin"
+    write_label_store(LABELS, path)
+
+    store = LabelStore(path)
+    store.value_labels("H1")
+
+    assert list(store._values) == ["H1"]
+
+
+def test_write_labels_keeps_pipeline_variables_unless_full(tmp_path):
+    path = tmp_path / "labels.bin"
+
+    write_labels(LABELS, path)
+    assert "unused" not in LabelStore(path)
+    assert "H1" in LabelStore(path)
+
+    write_labels(LABELS, path, full=True)
+    assert "unused" in LabelStore(path)
@@ -0,0 +1,46 @@
+import json
+import pstats
+
+from src.metrics import Profiler, cprofile_path, profiling, span
+
+
+def test_span_is_noop_without_profiler():
+    with span("anything"):
+        pass
+
+
+def test_nested_spans_accumulate_by_path(tmp_path):
+    profiler = Profiler(memory=True)
+    with profiling(profiler):
+        with span("build"):
+            for _ in range(2):
+                with span("render"):
+                    blob = bytearray(2_000_000)
+                    del blob
+
+    stats = profiler.spans
+    assert list(stats) == ["build/render", "build"]
+    assert stats["build/render"].count == 2
+    assert stats["build"].wall_s >= stats["build/render"].wall_s
+    assert stats["build/render"].peak_traced_bytes >= 2_000_000
+    # The parent's peak covers its children even though they reset the counter.
+    assert stats["build"].peak_traced_bytes >= stats["build/render"].peak_traced_bytes
+
+
+def test_write_appends_report_and_cprofile_dump(tmp_path):
+    path = tmp_path / "metrics" / "profile.jsonl"
+    for run in range(2):
+        profiler = Profiler(cprofile_stage="mapping")
+        with profiling(profiler), span("build-dataset"):
+            with span("mapping"):
+                sorted(range(1000), reverse=True)
+        profiler.write(path, command="build-dataset", run=run)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["run"] for line in lines] == [0, 1]
+    assert {s["name"] for s in lines[0]["spans"]} == {"build-dataset", "build-dataset/mapping"}
+    assert lines[0]["spans"][0]["peak_traced_bytes"] is None
+
+    dump = cprofile_path(path, "mapping")
+    assert dump.name == "profile-mapping.prof"
+    assert any("sorted" in str(key) for key in pstats.Stats(str(dump)).stats)
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from src import post
+from src.post import build_prerender, post_once
+from src.prerender import Prerender, prerender_path
+from src.selection import build_queue, row_field_count
+from src.state import load_state
+from src.templates import context_from_row, render_profile
+
+
+def make_dataset(path):
+    df = pd.DataFrame(
+        {
+            "respondent_id": [str(i) for i in range(1, 9)],
+            "age_bucket": ["18-24", "25-34", None, "45-54", "55-64", "65+", None, "35-44"],
+            "gender": ["Female", "Male", None, "Female", "Male", "Female", "Male", "Male"],
+            "ethnicity": ["European", "Māori", None, "Pacific", "Asian", "European", None, "Other"],
+            "education": ["University", None, None, "Level 4", None, "No Formal", None, "Level 1"],
+            "housing": [None] * 8,
+            "urban_rural": ["urban", "rural/remote", None, "urban", "urban", None, None, "urban"],
+            "party_vote": ["Labour", "National", "Green", "Maori", "Nonvote", "ACT", None, "Green"],
+            "ideology": ["left", "right", None, "center", "left", "right", None, "center"],
+        }
+    )
+    df.to_parquet(path, index=False)
+    return df
+
+
+class FakeClient:
+    posted = []
+
+    def __init__(self, handle, app_password, session_path=None):
+        pass
+
+    def post(self, text):
+        FakeClient.posted.append(text)
+        return f"at://fake/{len(FakeClient.posted)}"
+
+
+def test_prerender_matches_live_selection(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    df = make_dataset(dataset)
+    path = prerender_path(dataset)
+
+    count = build_prerender(df, path, seed=7, dataset_sha256="x")
+
+    # The live row-by-row walk the posts file replaced: queue order, skipping
+    # respondents with fewer than three profile fields.
+    queued = df.set_index("respondent_id", drop=False).loc[build_queue(df["respondent_id"], 7)]
+    rows = [row for _, row in queued.iterrows() if row_field_count(row) >= 3]
+    prerender = Prerender(path)
+    assert len(prerender) == count == len(rows) == 6
+    for position, row in enumerate(rows):
+        respondent_id, row_position, text, length = prerender.record(position)
+        assert respondent_id == row["respondent_id"]
+        assert df.iloc[row_position]["respondent_id"] == respondent_id
+        assert text == render_profile(context_from_row(row))
+        assert length == len(text)
+
+
+def test_post_once_walks_prerendered_queue(tmp_path, monkeypatch):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    make_dataset(dataset)
+    monkeypatch.setattr(post, "BlueskyClient", FakeClient)
+
+    preview = post_once(dataset, state_path, dry_run=True)
+    uri = post_once(dataset, state_path, handle="h", app_password="p")
+
+    state = load_state(state_path)
+    assert uri == "at://fake/1"
+    assert FakeClient.posted[-1] == preview
+    assert state["cursor"] == 1
+    assert len(state["used"]) == 1
+    assert state["last_post"]["text_sha256"] == hashlib.sha256(preview.encode("utf-8")).hexdigest()
+
+    post_once(dataset, state_path, handle="h", app_password="p")
+    assert FakeClient.posted[-1] != preview
+    assert len(load_state(state_path)["used"]) == 2
+
+
+def test_post_once_migrates_legacy_state(tmp_path, monkeypatch):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    make_dataset(dataset)
+    first = post.load_prerender(dataset, seed=1337).record(0)
+    state_path.write_text(
+        json.dumps({"used_ids": [first[0]], "queue": ["1", "2"], "queue_index": 2, "rng_seed": 1337}),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(post, "BlueskyClient", FakeClient)
+
+    post_once(dataset, state_path, handle="h", app_password="p")
+
+    saved = json.loads(state_path.read_text(encoding="utf-8"))
+    assert "queue" not in saved and "used_ids" not in saved
+    state = load_state(state_path)
+    assert first[1] in state["used"]
+    assert state["cursor"] == 2
+    assert len(state["used"]) == 2
+
+
+def test_stale_prerender_is_rebuilt(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    make_dataset(dataset)
+    path = prerender_path(dataset)
+    build_prerender(pd.read_parquet(dataset), path, seed=1, dataset_sha256="stale")
+
+    prerender = post.load_prerender(dataset, seed=1)
+
+    assert prerender.is_current(1, dataset)
+
+
+def test_prerender_follows_sampling_scheme(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    df = make_dataset(dataset)
+    df.assign(weight=[1.0, 1.0, 1.0, 1.0, 1.0, 1000.0, 1.0, 1.0]).to_parquet(dataset, index=False)
+
+    uniform = post.load_prerender(dataset, seed=3)
+    weighted = post.load_prerender(dataset, seed=3, sampling="weight")
+
+    assert weighted.header["sampling"] == "weight"
+    assert not weighted.is_current(3, dataset)
+    assert weighted.record(0)[0] == "6"
+    assert sorted(weighted.positions_of(["1", "6"]).values()) == [0, 5]
+    assert len(weighted) == len(uniform)
+
+
+def test_unchanged_dataset_is_not_rehashed(tmp_path, monkeypatch):
+    from src import cache
+
+    dataset = tmp_path / "nzes.parquet"
+    make_dataset(dataset)
+    prerender = post.load_prerender(dataset, seed=1)
+    digest = cache.file_digest
+
+    def no_hashing(path):
+        raise AssertionError("hashed an unchanged dataset")
+
+    monkeypatch.setattr(cache, "file_digest", no_hashing)
+    assert prerender.is_current(1, dataset)
+
+    # A new mtime falls back to hashing, which still finds the same content.
+    monkeypatch.setattr(cache, "file_digest", digest)
+    os.utime(dataset, ns=(0, 0))
+    assert prerender.is_current(1, dataset)
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+from src.post import load_prerender, post_once, render_respondent
+from src.preview import PreviewIndex, PreviewServer, respond
+from src.prerender import prerender_path
+from src.state import DEFAULT_STATE, load_state
+from tests.test_post import make_dataset
+
+
+def make_index(tmp_path, cache_size=4096):
+    dataset = tmp_path / "nzes.parquet"
+    make_dataset(dataset)
+    load_prerender(dataset, DEFAULT_STATE["rng_seed"])
+    index = PreviewIndex(dataset, tmp_path / "state.json", cache_size=cache_size)
+    index.refresh()
+    return index
+
+
+def get(index, target, **headers):
+    status, response_headers, body = respond(index, "GET", target, headers)
+    return status, response_headers, json.loads(body) if body else None
+
+
+def test_profile_is_cached_and_revalidated(tmp_path):
+    index = make_index(tmp_path, cache_size=1)
+
+    status, headers, body = get(index, "/profile/4")
+    assert status == 200
+    assert body["text"] == render_respondent(index.dataset_path, "4")
+    assert get(index, "/profile/4")[2] == body
+    assert get(index, "/profile/4", **{"if-none-match": headers["ETag"]})[0] == 304
+    get(index, "/profile/5")
+    assert (index.hits, index.misses, list(index.texts)) == (2, 2, ["5"])
+    assert get(index, "/profile/99")[0] == 404
+    unknown_etag = index.etag("/profile/99", with_state=False)
+    assert get(index, "/profile/99", **{"if-none-match": unknown_etag})[0] == 404
+
+
+def test_next_peeks_without_moving_the_queue(tmp_path):
+    index = make_index(tmp_path)
+    preview = post_once(index.dataset_path, index.state_path, dry_run=True)
+
+    status, headers, body = get(index, "/next?n=3")
+
+    assert status == 200 and len(body) == 3
+    assert body[0]["text"] == preview
+    assert get(index, "/next?n=1")[2] == body[:1]
+    assert load_state(index.state_path)["cursor"] == 0
+    assert get(index, "/next?n=0")[0] == 400
+    assert get(index, "/stats")[2]["remaining"] == 6
+    assert respond(index, "POST", "/next", {})[0] == 405
+
+
+def test_stale_posts_file_is_reported_not_rebuilt(tmp_path):
+    index = make_index(tmp_path)
+    index.state_path.write_text('{"version": 2, "rng_seed": 99}', encoding="utf-8")
+    posts = prerender_path(index.dataset_path).read_bytes()
+
+    index.refresh()
+
+    status, _, body = get(index, "/next")
+    assert status == 503 and "build-dataset" in body["error"]
+    assert get(index, "/stats")[0] == 503
+    assert get(index, "/profile/4")[0] == 200
+    assert prerender_path(index.dataset_path).read_bytes() == posts
+
+
+def test_server_answers_concurrent_keep_alive_requests(tmp_path):
+    index = make_index(tmp_path)
+
+    async def client(port, paths):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        statuses = []
+        for path in paths:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while (line := await reader.readline()) != b"\r\n":
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            statuses.append(status)
+        writer.close()
+        return statuses
+
+    async def run():
+        server = await PreviewServer(index).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            paths = ["/profile/1", "/next?n=5", "/stats"]
+            return await asyncio.gather(*(client(port, paths) for _ in range(200)))
+
+    results = asyncio.run(run())
+
+    assert results == [[200, 200, 200]] * 200
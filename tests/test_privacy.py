@@ -0,0 +1,84 @@
+import pandas as pd
+
+from src.privacy import CellCounts, apply_privacy_filter, privacy_sweep, suppress_joint_cells
+
+
+def test_apply_privacy_filter_remaps_rare_codes_without_copy():
+    df = pd.DataFrame({"party": pd.Categorical(["A", "A", "B", "C", None, "A"])})
+    filtered = apply_privacy_filter(df, ["party"], min_cell=2)
+
+    assert filtered is df
+    assert df["party"].tolist()[:4] == ["A", "A", "Other", "Other"]
+    assert pd.isna(df["party"].iloc[4])
+
+
+def test_suppress_joint_cells_blanks_small_combinations():
+    df = pd.DataFrame(
+        {
+            "age_bucket": ["18-24", "18-24", "18-24", "65+"],
+            "gender": ["female", "female", "female", "male"],
+        }
+    )
+
+    suppressed = suppress_joint_cells(df, ["age_bucket", "gender"], min_cell=2)
+
+    assert suppressed == 1
+    assert df["age_bucket"].isna().tolist() == [False, False, False, True]
+    assert df["gender"].isna().tolist() == [False, False, False, True]
+
+
+def test_privacy_sweep_counts_rows_per_threshold():
+    df = pd.DataFrame(
+        {
+            "party": ["A"] * 5 + ["B"] * 2 + ["C"],
+            "gender": ["x"] * 4 + ["y"] * 4,
+        }
+    )
+
+    sweep = privacy_sweep(df, ["party"], [2, 3, 6], joint_fields=["party", "gender"])
+
+    assert sweep[2] == {"party": 1, "joint": 2}
+    assert sweep[3] == {"party": 3, "joint": 4}
+    assert sweep[6] == {"party": 8, "joint": 8}
+
+
+def test_cell_counts_over_chunks_match_in_memory_filter():
+    df = pd.DataFrame(
+        {
+            "party": ["A", "A", "B", "C", None, "A", "B", "D"],
+            "gender": ["x", "x", "y", "y", "x", "x", "y", None],
+        }
+    )
+    counts = CellCounts(["party", "gender"], joint_fields=["party", "gender"])
+    for start in range(0, len(df), 3):
+        counts.add(df.iloc[start : start + 3])
+
+    streamed = pd.concat([counts.apply(df.iloc[start : start + 3], 2, 2) for start in range(0, len(df), 3)])
+    expected = df.copy()
+    apply_privacy_filter(expected, ["party", "gender"], min_cell=2)
+    suppress_joint_cells(expected, ["party", "gender"], min_cell=2)
+
+    assert streamed.astype(object).where(streamed.notna(), None).values.tolist() == (
+        expected.astype(object).where(expected.notna(), None).values.tolist()
+    )
+
+
+def test_cell_counts_merge_rare_values_into_an_existing_other():
+    df = pd.DataFrame(
+        {
+            "party": ["A", "A", "Other", "B", "A", "Other", "C", "A", "B"],
+            "region": ["n", "n", "s", "s", "n", None, "s", "n", "s"],
+        }
+    )
+    counts = CellCounts(["party"], joint_fields=["party", "region"])
+    for start in range(0, len(df), 4):
+        counts.add(df.iloc[start : start + 4])
+
+    streamed = pd.concat([counts.apply(df.iloc[start : start + 4], 3, 2) for start in range(0, len(df), 4)])
+    expected = df.copy()
+    apply_privacy_filter(expected, ["party"], min_cell=3)
+    suppress_joint_cells(expected, ["party", "region"], min_cell=2)
+
+    assert streamed.astype(object).where(streamed.notna(), None).values.tolist() == (
+        expected.astype(object).where(expected.notna(), None).values.tolist()
+    )
@@ -0,0 +1,104 @@
+import asyncio
+
+from src.post import load_prerender
+from src.publisher import PublishSummary, TokenBucket, run_publish
+from src.state import load_state
+from tests.test_post import make_dataset
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_spaces_requests_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=2, clock=clock, sleep=clock.sleep)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    asyncio.run(take(4))
+
+    assert clock.now == 1.0
+    assert clock.slept == [0.5, 0.5]
+
+
+def test_token_bucket_waits_for_exhausted_window():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10.0, capacity=5, clock=clock, wall_clock=lambda: 1000.0, sleep=clock.sleep)
+
+    bucket.observe({"ratelimit-remaining": "0", "ratelimit-reset": "1030"})
+    asyncio.run(bucket.acquire())
+
+    assert clock.now >= 30.0
+
+
+def test_summary_reports_latency_quantiles():
+    summary = PublishSummary(requested=4, posted=4, elapsed=2.0, latencies=[0.1, 0.2, 0.3, 0.4])
+
+    assert summary.throughput == 2.0
+    assert summary.latency(0.5) == 0.3
+    assert "posted=4/4" in summary.format()
+    assert "latency_max=400ms" in summary.format()
+
+
+def test_publish_retries_rate_limits_and_server_errors(tmp_path, fake_pds):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    make_dataset(dataset)
+    fake_pds.latency = 0.02
+    fake_pds.inject = [429, 503]
+    expected = [text for _, _, text, _ in load_prerender(dataset, 1337).records()][:4]
+
+    summary = run_publish(
+        dataset,
+        state_path,
+        count=4,
+        handle="bot.test",
+        app_password="pw",
+        base_url=fake_pds.url,
+        concurrency=2,
+        rate=100.0,
+        burst=4,
+        backoff_base=0.01,
+    )
+
+    assert summary.posted == 4 and summary.failed == 0
+    assert summary.rate_limited == 1 and summary.retries == 2
+    assert len(summary.latencies) == 4
+    assert sorted(fake_pds.posts) == sorted(expected)
+    state = load_state(state_path)
+    assert state["cursor"] == 4 and len(state["used"]) == 4
+
+
+def test_publish_stops_on_non_retryable_error(tmp_path, fake_pds):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    make_dataset(dataset)
+    fake_pds.inject = [400]
+
+    summary = run_publish(
+        dataset,
+        state_path,
+        count=3,
+        handle="bot.test",
+        app_password="pw",
+        base_url=fake_pds.url,
+        concurrency=1,
+        backoff_base=0.01,
+    )
+
+    assert summary.posted == 0 and summary.failed == 1
+    assert fake_pds.posts == []
+    state = load_state(state_path)
+    assert state["cursor"] == 0 and len(state["used"]) == 0
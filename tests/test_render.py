@@ -0,0 +1,53 @@
+import pandas as pd
+
+from src import render
+from src.dataset import write_dataset
+from src.render import audit, render_all, render_frame, render_rows
+from src.templates import MAX_POST_CHARS, context_from_row, render_profile
+from tests.test_post import make_dataset
+
+
+def test_render_all_matches_render_profile(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    df = make_dataset(dataset)
+    output = tmp_path / "rendered.parquet"
+
+    rendered = render_all(dataset, output, processes=1)
+
+    assert output.exists()
+    assert rendered["respondent_id"].tolist() == df["respondent_id"].tolist()
+    expected = [render_profile(context_from_row(row)) for row in df.to_dict("records")]
+    assert rendered["text"].tolist() == expected
+    assert (rendered["length"] == rendered["text"].str.len()).all()
+    assert pd.read_parquet(output)["text"].tolist() == expected
+
+
+def test_pool_matches_serial_and_audit_counts(tmp_path, monkeypatch):
+    df = make_dataset(tmp_path / "nzes.parquet")
+    df.loc[0, "housing"] = "x" * 200
+    df = pd.concat([df] * 5, ignore_index=True)
+    monkeypatch.setattr(render, "POOL_MIN_ROWS", 1)
+    monkeypatch.setattr(render, "CHUNK_ROWS", 7)
+
+    serial = render_frame(df, processes=1)
+    pooled = render_frame(df, processes=2)
+
+    pd.testing.assert_frame_equal(serial, pooled)
+    report = audit(pooled)
+    assert report["rows"] == 40
+    assert report["over_limit"] == 0 and report["max_length"] <= MAX_POST_CHARS
+    assert report["truncated_rows"] == 5
+    assert report["dropped"]["housing"] == 5
+    assert report["bare"] == 0
+
+
+def test_render_rows_streams_only_the_requested_rows(tmp_path):
+    df = make_dataset(tmp_path / "nzes.parquet")
+    df = pd.concat([df] * 3, ignore_index=True).assign(respondent_id=[str(i) for i in range(1, 25)])
+    dataset = tmp_path / "streamed.parquet"
+    write_dataset(df, dataset, row_group_size=4)
+    expected = render_frame(df, processes=1)["text"].tolist()
+
+    texts = render_rows(dataset, [20, 0, 5, 13, 6], batch_rows=3)
+
+    assert texts == {row: expected[row] for row in (0, 5, 6, 13, 20)}
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.sampling import alias_table, parse_sampling, sampling_weights, weighted_order
+
+
+def implied_probabilities(prob, alias):
+    total = prob.copy()
+    np.add.at(total, alias, 1.0 - prob)
+    return total / len(prob)
+
+
+@pytest.mark.parametrize(
+    "weights",
+    [
+        np.array([1.0, 2.0, 3.0, 4.0]),
+        np.array([1.0] * 50 + [500.0]),
+        np.random.default_rng(0).lognormal(0.0, 2.0, 1000),
+    ],
+)
+def test_alias_table_reproduces_weights(weights):
+    prob, alias = alias_table(weights)
+
+    assert ((prob >= 0) & (prob <= 1)).all()
+    np.testing.assert_allclose(implied_probabilities(prob, alias), weights / weights.sum(), atol=1e-12)
+
+
+def test_weighted_order_is_a_seeded_permutation():
+    weights = np.array([0.0, 1.0, 2.0, 3.0, np.nan, 4.0])
+
+    order = weighted_order(weights, seed=5)
+
+    assert sorted(order.tolist()) == list(range(6))
+    assert set(order[-2:].tolist()) == {0, 4}
+    assert (weighted_order(weights, seed=5) == order).all()
+    firsts = np.bincount([weighted_order(weights, seed)[0] for seed in range(4000)], minlength=6) / 4000
+    np.testing.assert_allclose(firsts, [0, 0.1, 0.2, 0.3, 0, 0.4], atol=0.03)
+
+
+def test_strata_weights_balance_groups():
+    df = pd.DataFrame({"party_vote": ["A"] * 6 + ["B"] * 3 + [None]})
+
+    weights = sampling_weights(df, parse_sampling("strata:party_vote"))
+
+    totals = pd.Series(weights).groupby(df["party_vote"].fillna("missing")).sum()
+    assert totals.round(9).tolist() == [1.0, 1.0, 1.0]
+    assert sampling_weights(df, "uniform") is None
+    with pytest.raises(ValueError):
+        parse_sampling("strata:respondent_id")
+
+
+def test_weighted_sampling_refuses_missing_weights():
+    df = pd.DataFrame({"weight": [np.nan, 0.0, np.nan]})
+
+    with pytest.raises(ValueError, match="mweight"):
+        sampling_weights(df, "weight")
+    assert sampling_weights(df.assign(weight=[np.nan, 0.0, 2.0]), "weight").tolist() == [0.0, 0.0, 2.0]
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from src.selection import build_queue, eligible_queue, row_field_count
+
+
+def make_frame():
+    return pd.DataFrame(
+        {
+            "respondent_id": [str(i) for i in range(1, 11)],
+            "age_bucket": ["18-24", None, "25-34", "35-44", None, "45-54", "55-64", None, "65+", "18-24"],
+            "gender": ["Male", None, "Female", "", None, "Male", "Female", "Male", "Male", "Female"],
+            "party_vote": ["Labour", "Green", None, "ACT", None, "National", "Labour", "Green", None, "ACT"],
+            "ideology": ["left", None, "center", "right", None, None, "left", "right", "center", "left"],
+        }
+    )
+
+
+def reference_selection(df, state):
+    # The previous row-by-row implementation, kept as an oracle.
+    indexed = df.set_index("respondent_id", drop=False)
+    while state["queue_index"] < len(state["queue"]):
+        respondent_id = state["queue"][state["queue_index"]]
+        state["queue_index"] += 1
+        if respondent_id not in indexed.index:
+            continue
+        row = indexed.loc[respondent_id]
+        if row_field_count(row) < 3:
+            continue
+        return row.to_dict()
+    return None
+
+
+def test_eligible_queue_matches_row_by_row_walk():
+    df = make_frame()
+    state = {"queue": build_queue(df["respondent_id"], 5) + ["missing"], "queue_index": 0}
+    reference = []
+    while (row := reference_selection(df, state)) is not None:
+        reference.append(row["respondent_id"])
+
+    assert eligible_queue(df, 5) == reference
+    assert set(reference) == {"1", "3", "4", "6", "7", "8", "9", "10"}
@@ -0,0 +1,98 @@
+import os
+import signal
+import threading
+from datetime import datetime, time, timedelta, timezone
+
+from src.schedule import Schedule, parse_slots
+from src.serve import Daemon, serve
+from src.state import journal_path, load_state
+from tests.test_post import make_dataset
+
+NOON = datetime(2026, 3, 2, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeClient:
+    def __init__(self):
+        self.posted = []
+        self.logins = 0
+
+    def login(self):
+        self.logins += 1
+
+    def post(self, text):
+        self.posted.append(text)
+        return f"at://fake/{len(self.posted)}"
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+        self.waits = []
+
+    def __call__(self):
+        return self.now
+
+    def wait(self, seconds):
+        self.waits.append(seconds)
+        self.now += timedelta(seconds=seconds)
+        return len(self.waits) >= 2
+
+
+def test_schedule_slots_and_catch_up_policies():
+    schedule = Schedule(parse_slots("12:00, 00:00"))
+    assert schedule.slots == (time(0, 0), time(12, 0))
+    assert schedule.next_slot(NOON) == NOON + timedelta(hours=12)
+
+    due = schedule.due(NOON - timedelta(days=2), NOON + timedelta(minutes=30))
+    assert len(due) == 4 and due[-1] == NOON
+    assert schedule.owed(due, NOON + timedelta(seconds=30)) == 1
+    assert Schedule(schedule.slots, catch_up="skip").owed(due, NOON + timedelta(minutes=30)) == 0
+    assert Schedule(schedule.slots, catch_up="all").owed(due, NOON) == 4
+    assert Schedule(schedule.slots, jitter=60).delay(NOON, NOON - timedelta(minutes=5)) >= 300
+
+
+def test_daemon_catches_up_once_then_waits_for_the_next_slot(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    make_dataset(dataset)
+    stale = (NOON - timedelta(days=1, hours=11)).isoformat()
+    state_path.write_text(f'{{"version": 2, "last_post": {{"timestamp": "{stale}"}}}}', encoding="utf-8")
+    clock = FakeClock(NOON + timedelta(hours=1))
+    client = FakeClient()
+    daemon = Daemon(dataset, state_path, Schedule(parse_slots("00:00,12:00")), client, clock=clock)
+
+    daemon.run(threading.Event(), wait=clock.wait)
+
+    # Three slots were missed; "latest" posts once for them, then once at midnight.
+    assert len(client.posted) == 2 and client.logins == 1
+    assert clock.waits[0] == 11 * 3600
+    assert len(load_state(state_path)["used"]) == 2
+
+
+def test_daemon_reloads_a_rebuilt_dataset(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    df = make_dataset(dataset)
+    daemon = Daemon(dataset, state_path, Schedule(parse_slots("00:00")), FakeClient())
+
+    assert daemon.reload_if_changed()
+    assert not daemon.reload_if_changed()
+    df.assign(gender="Female").to_parquet(dataset, index=False)
+    assert daemon.reload_if_changed()
+    assert daemon.prerender.is_current(daemon.state["rng_seed"], dataset)
+
+
+def test_sigterm_stops_the_daemon_and_flushes_state(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    state_path = tmp_path / "state.json"
+    make_dataset(dataset)
+    daemon = Daemon(dataset, state_path, Schedule(parse_slots("00:00")), FakeClient())
+    daemon.post()
+    assert journal_path(state_path).exists()
+
+    timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    serve(daemon)
+
+    assert not journal_path(state_path).exists()
+    assert len(load_state(state_path)["used"]) == 1
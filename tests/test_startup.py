@@ -0,0 +1,58 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from src import post
+from tests.test_post import make_dataset
+
+ROOT = Path(__file__).resolve().parents[1]
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "pyreadstat", "atproto", "atproto_client")
+# Cumulative -X importtime cost of the CLI and posting modules, in microseconds.
+# Currently ~50ms; pandas alone would add several hundred.
+IMPORT_BUDGET_US = 250_000
+
+
+def run_python(code, *args):
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_times(stderr):
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_stays_within_budget():
+    result = run_python("import src.cli, src.post", "-X", "importtime")
+    times = import_times(result.stderr)
+
+    assert not [name for name in times if name.split(".")[0] in HEAVY_MODULES]
+    assert times["src.cli"] + times["src.post"] <= IMPORT_BUDGET_US
+
+
+def test_dry_run_from_prerendered_file_needs_no_pandas(tmp_path):
+    dataset = tmp_path / "nzes.parquet"
+    make_dataset(dataset)
+    expected = post.load_prerender(dataset, seed=1337).record(0)[2]
+
+    code = (
+        "import sys\n"
+        "from src.cli import main\n"
+        f"sys.argv = ['cli', 'dry-run', '--dataset', {str(dataset)!r}, '--state', {str(tmp_path / 'state.json')!r}]\n"
+        "main()\n"
+        f"print(sorted(m for m in sys.modules if m.split('.')[0] in {HEAVY_MODULES!r}))\n"
+    )
+    lines = run_python(code).stdout.splitlines()
+
+    assert lines == [expected, "[]"]
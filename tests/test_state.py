@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from src.state import UsedBitmap, bind_dataset, journal_path, load_state, record_post, save_state
+
+
+def test_used_bitmap_round_trips():
+    used = UsedBitmap()
+    for position in (0, 9, 4000):
+        used.add(position)
+
+    decoded = UsedBitmap.decode(used.encode())
+
+    assert 9 in decoded and 4000 in decoded and 10 not in decoded
+    assert len(decoded) == 3
+
+
+def test_state_file_size_stays_constant(tmp_path):
+    path = tmp_path / "state.json"
+    state = load_state(path)
+    bind_dataset(state, "ids", lambda ids: {})
+    for position in range(0, 4000, 2):
+        state["used"].add(position)
+    sizes = set()
+    for cursor in range(5):
+        state["cursor"] = cursor
+        save_state(path, state)
+        sizes.add(path.stat().st_size)
+
+    assert len(sizes) == 1
+    assert "used_ids" not in json.loads(path.read_text(encoding="utf-8"))
+
+
+def test_legacy_used_ids_bind_to_row_positions(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"used_ids": ["7", "9"], "queue": ["9", "7"], "post_cursor": 3}), encoding="utf-8")
+
+    state = load_state(path)
+    bind_dataset(state, "ids", lambda ids: {"7": 0, "9": 5})
+
+    assert state["cursor"] == 3
+    assert 0 in state["used"] and 5 in state["used"]
+    assert "pending_used_ids" not in state
+
+
+def test_bind_dataset_refuses_different_respondent_order(tmp_path):
+    state = load_state(tmp_path / "state.json")
+    bind_dataset(state, "old", lambda ids: {})
+    state["used"].add(1)
+
+    with pytest.raises(RuntimeError):
+        bind_dataset(state, "new", lambda ids: {})
+
+    # The same rows under the new id format keep their state.
+    bind_dataset(state, "new", lambda ids: {}, legacy_fingerprint="old")
+    assert state["dataset"] == "new" and 1 in state["used"]
+
+
+def test_journal_replays_posts_onto_snapshot(tmp_path):
+    path = tmp_path / "state.json"
+    state = load_state(path)
+    state["cursor"] = 1
+    record_post(path, state, "12", 4, "at://one", "first")
+    state["cursor"] = 3
+    record_post(path, state, "15", 9, "at://two", "second")
+
+    replayed = load_state(path)
+
+    assert 4 in replayed["used"] and 9 in replayed["used"]
+    assert replayed["cursor"] == 3
+    assert replayed["seq"] == 2
+    assert replayed["last_post"]["uri"] == "at://two"
+    assert journal_path(path).read_bytes().count(b"\n") == 2
+
+
+def test_journal_ignores_truncated_last_record(tmp_path):
+    path = tmp_path / "state.json"
+    state = load_state(path)
+    record_post(path, state, "12", 4, "at://one", "first")
+    record_post(path, state, "15", 9, "at://two", "second")
+    log = journal_path(path)
+    log.write_bytes(log.read_bytes()[:-10])
+
+    replayed = load_state(path)
+
+    assert 4 in replayed["used"] and 9 not in replayed["used"]
+    assert replayed["seq"] == 1
+
+
+def test_journal_compacts_into_snapshot(tmp_path):
+    path = tmp_path / "state.json"
+    state = load_state(path)
+    for row in range(3):
+        record_post(path, state, str(row), row, f"at://{row}", "text", compact_bytes=400)
+
+    assert not journal_path(path).exists() or journal_path(path).stat().st_size < 400
+    snapshot = json.loads(path.read_text(encoding="utf-8"))
+    assert snapshot["seq"] >= 2
+    assert len(load_state(path)["used"]) == 3
@@ -0,0 +1,30 @@
+from src.features import FeatureConfig, build_features
+from src.ingest import ingest
+from src.synthetic import BASE_ROWS, NZES_VARIABLES, generate, write_synthetic
+
+
+def test_generate_scales_and_is_reproducible():
+    df, value_labels, variable_labels = generate(scale=0.5, seed=3, extra_columns=2)
+    again, _, _ = generate(scale=0.5, seed=3, extra_columns=2)
+
+    assert len(df) == BASE_ROWS // 2
+    assert df.equals(again)
+    assert set(NZES_VARIABLES) <= set(df.columns)
+    assert {"Q001", "Q002"} <= set(df.columns)
+    assert set(variable_labels) == set(df.columns)
+    assert value_labels["mvpartyvote"][98] == "DK"
+    assert df["H1"].isna().any()
+
+
+def test_synthetic_release_runs_through_pipeline(tmp_path):
+    dta_path, parquet_path = write_synthetic(tmp_path, scale=0.25, extra_columns=3)
+
+    df, labels = ingest(dta_path, tmp_path / "labels.bin")
+    features = build_features(df, labels, FeatureConfig(min_cell=10))
+
+    assert parquet_path.exists()
+    assert "Q001" not in df.columns
+    assert len(features) == 1000
+    assert features["party_vote"].notna().mean() > 0.8
+    assert not features["party_vote"].isin(["DK", "Missing"]).any()
+    assert set(features["urban_rural"].dropna()) == {"urban", "rural/remote"}
@@ -1,4 +1,11 @@
-from src.templates import TemplateContext, render_profile, MAX_POST_CHARS
+from src.templates import (
+    MAX_POST_CHARS,
+    TemplateContext,
+    clear_sentence_cache,
+    render_profile,
+    render_profile_details,
+    sentence_cache_info,
+)
 
 
 def test_render_profile_length_and_prefix():
@@ -17,3 +24,62 @@ def test_render_profile_length_and_prefix():
     assert text.startswith("NZES 2023 profile")
     assert len(text) <= MAX_POST_CHARS
     assert "#NZES2023" in text
+
+
+def test_render_profile_names_the_wave():
+    ctx = TemplateContext(
+        respondent_id="2020-1",
+        age_bucket=None,
+        gender="Male",
+        ethnicity=None,
+        education=None,
+        housing=None,
+        urban_rural=None,
+        party_vote="Labour",
+        ideology=None,
+        wave=2020,
+    )
+    assert render_profile(ctx) == (
+        "NZES 2020 profile. This respondent is identifies as male. They voted for Labour in 2020. #NZES2020"
+    )
+
+
+def test_truncation_reports_dropped_fields():
+    ctx = TemplateContext(
+        respondent_id="1",
+        age_bucket="25-34",
+        gender="Female",
+        ethnicity="Māori",
+        education="University",
+        housing="x" * 150,
+        urban_rural="urban",
+        party_vote="Green",
+        ideology="left",
+    )
+
+    rendered = render_profile_details(ctx)
+
+    assert rendered.text == render_profile(ctx)
+    assert len(rendered.text) <= MAX_POST_CHARS
+    assert rendered.truncated == 3
+    assert rendered.dropped_fields == ("education", "housing", "urban_rural", "party_vote", "ideology")
+
+
+def test_sentence_cache_hits_for_shared_fields():
+    clear_sentence_cache()
+    base = dict(
+        age_bucket="25-34",
+        gender="Female",
+        ethnicity="Māori",
+        education="University",
+        housing=None,
+        urban_rural="urban",
+        party_vote="Green",
+        ideology="left",
+    )
+    first = render_profile(TemplateContext(respondent_id="1", **base))
+    second = render_profile(TemplateContext(respondent_id="2", **dict(base, housing=float("nan"))))
+
+    info = sentence_cache_info()
+    assert first == second
+    assert all(group.misses == 1 and group.hits == 1 for group in info.values())